@@ -0,0 +1,269 @@
+# account_state.py
+# 本地账户状态缓存：由 OKX 私有 WebSocket 的 positions / account / orders 频道推送维护，
+# 过期或断线时自动回退到 REST。接口与 Account.AccountAPI 保持一致，可直接替换 accountAPI 传入。
+
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import websocket
+
+OKX_PRIVATE_WS_URL = "wss://ws.okx.com:8443/ws/v5/private"
+OKX_PRIVATE_WS_URL_DEMO = "wss://wspap.okx.com:8443/ws/v5/private"
+
+
+def okx_ws_login_args(api_key: str, secret_key: str, passphrase: str) -> Dict:
+    """生成私有频道登录参数：sign = Base64(HMAC_SHA256(secret, timestamp + 'GET' + '/users/self/verify'))。"""
+    timestamp = str(int(time.time()))
+    mac = hmac.new(secret_key.encode(), f"{timestamp}GET/users/self/verify".encode(), hashlib.sha256)
+    return {"apiKey": api_key, "passphrase": passphrase, "timestamp": timestamp,
+            "sign": base64.b64encode(mac.digest()).decode()}
+
+
+class AccountStateCache:
+    """
+    由私有 WebSocket 推送维护的账户状态。
+
+    get_positions() / get_account_balance() 返回与 REST 相同结构的字典；
+    当连接未登录或对应频道超过 max_age 秒没有推送时，透明地回退到 REST 并用结果刷新缓存。
+    其余方法（set_leverage、set_position_mode 等）原样转发给底层 account_api。
+    """
+
+    def __init__(self, account_api, api_key: str, secret_key: str, passphrase: str, flag: str = "1",
+                 ws_url: Optional[str] = None, max_age: float = 30, ping_interval: float = 20,
+                 reconnect_delay: float = 1, max_reconnect_delay: float = 30):
+        self.account_api = account_api
+        self._credentials = (api_key, secret_key, passphrase)
+        self.ws_url = ws_url or (OKX_PRIVATE_WS_URL_DEMO if flag == "1" else OKX_PRIVATE_WS_URL)
+        self.max_age = max_age
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._lock = threading.Lock()
+        self._positions: Dict[str, Dict] = {}
+        self._balance: Optional[Dict] = None
+        self._orders: Dict[str, Dict] = {}
+        # 各频道最近一次收到数据的时间（monotonic）；断线与重新登录时清零，新连接推送快照之前一律走 REST
+        self._updated_at = {"positions": 0.0, "account": 0.0}
+        self._order_listeners: List[Callable[[Dict], None]] = []
+        self._state_listeners: List[Callable[[str, List[Dict]], None]] = []
+        self._logged_in = False
+        # 登录后的第一条 positions 推送是全量快照，用它替换 REST 回退期间写入的数据
+        self._awaiting_snapshot = True
+        self._stop_event = threading.Event()
+        self._ws = None
+        self._thread: Optional[threading.Thread] = None
+        self.rest_fallbacks = 0
+
+    # ---------- 对外接口（与 AccountAPI 同名） ----------
+    def get_positions(self, *args, **kwargs) -> Dict:
+        if self.is_fresh("positions"):
+            with self._lock:
+                return {"code": "0", "msg": "", "data": [dict(p) for p in self._positions.values()]}
+        res = self._rest("get_positions", *args, **kwargs)
+        if res.get('code') == '0' and not args and not kwargs:
+            with self._lock:
+                self._positions = {_position_key(p): p for p in res.get('data', []) if _is_open(p)}
+                positions = list(self._positions.values())
+            self._notify_state("positions", positions)
+        return res
+
+    def get_account_balance(self, *args, **kwargs) -> Dict:
+        if self.is_fresh("account") and self._balance is not None:
+            with self._lock:
+                return {"code": "0", "msg": "", "data": [dict(self._balance)]}
+        res = self._rest("get_account_balance", *args, **kwargs)
+        if res.get('code') == '0' and res.get('data') and not args and not kwargs:
+            with self._lock:
+                self._balance = res['data'][0]
+            self._notify_state("account", res['data'][:1])
+        return res
+
+    def __getattr__(self, name):
+        # 只有本类未定义的属性才会走到这里
+        return getattr(self.account_api, name)
+
+    def is_fresh(self, channel: str) -> bool:
+        updated_at = self._updated_at[channel]
+        return self._logged_in and updated_at > 0 and time.monotonic() - updated_at <= self.max_age
+
+    def get_order(self, ord_id: str) -> Optional[Dict]:
+        """最近通过 orders 频道收到的订单状态。"""
+        with self._lock:
+            return self._orders.get(ord_id)
+
+    def add_order_listener(self, callback: Callable[[Dict], None]):
+        """订单状态推送回调（在 WebSocket 线程中调用，应尽快返回）。"""
+        self._order_listeners.append(callback)
+
+    def add_state_listener(self, callback: Callable[[str, List[Dict]], None]):
+        """
+        持仓 / 余额更新回调 callback(channel, data)：channel 为 "positions" 时 data 是当前全部持仓，
+        为 "account" 时是余额记录。推送与 REST 回退的结果都会触发（在对应线程中调用，应尽快返回）。
+        """
+        self._state_listeners.append(callback)
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="okx-account-ws", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # ---------- 内部实现 ----------
+    def _rest(self, method: str, *args, **kwargs) -> Dict:
+        self.rest_fallbacks += 1
+        return getattr(self.account_api, method)(*args, **kwargs)
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stop_event.is_set():
+            self._ws = websocket.WebSocketApp(
+                self.ws_url, on_open=self._on_open, on_message=self._on_message,
+                on_error=self._on_error, on_close=self._on_close,
+            )
+            started = time.monotonic()
+            self._ws.run_forever()
+            self._mark_disconnected()
+            if self._stop_event.is_set():
+                break
+            if time.monotonic() - started > self.max_reconnect_delay:
+                delay = self.reconnect_delay
+            print(f"  - ⚠️ OKX 私有 WebSocket 已断开，期间使用 REST，{delay:g} 秒后重连...")
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _on_open(self, ws):
+        ws.send(json.dumps({"op": "login", "args": [okx_ws_login_args(*self._credentials)]}))
+        threading.Thread(target=self._ping_loop, args=(ws,), daemon=True).start()
+
+    def _ping_loop(self, ws):
+        # OKX 30 秒内无消息会断开连接，定期发送文本 ping
+        while not self._stop_event.wait(self.ping_interval):
+            if ws is not self._ws:
+                break
+            try:
+                ws.send("ping")
+            except Exception:
+                break
+
+    def _on_error(self, _ws, error):
+        print(f"  - ❌ OKX 私有 WebSocket 错误: {error}")
+
+    def _on_close(self, _ws, *_args):
+        self._mark_disconnected()
+
+    def _mark_disconnected(self):
+        """断线期间推送的数据已缺失，旧连接的更新时间不能再作为"新鲜"的依据。"""
+        with self._lock:
+            self._logged_in = False
+            self._updated_at = {channel: 0.0 for channel in self._updated_at}
+
+    def _on_message(self, ws, message):
+        if message == "pong":
+            return
+        try:
+            msg = json.loads(message)
+        except ValueError:
+            return
+
+        event = msg.get("event")
+        if event == "login":
+            if msg.get("code") == "0":
+                ws.send(json.dumps({"op": "subscribe", "args": [
+                    {"channel": "positions", "instType": "ANY"},
+                    {"channel": "account"},
+                    {"channel": "orders", "instType": "ANY"},
+                ]}))
+                with self._lock:
+                    # 订阅后的第一条推送才是新连接的数据，在那之前仍回退 REST
+                    self._updated_at = {channel: 0.0 for channel in self._updated_at}
+                    self._awaiting_snapshot = True
+                    self._logged_in = True
+            else:
+                print(f"  - ❌ OKX 私有 WebSocket 登录失败: {msg.get('code')} {msg.get('msg')}")
+                ws.close()
+            return
+        if event == "error":
+            print(f"  - ❌ OKX 私有 WebSocket 返回错误: {msg.get('code')} {msg.get('msg')}")
+            return
+        if event:
+            return
+
+        channel = (msg.get("arg") or {}).get("channel")
+        data = msg.get("data") or []
+        if channel == "positions":
+            self._on_positions(data, msg.get("eventType"))
+        elif channel == "account":
+            with self._lock:
+                if data:
+                    self._balance = data[0]
+                self._updated_at["account"] = time.monotonic()
+            if data:
+                self._notify_state("account", data[:1])
+        elif channel == "orders":
+            self._on_orders(data)
+
+    def _on_positions(self, data: List[Dict], event_type: Optional[str]):
+        with self._lock:
+            # 快照推送包含全部持仓，直接替换；事件推送只包含变化的持仓
+            if event_type == "snapshot" or self._awaiting_snapshot:
+                self._positions = {}
+                self._awaiting_snapshot = False
+            for p in data:
+                key = _position_key(p)
+                if _is_open(p):
+                    self._positions[key] = p
+                else:
+                    self._positions.pop(key, None)
+            self._updated_at["positions"] = time.monotonic()
+            positions = list(self._positions.values())
+        self._notify_state("positions", positions)
+
+    def _on_orders(self, data: List[Dict]):
+        with self._lock:
+            for o in data:
+                if o.get("ordId"):
+                    self._orders[o["ordId"]] = o
+            if len(self._orders) > 5000:
+                # 只保留最近的一半
+                for ord_id in list(self._orders)[:2500]:
+                    del self._orders[ord_id]
+        for o in data:
+            for callback in self._order_listeners:
+                try:
+                    callback(o)
+                except Exception as e:
+                    print(f"  - ❌ 订单推送回调异常: {e}")
+
+
+    def _notify_state(self, channel: str, data: List[Dict]):
+        for callback in self._state_listeners:
+            try:
+                callback(channel, data)
+            except Exception as e:
+                print(f"  - ❌ 账户状态回调异常: {e}")
+
+
+def _position_key(p: Dict) -> str:
+    return f"{p.get('instId')}:{p.get('posSide', 'net')}"
+
+
+def _is_open(p: Dict) -> bool:
+    try:
+        return bool(p.get('pos')) and float(p['pos']) != 0
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,447 @@
+# algos.py
+# 大额调仓的拆单执行：把一笔张数差（母单）拆成多笔子订单，在后台线程中按计划执行，不阻塞主循环检测目标变化。
+#
+# - twap:  在 duration 秒内均匀拆成 slices 笔市价单，某一笔不足 minSz 时累计到下一笔
+# - pov:   每 interval 秒读取一次 OKX 盘口，子单 = 距中间价 band_bps 以内的对手盘深度 × participation，
+#          以 band 边界价发 IOC 限价单；超过 timeout 仍未完成时剩余部分市价成交
+# - chase: 在买一 / 卖一挂 post_only 限价单，盘口移动时改价追单；超时或盘口偏离到达价 max_chase_bps 时撤单并市价成交剩余部分
+#
+# 每个母单记录下单时的盘口中间价（arrival mid），结束时按成交均价计算滑点（bp，正数表示比到达价差），
+# 逐笔写入 execution_log.csv。目标再次变化或全量同步时，调用方先 cancel() 正在执行的母单
+# （撤掉挂单并计入已成交部分），再按最新的张数差重新下母单。
+
+import csv
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from execution import OrderIntent
+from fastcore import format_size
+
+ALGOS = ("twap", "pov", "chase")
+
+DEFAULT_PARAMS: Dict[str, Dict[str, float]] = {
+    "twap": {"slices": 10, "duration": 120},
+    "pov": {"participation": 0.2, "band_bps": 10, "depth_levels": 20, "interval": 2, "timeout": 300},
+    "chase": {"chase_interval": 1, "timeout": 60, "max_chase_bps": 20},
+}
+
+# 子订单成交状态的查询：最多等待的秒数与轮询间隔。超时仍未终结的子订单记为未决，
+# 之后每一笔子单前重新查询，其未成交部分不会被重复下单；母单结束时撤销仍未终结的子订单并计入最终成交
+FILL_TIMEOUT = 5
+FILL_POLL_INTERVAL = 0.2
+FINAL_STATES = {"filled", "canceled", "mmp_canceled"}
+
+LOG_HEADER = ["Timestamp", "ParentId", "InstId", "Side", "Algo", "Size", "Filled", "AvgPx", "ArrivalMid",
+              "SlippageBps", "Children", "Seconds", "State", "Msg"]
+
+Level = Tuple[Decimal, Decimal]
+
+
+class ParentOrder:
+    """一笔母单的执行状态。sz / filled 为张数，slippage_bps 为正表示成交均价差于到达中间价。"""
+
+    def __init__(self, parent_id: str, intent: OrderIntent, algo: str, params: Dict[str, float],
+                 arrival_mid: Decimal):
+        self.parent_id = parent_id
+        self.inst_id = intent.inst_id
+        self.side = intent.side
+        self.sz = Decimal(intent.sz)
+        self.leverage = intent.leverage
+        self.algo = algo
+        self.params = params
+        self.arrival_mid = arrival_mid
+        self.filled = Decimal('0')
+        self.children = 0
+        self.state = "running"
+        self.msg = ""
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        # 每笔子订单已计入的 (成交张数, 成交金额)，查询结果是累计值，按差额计入母单
+        self._accounted: Dict[str, Tuple[Decimal, Decimal]] = {}
+        self._fill_value = Decimal('0')
+        # 等待超时、尚未终结的子订单 {ordId: 子单张数}
+        self._outstanding: Dict[str, Decimal] = {}
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def remaining(self) -> Decimal:
+        return self.sz - self.filled
+
+    @property
+    def pending(self) -> Decimal:
+        """未决子订单中尚未成交、之后仍可能成交的张数。"""
+        return sum((sz - self._accounted.get(ord_id, (Decimal('0'), Decimal('0')))[0]
+                    for ord_id, sz in self._outstanding.items()), Decimal('0'))
+
+    @property
+    def avg_px(self) -> Optional[Decimal]:
+        return self._fill_value / self.filled if self.filled > 0 else None
+
+    @property
+    def slippage_bps(self) -> Optional[float]:
+        avg = self.avg_px
+        if avg is None or not self.arrival_mid:
+            return None
+        sign = 1 if self.side == "buy" else -1
+        return float(sign * (avg - self.arrival_mid) / self.arrival_mid * 10000)
+
+    def is_active(self) -> bool:
+        return not self._done.is_set()
+
+    def __repr__(self):
+        return (f"ParentOrder({self.parent_id} {self.side.upper()} {self.sz} {self.inst_id} {self.algo}, "
+                f"filled={self.filled}, state={self.state})")
+
+
+class ExecutionScheduler:
+    """
+    母单调度器。每个合约同时最多一个母单，各合约的母单在线程池中并发执行。
+
+    子订单通过 BatchExecutor 提交（沿用其杠杆缓存），成交张数按子订单的累计成交增量通知 fill 监听器，
+    调用方据此更新本地持仓视图。order_source 为 AccountStateCache.get_order 时优先使用推送的订单状态，
+    否则回退到 REST get_order。
+    """
+
+    def __init__(self, executor, trade_api, market_api, registry, order_source: Optional[Callable] = None,
+                 algo: Optional[str] = "twap", min_notional_usd: Decimal = Decimal('20000'),
+                 params: Optional[Dict[str, Dict[str, float]]] = None, max_workers: int = 16,
+                 log_path: Optional[str] = "execution_log.csv", max_child_usd: Optional[Decimal] = None,
+                 prices=None):
+        if algo is not None and algo not in ALGOS:
+            raise ValueError(f"未知的拆单算法: {algo}")
+        self.executor = executor
+        self.trade_api = trade_api
+        self.market_api = market_api
+        self.registry = registry
+        self.order_source = order_source
+        self.algo = algo
+        self.min_notional_usd = Decimal(min_notional_usd)
+        # 单笔子订单的名义价值上限（按到达中间价估算），母单本身不受风控的单笔上限限制
+        self.max_child_usd = Decimal(max_child_usd) if max_child_usd is not None else None
+        # 可选的 prices.PriceCache，判断是否拆单时优先使用缓存的 OKX 价格
+        self.prices = prices
+        self.params = {name: dict(values) for name, values in DEFAULT_PARAMS.items()}
+        for name, values in (params or {}).items():
+            self.params[name].update(values)
+        self.log_path = log_path
+        self.history: deque = deque(maxlen=1000)
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="algo")
+        self._lock = threading.Lock()
+        self._active: Dict[str, ParentOrder] = {}
+        self._fill_listeners: List[Callable[[str, str, Decimal], None]] = []
+        self._done_listeners: List[Callable[[ParentOrder], None]] = []
+        self._seq = itertools.count(1)
+
+    # ---------- 对外接口 ----------
+    def add_fill_listener(self, callback: Callable[[str, str, Decimal], None]):
+        """子订单成交回调 (instId, side, 张数)，在执行线程中调用。"""
+        self._fill_listeners.append(callback)
+
+    def add_done_listener(self, callback: Callable[[ParentOrder], None]):
+        """母单结束回调（done / cancelled / incomplete / failed），在执行线程中调用。"""
+        self._done_listeners.append(callback)
+
+    def should_slice(self, intent: OrderIntent, mid_hint: Optional[Decimal] = None) -> bool:
+        """
+        名义价值不低于 min_notional_usd 时拆单。mid_hint 为空（例如纯平仓）时使用 PriceCache 中的 OKX 价格，
+        缓存中没有新鲜价格时才读取一次 OKX 盘口。
+        """
+        spec = self.registry.get(intent.inst_id)
+        if self.algo is None or not spec:
+            return False
+        mid = mid_hint or (self.prices.okx_price(intent.inst_id) if self.prices is not None else None)
+        if not mid:
+            mid = self._book(intent.inst_id, 1)[0]
+        return Decimal(intent.sz) * spec.ct_val * mid >= self.min_notional_usd
+
+    def submit(self, intent: OrderIntent, algo: Optional[str] = None,
+               params: Optional[Dict[str, float]] = None) -> ParentOrder:
+        """开始执行一个母单；该合约上已有母单时先撤销。读取盘口失败时抛出异常，调用方可改用市价单。"""
+        algo = algo or self.algo
+        self.cancel([intent.inst_id])
+        params = dict(self.params[algo], **(params or {}))
+        mid, _, _ = self._book(intent.inst_id, 1)
+        parent = ParentOrder(f"{algo}{int(time.time())}{next(self._seq)}", intent, algo, params, mid)
+        with self._lock:
+            self._active[intent.inst_id] = parent
+        self._pool.submit(self._run, parent)
+        return parent
+
+    def cancel(self, inst_ids: Optional[Iterable[str]] = None, timeout: float = 30) -> List[ParentOrder]:
+        """撤销指定合约（默认全部）上正在执行的母单，等待挂单撤销、成交计入后返回这些母单。"""
+        with self._lock:
+            if inst_ids is None:
+                parents = list(self._active.values())
+            else:
+                parents = [self._active[i] for i in inst_ids if i in self._active]
+        for p in parents:
+            p._cancel.set()
+        for p in parents:
+            p._done.wait(timeout)
+        return parents
+
+    def active_inst_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._active)
+
+    def close(self):
+        self.cancel()
+        self._pool.shutdown(wait=False)
+
+    # ---------- 执行 ----------
+    def _run(self, p: ParentOrder):
+        spec = self.registry.get(p.inst_id)
+        try:
+            print(f"  - 🧩 母单 {p.parent_id} 开始执行: {p.side.upper()} {p.sz} {p.inst_id}，"
+                  f"算法 {p.algo}，到达中间价 {p.arrival_mid}")
+            try:
+                getattr(self, f"_run_{p.algo}")(p, spec)
+            finally:
+                self._finish(p)
+            if p.remaining >= spec.min_sz and not p.msg:
+                p.state = "cancelled" if p._cancel.is_set() else "incomplete"
+            else:
+                p.state = "failed" if p.msg else "done"
+        except Exception as e:
+            p.state, p.msg = "failed", str(e)
+        finally:
+            p.finished = time.time()
+            with self._lock:
+                if self._active.get(p.inst_id) is p:
+                    del self._active[p.inst_id]
+            self.history.append(p)
+            self._report(p)
+            p._done.set()
+            for callback in self._done_listeners:
+                try:
+                    callback(p)
+                except Exception as e:
+                    print(f"  - ❌ 母单结束回调异常: {e}")
+
+    def _run_twap(self, p: ParentOrder, spec):
+        n = max(1, int(p.params["slices"]))
+        step = p.params["duration"] / n
+        for k in range(n):
+            # 按累计计划量补足：前面不足 minSz 或未成交的部分自动并入这一笔（未决子订单仍可能成交的部分除外）
+            self._settle(p)
+            due = _floor(p.sz * (k + 1) / n - p.filled - p.pending, spec.lot_sz)
+            if due >= spec.min_sz and not self._market(p, spec, due):
+                return
+            if k < n - 1 and p._cancel.wait(step):
+                return
+
+    def _run_pov(self, p: ParentOrder, spec):
+        deadline = time.monotonic() + p.params["timeout"]
+        band = Decimal(str(p.params["band_bps"])) / 10000
+        participation = Decimal(str(p.params["participation"]))
+        while p.remaining >= spec.min_sz and not p._cancel.is_set():
+            if time.monotonic() >= deadline:
+                self._market(p, spec, _floor(p.remaining - p.pending, spec.lot_sz))
+                return
+            self._settle(p)
+            mid, bids, asks = self._book(p.inst_id, int(p.params["depth_levels"]))
+            if p.side == "buy":
+                limit = _round_px(mid * (1 + band), spec.tick_sz, ROUND_DOWN)
+                depth = sum((sz for px, sz in asks if px <= limit), Decimal('0'))
+            else:
+                limit = _round_px(mid * (1 - band), spec.tick_sz, ROUND_UP)
+                depth = sum((sz for px, sz in bids if px >= limit), Decimal('0'))
+            child = self._cap(p, spec, _floor(min(p.remaining - p.pending, depth * participation), spec.lot_sz))
+            if child >= spec.min_sz:
+                ord_id = self._place(p, spec, "ioc", child, f"{limit:f}")
+                if not ord_id:
+                    return
+                self._wait_final(p, ord_id, child)
+            if p._cancel.wait(p.params["interval"]):
+                return
+
+    def _run_chase(self, p: ParentOrder, spec):
+        deadline = time.monotonic() + p.params["timeout"]
+        max_drift = p.params["max_chase_bps"]
+        sign = 1 if p.side == "buy" else -1
+        ord_id, px, child = "", None, Decimal('0')
+        while not p._cancel.is_set():
+            if ord_id:
+                order = self._query(p, ord_id)
+                if order and order.get("state") in FINAL_STATES:
+                    # 全部成交，或 post_only 会立即成交而被交易所撤销
+                    ord_id = ""
+            if p.remaining < spec.min_sz:
+                return
+            _, bids, asks = self._book(p.inst_id, 1)
+            best = bids[0][0] if p.side == "buy" else asks[0][0]
+            drift_bps = float(sign * (best - p.arrival_mid) / p.arrival_mid * 10000)
+            if time.monotonic() >= deadline or drift_bps > max_drift:
+                break
+            if not ord_id:
+                child = self._cap(p, spec, _floor(p.remaining, spec.lot_sz))
+                ord_id = self._place(p, spec, "post_only", child, f"{best:f}")
+                if not ord_id:
+                    return
+                px = best
+            elif best != px:
+                res = self.trade_api.amend_order(instId=p.inst_id, ordId=ord_id, newPx=f"{best:f}")
+                if res.get("code") == "0":
+                    px = best
+            if p._cancel.wait(p.params["chase_interval"]):
+                break
+        if ord_id:
+            self._cancel_child(p, ord_id, child)
+        self._settle(p)
+        if not p._cancel.is_set() and p.remaining - p.pending >= spec.min_sz:
+            self._market(p, spec, _floor(p.remaining - p.pending, spec.lot_sz))
+
+    # ---------- 子订单 ----------
+    def _market(self, p: ParentOrder, spec, sz: Decimal) -> bool:
+        """市价成交 sz 张，超过子订单上限时拆成几笔依次提交。"""
+        while sz >= spec.min_sz and not p._cancel.is_set():
+            child = self._cap(p, spec, sz)
+            ord_id = self._place(p, spec, "market", child)
+            if not ord_id:
+                return False
+            self._wait_final(p, ord_id, child)
+            sz -= child
+        return True
+
+    def _cap(self, p: ParentOrder, spec, sz: Decimal) -> Decimal:
+        """按 max_child_usd 截断子订单张数（至少保留 minSz 张）。"""
+        if self.max_child_usd is None or not p.arrival_mid:
+            return sz
+        cap = _floor(self.max_child_usd / (spec.ct_val * p.arrival_mid), spec.lot_sz)
+        return min(sz, max(cap, spec.min_sz))
+
+    def _place(self, p: ParentOrder, spec, ord_type: str, sz: Decimal, px: str = "") -> str:
+        p.children += 1
+        intent = OrderIntent(p.inst_id, p.side, format_size(int(sz / spec.lot_sz), spec.lot_sz),
+                             leverage=p.leverage, cl_ord_id=f"{p.parent_id}c{p.children}", ord_type=ord_type, px=px)
+        result = self.executor.execute([intent])[0]
+        if not result.ok:
+            p.msg = f"子订单失败 {result.code} {result.msg}"
+            print(f"  - ❌ 母单 {p.parent_id} 的子订单 {intent} 失败: {result.code} {result.msg}")
+            return ""
+        return result.ord_id
+
+    def _cancel_child(self, p: ParentOrder, ord_id: str, sz: Optional[Decimal] = None):
+        try:
+            self.trade_api.cancel_order(instId=p.inst_id, ordId=ord_id)
+        except Exception as e:
+            print(f"  - ⚠️ 撤销子订单 {ord_id} 异常: {e}")
+        self._wait_final(p, ord_id, sz)
+
+    def _wait_final(self, p: ParentOrder, ord_id: str, sz: Optional[Decimal] = None,
+                    timeout: float = FILL_TIMEOUT) -> Optional[Dict]:
+        """等待子订单终结；超时仍未终结时记为未决（sz 为子单张数，已是未决订单时沿用原值）。"""
+        deadline = time.monotonic() + timeout
+        while True:
+            order = self._query(p, ord_id)
+            if order and order.get("state") in FINAL_STATES:
+                p._outstanding.pop(ord_id, None)
+                return order
+            if time.monotonic() >= deadline:
+                if sz is not None or ord_id in p._outstanding:
+                    p._outstanding[ord_id] = p._outstanding.get(ord_id, sz)
+                    print(f"  - ⚠️ 母单 {p.parent_id} 的子订单 {ord_id} {timeout:g} 秒内未终结，之后继续查询")
+                return order
+            time.sleep(FILL_POLL_INTERVAL)
+
+    def _settle(self, p: ParentOrder):
+        """重新查询未决子订单，计入新增成交，已终结的移出未决集合。"""
+        for ord_id in list(p._outstanding):
+            order = self._query(p, ord_id)
+            if order and order.get("state") in FINAL_STATES:
+                del p._outstanding[ord_id]
+
+    def _finish(self, p: ParentOrder):
+        """母单结束前撤销仍未终结的子订单并计入最终成交；仍无法确认时母单记为失败，由调用方全量同步。"""
+        self._settle(p)
+        for ord_id in list(p._outstanding):
+            self._cancel_child(p, ord_id)
+        if p._outstanding and not p.msg:
+            p.msg = f"子订单 {', '.join(p._outstanding)} 状态未确认"
+
+    def _query(self, p: ParentOrder, ord_id: str) -> Optional[Dict]:
+        """读取子订单状态并把新增成交计入母单。"""
+        order = self.order_source(ord_id) if self.order_source else None
+        if not order or order.get("state") not in FINAL_STATES:
+            try:
+                res = self.trade_api.get_order(instId=p.inst_id, ordId=ord_id)
+            except Exception as e:
+                print(f"  - ⚠️ 查询子订单 {ord_id} 异常: {e}")
+                return order
+            if res.get("code") == "0" and res.get("data"):
+                order = res["data"][0]
+        if order:
+            self._account_fill(p, ord_id, order)
+        return order
+
+    def _account_fill(self, p: ParentOrder, ord_id: str, order: Dict):
+        acc = Decimal(order.get("accFillSz") or "0")
+        prev_sz, prev_value = p._accounted.get(ord_id, (Decimal('0'), Decimal('0')))
+        if acc <= prev_sz:
+            return
+        value = acc * Decimal(order.get("avgPx") or "0")
+        p._accounted[ord_id] = (acc, value)
+        p.filled += acc - prev_sz
+        p._fill_value += value - prev_value
+        for callback in self._fill_listeners:
+            try:
+                callback(p.inst_id, p.side, acc - prev_sz)
+            except Exception as e:
+                print(f"  - ❌ 成交回调异常: {e}")
+
+    def _book(self, inst_id: str, levels: int) -> Tuple[Decimal, List[Level], List[Level]]:
+        """返回 (中间价, 买盘, 卖盘)，档位为 (价格, 张数)。"""
+        res = self.market_api.get_orderbook(instId=inst_id, sz=str(levels))
+        if res.get("code") != "0" or not res.get("data"):
+            raise RuntimeError(f"获取 {inst_id} 盘口失败: {res.get('msg')}")
+        book = res["data"][0]
+        bids = [(Decimal(level[0]), Decimal(level[1])) for level in book.get("bids", [])]
+        asks = [(Decimal(level[0]), Decimal(level[1])) for level in book.get("asks", [])]
+        if not bids or not asks:
+            raise RuntimeError(f"{inst_id} 盘口为空")
+        return (bids[0][0] + asks[0][0]) / 2, bids, asks
+
+    # ---------- 记录 ----------
+    def _report(self, p: ParentOrder):
+        avg = p.avg_px
+        slippage = p.slippage_bps
+        print(f"  - 📊 母单 {p.parent_id} {p.inst_id} {p.side.upper()} ({p.algo}) {p.state}: "
+              f"成交 {p.filled}/{p.sz} 张，均价 {f'{avg:.8g}' if avg is not None else 'N/A'}，"
+              f"到达中间价 {p.arrival_mid}，滑点 {f'{slippage:.2f}bp' if slippage is not None else 'N/A'}")
+        if not self.log_path:
+            return
+        row = [time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(p.started)), p.parent_id, p.inst_id, p.side,
+               p.algo, p.sz, p.filled, f"{avg:.8g}" if avg is not None else "", p.arrival_mid,
+               f"{slippage:.2f}" if slippage is not None else "", p.children, f"{p.finished - p.started:.1f}",
+               p.state, p.msg]
+        try:
+            with self._lock:
+                write_header = not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0
+                with open(self.log_path, "a", encoding="utf-8", newline="") as f:
+                    writer = csv.writer(f)
+                    if write_header:
+                        writer.writerow(LOG_HEADER)
+                    writer.writerow(row)
+        except OSError as e:
+            print(f"❌ 写入执行日志失败: {e}")
+
+
+def _floor(value: Decimal, lot_sz: Decimal) -> Decimal:
+    """按 lotSz 的整数倍向下取整（负数视为 0）。"""
+    if value <= 0:
+        return Decimal('0')
+    return (value / lot_sz).to_integral_value(rounding=ROUND_DOWN) * lot_sz
+
+
+def _round_px(px: Decimal, tick_sz: Decimal, rounding) -> Decimal:
+    if tick_sz <= 0:
+        return px
+    return (px / tick_sz).to_integral_value(rounding=rounding) * tick_sz
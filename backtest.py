@@ -0,0 +1,261 @@
+# backtest.py
+# 跟单回测引擎：离线回放目标钱包的持仓记录 + 价格序列，按 sync_positions 相同的缩放与取整规则
+# （面值换算、lotSz 向下取整、minSz 过滤，直接使用 fastcore 的下单数量计算）模拟我的跟单仓位，
+# 估算盈亏、换手、手续费与滑点。
+# 不访问网络；数据以 Parquet 分片存放，可增量追加。
+
+import math
+import os
+import sys
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from fastcore import ORDER, InstrumentTable, plan_orders_array
+
+# OKX 永续合约默认 taker 费率与滑点估计（基点）
+DEFAULT_TAKER_FEE = 0.0005
+DEFAULT_SLIPPAGE_BPS = 2.0
+
+
+class SnapshotStore:
+    """
+    Parquet 分片存储，目录结构:
+        root/positions/part-*.parquet  列: ts(int64 毫秒), wallet, coin, szi(float64, 带符号)
+        root/prices/part-*.parquet     列: ts(int64 毫秒), coin, mid(float64)
+    positions 只记录变化：某币种数量变化或被平仓（szi=0）时才写一行，1 秒级快照也能保持很小的体积。
+    每次 flush 写一个新分片，从不改写旧文件，因此可以随时增量追加。
+    第一次追加持仓时从已有分片恢复每个钱包的最后持仓作为比较基准，重启后停机期间已平仓的币种也会写出 szi=0。
+    """
+
+    def __init__(self, root: str, flush_rows: int = 200_000):
+        self.root = root
+        self.flush_rows = flush_rows
+        self._last: Optional[Dict[str, Dict[str, float]]] = None
+        self._pos_rows = {"ts": [], "wallet": [], "coin": [], "szi": []}
+        self._px_rows = {"ts": [], "coin": [], "mid": []}
+        for sub in ("positions", "prices"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def append_positions(self, ts_ms: int, wallet: str, positions: Dict[str, float]):
+        """追加一个钱包的完整快照 {coin: 带符号数量}，只写入与上一快照不同的币种。"""
+        if self._last is None:
+            self._last = self._stored_last()
+        last = self._last.setdefault(wallet, {})
+        for coin in set(last) | set(positions):
+            szi = float(positions.get(coin, 0.0))
+            if last.get(coin, 0.0) != szi:
+                self._pos_rows["ts"].append(ts_ms)
+                self._pos_rows["wallet"].append(wallet)
+                self._pos_rows["coin"].append(coin)
+                self._pos_rows["szi"].append(szi)
+                if szi == 0.0:
+                    last.pop(coin, None)
+                else:
+                    last[coin] = szi
+        if len(self._pos_rows["ts"]) >= self.flush_rows:
+            self.flush()
+
+    def _stored_last(self) -> Dict[str, Dict[str, float]]:
+        """已写入分片中每个钱包、每个币种的最后一个非零数量。"""
+        changes = self.read("positions")
+        out: Dict[str, Dict[str, float]] = {}
+        if changes.empty:
+            return out
+        last = changes.groupby(["wallet", "coin"], observed=True, sort=False)["szi"].last()
+        for (wallet, coin), szi in last.items():
+            if szi != 0.0:
+                out.setdefault(wallet, {})[coin] = float(szi)
+        return out
+
+    def append_prices(self, ts_ms: int, mids: Dict[str, float]):
+        for coin, mid in mids.items():
+            self._px_rows["ts"].append(ts_ms)
+            self._px_rows["coin"].append(coin)
+            self._px_rows["mid"].append(float(mid))
+        if len(self._px_rows["ts"]) >= self.flush_rows:
+            self.flush()
+
+    def append_frame(self, kind: str, frame: pd.DataFrame):
+        """直接追加一个已经是变化记录格式的 DataFrame（例如从其他来源导入）。"""
+        self._write(kind, frame)
+
+    def flush(self):
+        if self._pos_rows["ts"]:
+            self._write("positions", pd.DataFrame(self._pos_rows))
+            self._pos_rows = {k: [] for k in self._pos_rows}
+        if self._px_rows["ts"]:
+            self._write("prices", pd.DataFrame(self._px_rows))
+            self._px_rows = {k: [] for k in self._px_rows}
+
+    def read(self, kind: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+             wallets: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        import pyarrow.dataset as ds
+
+        path = os.path.join(self.root, kind)
+        if not any(name.endswith(".parquet") for name in os.listdir(path)):
+            return pd.DataFrame()
+        expr = None
+        for cond in (ds.field("ts") >= start_ms if start_ms is not None else None,
+                     ds.field("ts") <= end_ms if end_ms is not None else None,
+                     ds.field("wallet").isin(list(wallets)) if wallets is not None else None):
+            if cond is not None:
+                expr = cond if expr is None else expr & cond
+        table = ds.dataset(path, format="parquet").to_table(filter=expr)
+        return table.to_pandas().sort_values("ts", kind="stable").reset_index(drop=True)
+
+    def _write(self, kind: str, frame: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for col in ("wallet", "coin"):
+            if col in frame:
+                frame[col] = frame[col].astype("category")
+        name = f"part-{time.time_ns()}.parquet"
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False),
+                       os.path.join(self.root, kind, name), compression="zstd")
+
+
+def wide_positions(changes: pd.DataFrame) -> pd.DataFrame:
+    """变化记录 → 宽表（行: 事件时间, 列: 币种, 值: 当时的带符号数量）。"""
+    wide = changes.pivot_table(index="ts", columns="coin", values="szi", aggfunc="last", observed=True)
+    return wide.ffill().fillna(0.0)
+
+
+def wide_prices(prices: pd.DataFrame) -> pd.DataFrame:
+    wide = prices.pivot_table(index="ts", columns="coin", values="mid", aggfunc="last", observed=True)
+    return wide.sort_index().ffill()
+
+
+def _prices_at(px_wide: pd.DataFrame, coins, ts: np.ndarray) -> np.ndarray:
+    """取每个时间点之前最近的价格（E×C），没有价格时为 NaN。"""
+    px = px_wide.reindex(columns=coins)
+    idx = np.searchsorted(px.index.values, ts, side="right") - 1
+    out = px.to_numpy(dtype=float)[np.clip(idx, 0, None)]
+    out[idx < 0] = np.nan
+    return out
+
+
+def replay_wallet(changes: pd.DataFrame, px_wide: pd.DataFrame, specs: Dict[str, object],
+                  budget_usd: float, fee_rate: float = DEFAULT_TAKER_FEE,
+                  slippage_bps: float = DEFAULT_SLIPPAGE_BPS, latency_ms: int = 0) -> Dict:
+    """
+    回放单个钱包。
+
+    目标币数量、缩放比例的计算全部按事件×币种矩阵一次完成；我的仓位与 sync_positions 一样依赖上一次的
+    取整结果，只能按事件顺序推进，每一步用 fastcore.plan_orders_array 计算下单张数
+    （与 sync_positions 相同的向下取整与 minSz 规则，边界附近的行改用 Decimal）。
+    """
+    wide = wide_positions(changes)
+    coins = list(wide.columns)
+    ts = wide.index.to_numpy(dtype=np.int64)
+    szi = wide.to_numpy(dtype=float)
+    table = InstrumentTable({f"{c}-USDT-SWAP": specs.get(f"{c}-USDT-SWAP") for c in coins})
+    rows = np.arange(len(coins))
+    lot = table.lot[rows]
+
+    # 1. 缩放：与 sync_positions 一致，按目标在 Hyperliquid mid 下的总名义价值计算比例
+    mid_seen = _prices_at(px_wide, coins, ts)
+    total_value = np.nansum(np.abs(szi) * mid_seen, axis=1)
+    scaling = np.divide(budget_usd, total_value, out=np.zeros_like(total_value), where=total_value > 0)
+
+    # 2. 缩放后的带符号目标币数量
+    target_coins = szi * scaling[:, None]
+    exec_px = _prices_at(px_wide, coins, ts + latency_ms) if latency_ms else mid_seen
+    can_trade = (table.status[rows] == ORDER) & ~np.isnan(exec_px)
+
+    # 3. 按事件推进我的仓位（单位: lotSz 步数，始终为整数）
+    mine_steps = np.zeros(len(coins), dtype=np.int64)
+    trades = np.zeros_like(target_coins)
+    for e in range(len(ts)):
+        t_coins = target_coins[e]
+        plan = plan_orders_array(table, rows, t_coins, mine_steps * lot,
+                                 lambda k: (Decimal(repr(float(t_coins[k]))),
+                                            int(mine_steps[k]) * table.specs[k].lot_sz))
+        ok = can_trade[e] & (plan.status == ORDER)
+        delta = np.where(ok, plan.side * plan.steps.astype(np.int64), 0)
+        trades[e] = delta
+        mine_steps += delta
+
+    # 4. 盈亏与成本：以 mid 成交计算毛盈亏，手续费和滑点按成交名义价值另计
+    coins_per_step = lot * table.ct_val[rows]
+    trade_coins = trades * coins_per_step
+    pos_coins = np.cumsum(trade_coins, axis=0)
+    px = np.nan_to_num(exec_px)
+    notional = np.abs(trade_coins) * px
+    cash = -np.cumsum(np.sum(trade_coins * px, axis=1))
+    costs = np.cumsum(notional.sum(axis=1) * (fee_rate + slippage_bps / 10_000))
+    equity = cash + np.sum(pos_coins * px, axis=1) - costs
+
+    final_px = px_wide.reindex(columns=coins).ffill().iloc[-1].to_numpy(dtype=float) if len(px_wide) else px[-1]
+    final_px = np.where(np.isnan(final_px), px[-1] if len(px) else 0.0, final_px)
+    final_pos = pos_coins[-1] if len(ts) else np.zeros(len(coins))
+    gross = (cash[-1] if len(ts) else 0.0) + float(np.sum(final_pos * final_px))
+    turnover = float(notional.sum())
+    fees = turnover * fee_rate
+    slippage = turnover * slippage_bps / 10_000
+    curve = np.append(equity, gross - fees - slippage)
+    drawdown = float(np.max(np.maximum.accumulate(np.maximum(curve, 0.0)) - curve)) if len(curve) else 0.0
+    return {
+        "events": len(ts),
+        "trades": int(np.count_nonzero(trades)),
+        "turnover_usd": turnover,
+        "fees_usd": fees,
+        "slippage_usd": slippage,
+        "gross_pnl_usd": gross,
+        "net_pnl_usd": gross - fees - slippage,
+        "max_drawdown_usd": drawdown,
+        "final_exposure_usd": float(np.sum(np.abs(final_pos) * final_px)),
+    }
+
+
+def run_backtest(changes: pd.DataFrame, prices: pd.DataFrame, specs: Dict[str, object],
+                 budget_usd: float = 10000.0, **kwargs) -> pd.DataFrame:
+    """对 changes 中的每个钱包分别回放，返回按净盈亏排序的结果表。"""
+    px_wide = wide_prices(prices)
+    rows = []
+    for wallet, group in changes.groupby("wallet", observed=True, sort=False):
+        result = replay_wallet(group, px_wide, specs, budget_usd, **kwargs)
+        result["wallet"] = wallet
+        rows.append(result)
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).set_index("wallet").sort_values("net_pnl_usd", ascending=False)
+
+
+def fills_to_changes(fills: pd.DataFrame) -> pd.DataFrame:
+    """
+    Hyperliquid 成交记录（列: ts, wallet, coin, sz, side('B'/'A')）→ 持仓变化记录。
+    成交只给出增量，这里按钱包和币种累加得到每笔成交之后的持仓。
+    """
+    signed = np.where(fills["side"].to_numpy() == "B", 1.0, -1.0) * fills["sz"].astype(float).to_numpy()
+    out = fills[["ts", "wallet", "coin"]].copy()
+    out["szi"] = signed
+    out = out.sort_values("ts", kind="stable")
+    out["szi"] = out.groupby(["wallet", "coin"], observed=True)["szi"].cumsum()
+    # 浮点累加误差：非常接近 0 的视为已平仓
+    out.loc[out["szi"].abs() < 1e-12, "szi"] = 0.0
+    return out.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    from instruments import InstrumentRegistry
+
+    if len(sys.argv) < 2:
+        print("用法: python backtest.py <数据目录> [每个钱包的跟单资金USD]")
+        sys.exit(1)
+    store = SnapshotStore(sys.argv[1])
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 10000.0
+    # TTL 设为无穷大：只使用本地缓存的合约参数，不访问网络
+    registry = InstrumentRegistry(flag="0", ttl_seconds=math.inf).load()
+
+    t0 = time.perf_counter()
+    changes = store.read("positions")
+    specs = {f"{c}-USDT-SWAP": registry.get(f"{c}-USDT-SWAP") for c in changes["coin"].unique()}
+    specs = {k: v for k, v in specs.items() if v is not None}
+    report = run_backtest(changes, store.read("prices"), specs, budget)
+    print(report.to_string(float_format=lambda v: f"{v:,.2f}"))
+    print(f"\n⏱️ 回放耗时 {time.perf_counter() - t0:.2f} 秒")
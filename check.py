@@ -1,6 +1,7 @@
 
 # check_instrument_details.py
-import okx.PublicData as PublicData
+# 合约参数已由 instruments.py 自动加载缓存，本脚本仅用于人工查看。
+from instruments import InstrumentRegistry
 
 # --- 配置 ---
 # 在这里输入你想查询的合约ID
@@ -11,38 +12,28 @@ INSTRUMENT_IDS_TO_CHECK = [
 FLAG = "1"  # "1" 代表模拟盘, "0" 代表实盘
 # --- 配置结束 ---
 
-def get_instrument_details(instId, flag):
-    """从OKX获取并打印合约的详细参数。"""
-    try:
-        publicAPI = PublicData.PublicAPI(flag=flag)
-        result = publicAPI.get_instruments(instType="SWAP", instId=instId)
+def get_instrument_details(instId, registry):
+    """从合约注册表中查询并打印合约的详细参数。"""
+    spec = registry.get(instId)
+    if spec is None:
+        print(f"❌ OKX 上不存在【{instId}】合约。")
+        return
 
-        if result.get('code') == '0' and result.get('data'):
-            info = result['data'][0]
-            print(f"✅ 成功获取【{instId}】的参数:")
-            print("-" * 40)
-            # lotSz 是交易数量的步进值，也就是我们需要的下单精度
-            lot_size = info.get('lotSz')
-            print(f"  - 最小下单数量 (lotSz): {lot_size}")
-            print(f"  - 价格精度 (tickSz): {info.get('tickSz')}")
-            print(f"  - 最小下单张数 (minSz): {info.get('minSz')}")
-            print("-" * 40)
-            
-            if lot_size:
-                print(f"🎯 结论: 在 trade.py 的 CONTRACT_PRECISION 字典中,")
-                print(f"   为 \"{instId}\" 设置的值应该是: Decimal('{lot_size}')")
-            else:
-                print("⚠️ 未找到 lotSz，无法给出结论。")
-        else:
-            print(f"❌ 获取【{instId}】参数失败。 API响应: {result}")
-
-    except Exception as e:
-        print(f"查询 {instId} 时发生异常: {e}")
+    print(f"✅ 成功获取【{instId}】的参数:")
+    print("-" * 40)
+    print(f"  - 合约面值 (ctVal): {spec.ct_val}")
+    # lotSz 是交易数量的步进值，也就是我们需要的下单精度
+    print(f"  - 最小下单数量 (lotSz): {spec.lot_sz}")
+    print(f"  - 价格精度 (tickSz): {spec.tick_sz}")
+    print(f"  - 最小下单张数 (minSz): {spec.min_sz}")
+    print(f"  - 状态 (state): {spec.state}")
+    print("-" * 40)
 
 if __name__ == "__main__":
     env = "模拟盘" if FLAG == '1' else "实盘"
     print(f"环境: {env}\n")
     
+    registry = InstrumentRegistry(flag=FLAG).load()
     for inst_id in INSTRUMENT_IDS_TO_CHECK:
-        get_instrument_details(inst_id, FLAG)
+        get_instrument_details(inst_id, registry)
         print("\n" + "="*50 + "\n")
\ No newline at end of file
@@ -0,0 +1,176 @@
+# clients.py
+# 进程内共享的 HTTP 客户端：Hyperliquid Info 与 OKX SDK 客户端各自只创建一次，复用长连接。
+#
+# - Hyperliquid Info 基于 requests.Session，按 base_url 单例，连接池大小可配置
+#   （Info 的构造函数还会额外请求 spot_meta / meta，每次新建的代价远大于一次 TLS 握手）
+# - OKX SDK 的每个 XxxAPI 都是独立的 httpx.Client（HTTP/2），这里让它们共享同一个 HTTP/2 传输层，
+#   账户、交易、公共数据接口复用同一条到 OKX 的多路复用连接，并把空闲连接保留时间从 httpx 默认的 5 秒延长
+# - warm_up() 提前完成握手，start_keepalive() 定期发送轻量请求防止连接在两次下单之间被关闭
+# - SDK 模块在第一次使用时才导入（导入 OKX SDK 需要数百毫秒），lazy_okx_api() 返回先占位、用到时再创建的客户端
+
+import importlib
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import httpx
+from requests.adapters import HTTPAdapter
+
+from hyperliquid.utils import constants
+
+if TYPE_CHECKING:
+    from hyperliquid.info import Info
+
+DEFAULT_POOL_SIZE = 16
+# httpx 空闲连接保留时间（秒），应大于 keepalive 间隔
+KEEPALIVE_EXPIRY = 90
+KEEPALIVE_INTERVAL = 25
+HTTP_TIMEOUT = 10
+
+_lock = threading.Lock()
+_infos: Dict[str, Tuple["Info", int]] = {}
+_okx_transports: Dict[Optional[str], httpx.HTTPTransport] = {}
+_okx_clients: Dict[tuple, object] = {}
+_keepalive_started = False
+
+
+def _mount_pool(session, pool_size: int):
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def get_info(base_url: str = constants.MAINNET_API_URL, pool_size: int = DEFAULT_POOL_SIZE,
+             timeout: float = HTTP_TIMEOUT) -> "Info":
+    """
+    按 base_url 返回共享的 Info 客户端（skip_ws）。再次调用传入更大的 pool_size 时扩大连接池。
+    只用于 /info 查询，不需要 SDK 下单用的币种表：传入空的 meta / spot_meta，构造时不再请求两次元数据。
+    """
+    from hyperliquid.info import Info
+
+    with _lock:
+        cached = _infos.get(base_url)
+        if cached is not None:
+            info, size = cached
+            if pool_size > size:
+                _mount_pool(info.session, pool_size)
+                _infos[base_url] = (info, pool_size)
+            return info
+        info = Info(base_url=base_url, skip_ws=True, meta={"universe": []}, spot_meta={"universe": [], "tokens": []},
+                    timeout=timeout)
+        _mount_pool(info.session, pool_size)
+        _infos[base_url] = (info, pool_size)
+        return info
+
+
+def _okx_transport(proxy: Optional[str], pool_size: int) -> httpx.HTTPTransport:
+    transport = _okx_transports.get(proxy)
+    if transport is None:
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                              keepalive_expiry=KEEPALIVE_EXPIRY)
+        transport = _okx_transports[proxy] = httpx.HTTPTransport(http2=True, limits=limits, proxy=proxy)
+    return transport
+
+
+def okx_api(api_cls, api_key: str = "-1", secret_key: str = "-1", passphrase: str = "-1", flag: str = "1",
+            domain: Optional[str] = None, proxy: Optional[str] = None, pool_size: int = DEFAULT_POOL_SIZE):
+    """
+    返回共享的 OKX SDK 客户端实例，例如 okx_api(Account.AccountAPI, key, secret, passphrase, "1")。
+    相同类、凭证、flag 与 domain 只创建一次；所有实例共用一个 HTTP/2 传输层。
+    """
+    key = (api_cls, api_key, flag, domain, proxy)
+    with _lock:
+        client = _okx_clients.get(key)
+        if client is None:
+            kwargs = {"domain": domain} if domain else {}
+            client = api_cls(api_key, secret_key, passphrase, False, flag, proxy=proxy, **kwargs)
+            # OkxClient 的构造函数不接受 transport 参数，构造后替换为共享传输层
+            own = client._transport
+            client._transport = _okx_transport(proxy, pool_size)
+            own.close()
+            client.timeout = httpx.Timeout(HTTP_TIMEOUT)
+            _okx_clients[key] = client
+        return client
+
+
+class LazyOkxClient:
+    """
+    OKX SDK 客户端的占位对象：第一次访问属性（或调用 prepare()）时才导入 SDK 模块并通过 okx_api 创建共享实例。
+    可以像真实客户端一样交给 BudgetedProxy / TimedProxy 包装。
+    """
+
+    def __init__(self, module: str, cls_name: str, *args, **kwargs):
+        self._module = module
+        self._cls_name = cls_name
+        self._args = args
+        self._kwargs = kwargs
+        self._client = None
+        self._init_lock = threading.Lock()
+
+    def prepare(self):
+        client = self._client
+        if client is None:
+            with self._init_lock:
+                if self._client is None:
+                    api_cls = getattr(importlib.import_module(self._module), self._cls_name)
+                    self._client = okx_api(api_cls, *self._args, **self._kwargs)
+                client = self._client
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.prepare(), name)
+
+    def __repr__(self):
+        state = "ready" if self._client is not None else "pending"
+        return f"LazyOkxClient({self._module}.{self._cls_name}, {state})"
+
+
+def lazy_okx_api(module: str, cls_name: str, *args, **kwargs) -> LazyOkxClient:
+    """与 okx_api 参数相同，类以模块名与类名给出，例如 lazy_okx_api("okx.Account", "AccountAPI", key, ...)。"""
+    return LazyOkxClient(module, cls_name, *args, **kwargs)
+
+
+def warm_up(hl_base_url: str = constants.MAINNET_API_URL, okx_domain: Optional[str] = None):
+    """并行完成到 Hyperliquid 与 OKX 的 TCP/TLS 握手，使第一次真正的请求不必等待建连。"""
+    import okx.PublicData as PublicData
+
+    def hl():
+        get_info(hl_base_url)
+
+    def okx():
+        okx_api(PublicData.PublicAPI, domain=okx_domain).get("/api/v5/public/time")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=f, daemon=True) for f in (hl, okx)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=HTTP_TIMEOUT)
+    return time.perf_counter() - started
+
+
+def start_keepalive(interval: float = KEEPALIVE_INTERVAL, hl_base_url: str = constants.MAINNET_API_URL,
+                    okx_domain: Optional[str] = None):
+    """后台线程每 interval 秒发送一次轻量请求（Hyperliquid exchangeStatus、OKX 服务器时间），保持连接常热。"""
+    global _keepalive_started
+
+    with _lock:
+        if _keepalive_started:
+            return
+        _keepalive_started = True
+
+    def loop():
+        # 在后台线程中导入 OKX SDK，调用方（启动流程）不必等待 SDK 导入完成
+        import okx.PublicData as PublicData
+        while True:
+            time.sleep(interval)
+            try:
+                get_info(hl_base_url).post("/info", {"type": "exchangeStatus"})
+            except Exception:
+                pass
+            try:
+                okx_api(PublicData.PublicAPI, domain=okx_domain).get("/api/v5/public/time")
+            except Exception:
+                pass
+
+    threading.Thread(target=loop, name="http-keepalive", daemon=True).start()
@@ -0,0 +1,192 @@
+# conftest.py
+# 测试共用的本地假服务器：同一个端口上 POST 请求按 HTTP 处理（Hyperliquid /info、REST 回退），
+# GET 升级请求按 WebSocket 处理（Hyperliquid /ws、OKX 私有频道）。只依赖标准库，不访问外部网络。
+
+import base64
+import hashlib
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import pytest
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _Conn:
+    """一个 WebSocket 连接（服务端发送的帧不加掩码）。"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send_frame(self, opcode: int, payload: bytes = b""):
+        n = len(payload)
+        if n < 126:
+            header = struct.pack("!BB", 0x80 | opcode, n)
+        elif n < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+        with self.lock:
+            if not self.closed:
+                self.sock.sendall(header + payload)
+
+    def send(self, message):
+        if not isinstance(message, (str, bytes)):
+            message = json.dumps(message)
+        self.send_frame(0x1, message.encode() if isinstance(message, str) else message)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self.sock.sendall(b"\x88\x00")
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class FakeServer:
+    """
+    on_post(path, payload) 返回 (HTTP 状态码, JSON 对象)；on_ws(conn, message) 处理客户端发来的每条文本消息。
+    received 保存客户端发来的全部 WebSocket 消息（已解码的 JSON），posts 保存全部 POST 请求。
+    """
+
+    def __init__(self, on_post: Optional[Callable] = None, on_ws: Optional[Callable] = None):
+        self.on_post = on_post
+        self.on_ws = on_ws
+        self.received: List = []
+        self.posts: List[Tuple[str, dict]] = []
+        self.conns: List[_Conn] = []
+        self.connections = 0
+        self._cond = threading.Condition()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server._handle(self)
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.ws_url = f"ws://127.0.0.1:{self.port}/ws"
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+
+    # ---------- 测试控制 ----------
+    def send(self, message):
+        """推送给当前所有连接。"""
+        for conn in self.live_conns():
+            conn.send(message)
+
+    def drop(self):
+        """服务端断开所有 WebSocket 连接。"""
+        for conn in self.live_conns():
+            conn.close()
+
+    def live_conns(self) -> List[_Conn]:
+        with self._cond:
+            return [c for c in self.conns if not c.closed]
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: float = 5) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return predicate()
+
+    def close(self):
+        self.drop()
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ---------- 内部实现 ----------
+    def _handle(self, handler):
+        request_line = handler.rfile.readline().decode("latin-1").split()
+        if len(request_line) < 2:
+            return
+        method, path = request_line[0], request_line[1]
+        headers = {}
+        while True:
+            line = handler.rfile.readline().decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if method == "GET" and headers.get("upgrade", "").lower() == "websocket":
+            self._serve_ws(handler, headers)
+        elif method == "POST":
+            body = handler.rfile.read(int(headers.get("content-length") or 0))
+            payload = json.loads(body or b"null")
+            with self._cond:
+                self.posts.append((path, payload))
+            status, obj = self.on_post(path, payload) if self.on_post else (404, None)
+            data = json.dumps(obj).encode()
+            handler.wfile.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+
+    def _serve_ws(self, handler, headers):
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WS_GUID).encode()).digest()).decode()
+        handler.wfile.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                             f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        handler.wfile.flush()
+        conn = _Conn(handler.connection)
+        with self._cond:
+            self.conns.append(conn)
+            self.connections += 1
+        rfile = handler.rfile
+        try:
+            while not conn.closed:
+                head = rfile.read(2)
+                if len(head) < 2:
+                    break
+                opcode, n = head[0] & 0x0F, head[1] & 0x7F
+                if n == 126:
+                    n = struct.unpack("!H", rfile.read(2))[0]
+                elif n == 127:
+                    n = struct.unpack("!Q", rfile.read(8))[0]
+                mask = rfile.read(4) if head[1] & 0x80 else b"\x00\x00\x00\x00"
+                payload = bytes(b ^ mask[k % 4] for k, b in enumerate(rfile.read(n)))
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    conn.send_frame(0xA, payload)
+                    continue
+                if opcode != 0x1:
+                    continue
+                text = payload.decode()
+                try:
+                    message = json.loads(text)
+                except ValueError:
+                    message = text
+                with self._cond:
+                    self.received.append(message)
+                if self.on_ws is not None:
+                    self.on_ws(conn, message)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def make(on_post=None, on_ws=None) -> FakeServer:
+        server = FakeServer(on_post, on_ws)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
@@ -0,0 +1,175 @@
+# copy_engine.py
+# 多钱包并发跟单引擎：同时跟踪 N 个 Hyperliquid 地址，合并为一个净持仓簿后再交给 sync_positions。
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from hyperliquid.info import Info
+from clients import get_info
+from monitor import build_positions
+
+
+class WalletTarget:
+    """一个被跟踪的钱包及其独立的跟单预算（替代全局的 MY_TOTAL_COPY_USD）。"""
+
+    def __init__(self, address: str, budget_usd: Decimal):
+        self.address = address
+        self.budget_usd = Decimal(budget_usd)
+
+    def __repr__(self):
+        return f"WalletTarget({self.address}, ${self.budget_usd})"
+
+
+class MultiTargetEngine:
+    """
+    基于 asyncio 的多钱包引擎。
+
+    每个 tick 只拉取一次 all_mids，所有钱包的 user_state 在有界线程池中并发拉取，
+    因此 tick 延迟约等于单次请求延迟，而不是随钱包数线性增长。
+    Info 客户端是同步的（requests），这里用 run_in_executor 包装，所有钱包共享同一个客户端与连接池。
+    """
+
+    def __init__(self, wallets: List[WalletTarget], info: Optional[Info] = None, max_concurrency: int = 32,
+                 recorder=None):
+        self.wallets = list(wallets)
+        # 可选的 recorder.SnapshotRecorder，每个 tick 记录所有钱包的原始持仓
+        self.recorder = recorder
+        # 共享 Info 客户端的连接池至少要容纳全部并发请求
+        self.info = info if info is not None else get_info(pool_size=max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="hl-fetch")
+        # 单个钱包拉取失败时沿用上一次的结果，避免因临时错误把它的仓位当成已清空
+        self._last_states: Dict[str, Dict] = {}
+        self.last_tick_stats: Dict[str, float] = {}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _fetch_state(self, wallet: WalletTarget) -> Optional[Dict]:
+        try:
+            state = await self._call(self.info.user_state, wallet.address) or {}
+            self._last_states[wallet.address] = state
+            return state
+        except Exception as e:
+            print(f"  - ⚠️ 获取 {wallet.address} 持仓失败，沿用上一次结果: {e}")
+            return self._last_states.get(wallet.address)
+
+    async def tick(self) -> Optional[List[Dict]]:
+        """
+        拉取所有钱包的最新状态，返回已按各自预算缩放后的净持仓簿。
+        还有钱包从未成功拉取过（没有可沿用的结果）时返回 None：缺少它的仓位时合并出的净持仓簿不完整，
+        按它同步会把该钱包对应的仓位平掉。
+        """
+        t0 = time.perf_counter()
+        # all_mids 与各钱包的 user_state 相互独立，一起并发发出
+        mids_task = asyncio.ensure_future(self._call(self.info.all_mids))
+        states = await asyncio.gather(*(self._fetch_state(w) for w in self.wallets))
+        all_mids = await mids_task or {}
+        t1 = time.perf_counter()
+
+        missing = [w.address for w, s in zip(self.wallets, states) if s is None]
+        if missing:
+            print(f"  - ⚠️ 尚未取得 {', '.join(missing)} 的持仓，本轮不合并净持仓簿。")
+            return None
+        wallet_positions = [(w, build_positions(s, all_mids)) for w, s in zip(self.wallets, states)]
+        if self.recorder is not None:
+            for w, positions in wallet_positions:
+                self.recorder.submit(w.address, positions)
+        book = merge_wallet_books(wallet_positions, all_mids)
+        t2 = time.perf_counter()
+
+        self.last_tick_stats = {
+            "wallets": len(self.wallets),
+            "fetch_ms": (t1 - t0) * 1000,
+            "merge_ms": (t2 - t1) * 1000,
+            "total_ms": (t2 - t0) * 1000,
+        }
+        return book
+
+    async def run(self, on_change, interval: float = 10, report_every: int = 6):
+        """
+        主循环：净持仓簿发生变化时调用 on_change(book)。
+        on_change 一般是 sync_positions，它是阻塞调用，放到线程池里执行以免阻塞事件循环。
+        """
+        last_simplified = None
+        ticks = 0
+        while True:
+            started = time.monotonic()
+            try:
+                book = await self.tick()
+                # 还有钱包没有取得过持仓时不同步，等下一轮
+                simplified = {p['coin']: (p['size'], p['direction_is_buy']) for p in book} if book is not None else None
+                if book is not None and simplified != last_simplified:
+                    print(f"\n🔔 净持仓簿发生变化（{len(book)} 个币种），正在执行跟单操作...")
+                    await self._call(on_change, book)
+                    last_simplified = simplified
+                ticks += 1
+                if ticks % report_every == 0:
+                    s = self.last_tick_stats
+                    print(f"⏱️ tick 延迟: 拉取 {s['fetch_ms']:.1f}ms | 合并 {s['merge_ms']:.2f}ms | "
+                          f"总计 {s['total_ms']:.1f}ms | 钱包数 {s['wallets']}")
+            except Exception as e:
+                print(f"\n💥 多钱包引擎发生错误: {type(e).__name__} - {e}")
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def merge_wallet_books(wallet_positions: List[Tuple[WalletTarget, List[Dict]]], all_mids: Dict) -> List[Dict]:
+    """
+    把各钱包的持仓按各自预算缩放后按币种求净额。
+    返回格式与 fetch_user_positions 一致（size 已是缩放后的币数量），杠杆取该币种上名义价值最大的钱包。
+    """
+    net_size: Dict[str, Decimal] = {}
+    lev_weight: Dict[str, Tuple[Decimal, Decimal]] = {}
+    for wallet, positions in wallet_positions:
+        total_value = sum((p['value_usd'] for p in positions), Decimal('0'))
+        if total_value <= 0:
+            continue
+        scaling_factor = wallet.budget_usd / total_value
+        for p in positions:
+            scaled = p['size'] * scaling_factor
+            coin = p['coin']
+            net_size[coin] = net_size.get(coin, Decimal('0')) + (scaled if p['direction_is_buy'] else -scaled)
+            weight = p['value_usd'] * scaling_factor
+            if coin not in lev_weight or weight > lev_weight[coin][0]:
+                lev_weight[coin] = (weight, p['leverage'])
+
+    book = []
+    for coin, signed in net_size.items():
+        if signed.is_zero():
+            continue
+        mid = Decimal(all_mids.get(coin, '0'))
+        size = signed.copy_abs()
+        book.append({
+            "coin": coin,
+            "direction_is_buy": signed > 0,
+            "leverage": lev_weight[coin][1],
+            "size": size,
+            "value_usd": size * mid,
+            "mid": mid,
+        })
+    return book
+
+
+if __name__ == "__main__":
+    # 引入 trade 会读取 config.json 并初始化 OKX 客户端
+    from trade import sync_positions
+
+    WALLETS = [
+        WalletTarget("0xc20ac4dc4188660cbf555448af52694ca62b0734", Decimal('10000.0')),
+    ]
+    engine = MultiTargetEngine(WALLETS)
+    print(f"🎉 多钱包跟单引擎启动，正在跟踪 {len(WALLETS)} 个钱包...")
+    try:
+        # 净持仓簿已按每个钱包的预算缩放，因此缩放比例固定为 1
+        asyncio.run(engine.run(lambda book: sync_positions(book, scaling_factor=Decimal('1'))))
+    except KeyboardInterrupt:
+        print("\n🛑 程序被手动中断 (Ctrl+C)，正在退出...")
+    finally:
+        engine.close()
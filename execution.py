@@ -0,0 +1,164 @@
+# execution.py
+# 批量下单执行层：一次 tick 的所有订单意图先统一收集，再并发设置杠杆、通过 batch-orders 接口批量下单。
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# OKX /api/v5/trade/batch-orders 单次最多 20 笔
+MAX_BATCH_ORDERS = 20
+
+
+class OrderIntent:
+    """
+    一笔待提交的订单。sz 为张数字符串，leverage 为空表示不需要设置杠杆（例如纯平仓）。
+    ord_type 默认为市价单；拆单执行的子订单还会用到 ioc / post_only 限价单，此时 px 为价格字符串。
+    """
+
+    __slots__ = ("inst_id", "side", "sz", "leverage", "cl_ord_id", "ord_type", "px")
+
+    def __init__(self, inst_id: str, side: str, sz: str, leverage: Optional[str] = None, cl_ord_id: str = "",
+                 ord_type: str = "market", px: str = ""):
+        self.inst_id = inst_id
+        self.side = side
+        self.sz = sz
+        self.leverage = leverage
+        self.cl_ord_id = cl_ord_id
+        self.ord_type = ord_type
+        self.px = px
+
+    def to_okx(self, td_mode: str = "cross") -> Dict:
+        order = {"instId": self.inst_id, "tdMode": td_mode, "side": self.side,
+                 "posSide": "net", "ordType": self.ord_type, "sz": self.sz}
+        if self.px:
+            order["px"] = self.px
+        if self.cl_ord_id:
+            order["clOrdId"] = self.cl_ord_id
+        return order
+
+    def __repr__(self):
+        px = f" @{self.px}" if self.px else ""
+        return f"OrderIntent({self.side.upper()} {self.sz} {self.inst_id}{px}, lever={self.leverage})"
+
+
+class OrderResult:
+    """单笔订单的执行结果。"""
+
+    __slots__ = ("intent", "ok", "ord_id", "code", "msg")
+
+    def __init__(self, intent: OrderIntent, ok: bool, ord_id: str = "", code: str = "", msg: str = ""):
+        self.intent = intent
+        self.ok = ok
+        self.ord_id = ord_id
+        self.code = code
+        self.msg = msg
+
+    def __repr__(self):
+        status = f"ordId={self.ord_id}" if self.ok else f"失败 {self.code} {self.msg}"
+        return f"OrderResult({self.intent.inst_id} {status})"
+
+
+class BatchExecutor:
+    """
+    批量执行器。
+
+    - 杠杆: 按合约缓存当前杠杆，只有目标杠杆与缓存不同时才调用 set_leverage，且多个合约在线程池中并发设置。
+    - 下单: 按 20 笔一组调用 place_multiple_orders，多组之间同样并发提交。
+    设置杠杆失败的合约不会下单，结果中记录失败原因。
+    传入 journal（journal.OrderJournal）时，订单在发送前写入日志，收到回执后更新状态。
+    """
+
+    def __init__(self, account_api, trade_api, max_workers: int = 8, td_mode: str = "cross", journal=None):
+        self.account_api = account_api
+        self.trade_api = trade_api
+        self.td_mode = td_mode
+        self.journal = journal
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="okx-exec")
+        self._leverage_cache: Dict[str, str] = {}
+
+    def seed_leverage(self, okx_positions_data: Dict):
+        """用 get_positions 返回的 lever 字段预热杠杆缓存。"""
+        if okx_positions_data.get('code') != '0':
+            return
+        for pos in okx_positions_data.get('data', []):
+            if pos.get('instId') and pos.get('lever'):
+                self._leverage_cache[pos['instId']] = _normalize_lever(pos['lever'])
+
+    def execute(self, intents: List[OrderIntent], tick_id: Optional[int] = None) -> List[OrderResult]:
+        if not intents:
+            return []
+        lev_errors = self._ensure_leverage(intents)
+
+        results = [OrderResult(i, False, code="lever", msg=lev_errors[i.inst_id])
+                   for i in intents if i.inst_id in lev_errors]
+        ready = [i for i in intents if i.inst_id not in lev_errors]
+        if self.journal is not None:
+            self.journal.record_pending(ready, tick_id)
+        chunks = [ready[k:k + MAX_BATCH_ORDERS] for k in range(0, len(ready), MAX_BATCH_ORDERS)]
+        submitted = []
+        for chunk_results in self._pool.map(self._submit_chunk, chunks):
+            submitted.extend(chunk_results)
+        if self.journal is not None:
+            self.journal.record_results(submitted)
+        return results + submitted
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+    def _ensure_leverage(self, intents: List[OrderIntent]) -> Dict[str, str]:
+        """并发设置需要变化的杠杆，返回 {instId: 错误信息}。"""
+        todo = {}
+        for i in intents:
+            if i.leverage is None:
+                continue
+            lever = _normalize_lever(i.leverage)
+            if self._leverage_cache.get(i.inst_id) != lever:
+                todo[i.inst_id] = lever
+        if not todo:
+            return {}
+
+        errors = {}
+        items = list(todo.items())
+        for (inst_id, lever), err in zip(items, self._pool.map(lambda kv: self._set_leverage(*kv), items)):
+            if err:
+                errors[inst_id] = err
+            else:
+                self._leverage_cache[inst_id] = lever
+        return errors
+
+    def _set_leverage(self, inst_id: str, lever: str) -> str:
+        try:
+            res = self.account_api.set_leverage(instId=inst_id, lever=lever, mgnMode=self.td_mode)
+        except Exception as e:
+            return f"设置杠杆异常: {e}"
+        if res.get('code') != '0':
+            return (res.get('data') or [{}])[0].get('sMsg') or res.get('msg', '设置杠杆失败')
+        return ""
+
+    def _submit_chunk(self, chunk: List[OrderIntent]) -> List[OrderResult]:
+        try:
+            if len(chunk) == 1:
+                res = self.trade_api.place_order(**chunk[0].to_okx(self.td_mode))
+            else:
+                res = self.trade_api.place_multiple_orders([i.to_okx(self.td_mode) for i in chunk])
+        except Exception as e:
+            return [OrderResult(i, False, code="exception", msg=str(e)) for i in chunk]
+
+        data = res.get('data') or []
+        results = []
+        for idx, intent in enumerate(chunk):
+            # 批量接口按提交顺序逐笔返回 sCode；整体失败时 data 可能为空
+            item = data[idx] if idx < len(data) else {}
+            s_code = item.get('sCode', res.get('code', ''))
+            ok = s_code == '0'
+            results.append(OrderResult(intent, ok, ord_id=item.get('ordId', ''), code=s_code,
+                                       msg=item.get('sMsg') or ('' if ok else res.get('msg', ''))))
+        return results
+
+
+def _normalize_lever(lever) -> str:
+    """'5'、'5.0'、Decimal('5') 统一成 '5'，避免缓存比较误判。"""
+    try:
+        value = float(lever)
+    except (TypeError, ValueError):
+        return str(lever)
+    return f"{value:g}"
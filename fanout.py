@@ -0,0 +1,361 @@
+# fanout.py
+# 多账户扇出：一条目标检测流水线（Hyperliquid 推送流 / REST 轮询）产生"目标变化"事件，
+# 分发给每个 OKX 子账户各自的执行 worker。检测只做一次，账户数增加不会增加 Hyperliquid 请求与检测延迟。
+#
+# 用法: python fanout.py [accounts.json]
+#
+# - 每个账户一个 worker 线程：独立的 OKX 客户端与限频预算、批量执行器（杠杆缓存）、本地持仓视图（Reconciler）
+# - 投递只是替换共享的"最新事件"并唤醒所有 worker（一次加锁，微秒级），慢账户不会阻塞检测或其他账户；
+#   worker 忙时错过的中间事件直接跳过，下一轮同步到最新目标
+# - 每个账户可单独设置跟单预算、杠杆上限与单币种名义价值上限
+
+import json
+import sys
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import okx.Account as Account
+import okx.Trade as Trade
+
+from clients import okx_api
+from execution import BatchExecutor, OrderIntent
+from fastcore import InstrumentTable, plan_orders, ORDER
+from latency import recorder as latency_recorder
+from monitor import PositionStream, fetch_user_positions
+from reconcile import Reconciler
+from scheduler import BudgetedProxy, RateBudget
+from symbols import SymbolIndex
+
+ACCOUNTS_FILE = "accounts.json"
+TARGET_USER_ADDRESS = "0xc20ac4dc4188660cbf555448af52694ca62b0734"
+FLAG = "1"
+USE_WS_STREAM = True
+POLL_INTERVAL_SECONDS = 10
+FULL_RESYNC_INTERVAL_SECONDS = 300
+HTTP_POOL_SIZE = 16
+
+
+class AccountConfig:
+    """
+    一个子账户的配置。accounts.json 为列表，每项字段:
+        name, api_key, secret_key, passphrase, flag（默认 "1"）, copy_usd（跟单总名义价值）,
+        max_leverage（可选，杠杆上限）, max_coin_usd（可选，单币种名义价值上限）, enabled（默认 true）,
+        target（可选，跟随的地址，多进程模式 supervisor.py 使用）
+    """
+
+    __slots__ = ("name", "api_key", "secret_key", "passphrase", "flag", "copy_usd", "max_leverage", "max_coin_usd",
+                 "enabled", "target")
+
+    def __init__(self, name: str, api_key: str = "", secret_key: str = "", passphrase: str = "", flag: str = FLAG,
+                 copy_usd: Decimal = Decimal('10000'), max_leverage: Optional[Decimal] = None,
+                 max_coin_usd: Optional[Decimal] = None, enabled: bool = True,
+                 target: str = ""):
+        self.name = name
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.passphrase = passphrase
+        self.flag = flag
+        self.copy_usd = Decimal(copy_usd)
+        self.max_leverage = Decimal(max_leverage) if max_leverage is not None else None
+        self.max_coin_usd = Decimal(max_coin_usd) if max_coin_usd is not None else None
+        self.enabled = enabled
+        self.target = target
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "AccountConfig":
+        return cls(d["name"], d.get("api_key", ""), d.get("secret_key", ""), d.get("passphrase", ""),
+                   d.get("flag", FLAG), Decimal(str(d.get("copy_usd", "10000"))),
+                   Decimal(str(d["max_leverage"])) if d.get("max_leverage") is not None else None,
+                   Decimal(str(d["max_coin_usd"])) if d.get("max_coin_usd") is not None else None,
+                   d.get("enabled", True), d.get("target", ""))
+
+    def __repr__(self):
+        return f"AccountConfig({self.name}, ${self.copy_usd}, max_lever={self.max_leverage})"
+
+
+def load_accounts(path: str = ACCOUNTS_FILE) -> List[AccountConfig]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [a for a in (AccountConfig.from_dict(d) for d in json.load(f)) if a.enabled]
+
+
+class TargetEvent:
+    """一次目标持仓变化。detected_at / published_at 为 perf_counter 时间。"""
+
+    __slots__ = ("seq", "positions", "detected_at", "published_at")
+
+    def __init__(self, seq: int, positions: List, detected_at: float):
+        self.seq = seq
+        self.positions = positions
+        self.detected_at = detected_at
+        self.published_at = detected_at
+
+
+def okx_positions_to_dict(okx_positions_data: Dict) -> Dict[str, Dict]:
+    """与 trade.prepare_my_positions 相同：{instId: {"size": 张数, "direction_is_buy": bool}}。"""
+    my_positions = {}
+    if okx_positions_data.get('code') == '0':
+        for pos in okx_positions_data.get('data', []):
+            if pos.get('pos') and float(pos.get('pos')) != 0:
+                size = Decimal(pos['pos'])
+                my_positions[pos['instId']] = {"size": abs(size), "direction_is_buy": size > 0}
+    return my_positions
+
+
+class AccountWorker:
+    """
+    单个子账户的执行 worker，由 FanOut 启动。worker 线程等待比上次处理过的更新的事件，
+    按本账户的预算与风控设置同步持仓（与 trade.sync_positions 相同的缩放与取整规则）。
+    长时间没有新事件时，到期的全量同步按最近一次目标执行。
+    """
+
+    def __init__(self, config: AccountConfig, registry, account_api=None, trade_api=None,
+                 full_resync_interval: float = FULL_RESYNC_INTERVAL_SECONDS, max_workers: int = 8, recorder=None,
+                 symbols: Optional[SymbolIndex] = None, domain: Optional[str] = None):
+        self.config = config
+        self.registry = registry
+        # 所有账户可共用一个币种索引；未传入时币种在第一次出现时匹配
+        self.symbols = symbols if symbols is not None else SymbolIndex(registry)
+        if account_api is None or trade_api is None:
+            # 每个账户独立的限频预算（OKX 按账户计算下单与查询频率）
+            budget = RateBudget()
+            account_api = BudgetedProxy(
+                okx_api(Account.AccountAPI, config.api_key, config.secret_key, config.passphrase, config.flag,
+                        domain=domain, pool_size=HTTP_POOL_SIZE), budget,
+                {"get_positions": "okx_positions", "get_account_balance": "okx_balance",
+                 "set_leverage": "okx_set_leverage"})
+            trade_api = BudgetedProxy(
+                okx_api(Trade.TradeAPI, config.api_key, config.secret_key, config.passphrase, config.flag,
+                        domain=domain, pool_size=HTTP_POOL_SIZE), budget,
+                {"place_order": "okx_order", "place_multiple_orders": ("okx_batch_orders", lambda orders: len(orders))})
+        self.account_api = account_api
+        self.executor = BatchExecutor(account_api, trade_api, max_workers=max_workers)
+        self.reconciler = Reconciler(full_resync_interval=full_resync_interval)
+        self.recorder = recorder if recorder is not None else latency_recorder
+
+        self.hub: Optional["FanOut"] = None
+        self._done = threading.Condition()
+        self._last_targets: Optional[List] = None
+        self._thread: Optional[threading.Thread] = None
+        self.done_seq = 0
+        self.events = 0
+        self.coalesced = 0
+        self.orders = 0
+        self.failures = 0
+
+    def wait_done(self, seq: int, timeout: Optional[float] = None) -> bool:
+        """等待本账户处理完编号不小于 seq 的事件。"""
+        with self._done:
+            return self._done.wait_for(lambda: self.done_seq >= seq, timeout)
+
+    # ---------- 生命周期 ----------
+    def start(self, hub: "FanOut"):
+        self.hub = hub
+        self._thread = threading.Thread(target=self._run, name=f"fanout-{self.config.name}", daemon=True)
+        self._thread.start()
+
+    def join(self, timeout: float = 10):
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self.executor.close()
+
+    def _run(self):
+        interval = self.reconciler.full_resync_interval
+        while True:
+            event = self.hub.next_event(self.done_seq, timeout=interval)
+            if self.hub.stopped:
+                return
+            if event is None:
+                # 超时：目标没有变化，但到了定期全量同步的时间
+                if self._last_targets is not None and self.reconciler.needs_full_resync():
+                    self._sync_safely(self._last_targets)
+                continue
+            started = time.perf_counter()
+            self.recorder.record("fanout_dispatch", started - event.published_at)
+            self.events += 1
+            if self.done_seq:
+                self.coalesced += event.seq - self.done_seq - 1
+            self._sync_safely(event.positions)
+            finished = time.perf_counter()
+            self.recorder.record("fanout_sync", finished - started)
+            self.recorder.record("fanout_detect_to_done", finished - event.detected_at)
+            with self._done:
+                self.done_seq = event.seq
+                self._done.notify_all()
+
+    def _sync_safely(self, targets: List):
+        try:
+            self.sync(targets)
+        except Exception as e:
+            self.failures += 1
+            self.reconciler.mark_dirty(f"同步异常 {e}")
+            print(f"  - ❌ [{self.config.name}] 同步失败: {type(e).__name__} - {e}")
+
+    # ---------- 同步 ----------
+    def sync(self, targets: List) -> List:
+        """把本账户的OKX持仓同步到目标，返回 OrderResult 列表。"""
+        cfg, reconciler = self.config, self.reconciler
+        self._last_targets = targets
+        full_sync = reconciler.needs_full_resync()
+        if full_sync:
+            res = self.account_api.get_positions()
+            if res.get('code') != '0':
+                raise RuntimeError(f"获取持仓失败: {res.get('code')} {res.get('msg')}")
+            self.executor.seed_leverage(res)
+            reconciler.reset(okx_positions_to_dict(res))
+        my_positions = reconciler.positions
+
+        total_usd = sum((p['value_usd'] for p in targets), Decimal('0'))
+        raw_factor = cfg.copy_usd / total_usd if total_usd > 0 else Decimal('0')
+        scaling_factor = reconciler.stable_scaling_factor(raw_factor, force=full_sync)
+        scaled = {}
+        for p in targets:
+            mapping = self.symbols.resolve(p['coin'])
+            if mapping is None:
+                continue
+            # 换算为OKX一侧的币数与单价（kPEPE → PEPE）
+            size = p['size'] * mapping.multiplier * scaling_factor
+            mid = p.get('mid') / mapping.multiplier if p.get('mid') else None
+            if cfg.max_coin_usd is not None and mid and size * mid > cfg.max_coin_usd:
+                size = cfg.max_coin_usd / mid
+            leverage = Decimal(str(p.get('leverage') or '10'))
+            if cfg.max_leverage is not None and leverage > cfg.max_leverage:
+                leverage = cfg.max_leverage
+            scaled[mapping.inst_id] = {"size": size, "direction_is_buy": p['direction_is_buy'],
+                                       "leverage": f"{leverage.normalize():f}", "mid": mid}
+
+        inst_ids = list(set(scaled) | set(my_positions) if full_sync else reconciler.changed_inst_ids(scaled))
+        target_coins, my_lots = [], []
+        for inst_id in inst_ids:
+            t, m = scaled.get(inst_id), my_positions.get(inst_id)
+            target_coins.append((t['size'] if t['direction_is_buy'] else -t['size']) if t else Decimal('0'))
+            my_lots.append((m['size'] if m['direction_is_buy'] else -m['size']) if m else Decimal('0'))
+        plan = plan_orders(InstrumentTable.from_registry(self.registry), inst_ids, target_coins, my_lots)
+
+        intents = []
+        for k, inst_id in enumerate(inst_ids):
+            if plan.status[k] != ORDER:
+                continue
+            t = scaled.get(inst_id)
+            intents.append(OrderIntent(inst_id, "buy" if plan.side[k] > 0 else "sell", plan.size_str(k),
+                                       leverage=t['leverage'] if t else None))
+        results = self.executor.execute(intents)
+        self.orders += len(results)
+        failed = [r for r in results if not r.ok]
+        if failed:
+            print(f"  - ❌ [{cfg.name}] {len(failed)} 笔订单失败: "
+                  + ", ".join(f"{r.intent.inst_id} {r.code} {r.msg}" for r in failed[:5]))
+        reconciler.commit(scaled, results)
+        return results
+
+
+class FanOut:
+    """
+    把目标变化事件分发给所有账户 worker。只保存最新的一个事件：
+    publish() 替换它并唤醒全部 worker，耗时与账户数基本无关；每个 worker 处理比自己上次处理过的更新的事件。
+    """
+
+    def __init__(self, workers: Iterable[AccountWorker], recorder=None):
+        self.workers = list(workers)
+        self.recorder = recorder if recorder is not None else latency_recorder
+        self.stopped = False
+        self._cond = threading.Condition()
+        self._latest: Optional[TargetEvent] = None
+
+    def start(self):
+        for w in self.workers:
+            w.start(self)
+
+    def stop(self):
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+        for w in self.workers:
+            w.join()
+
+    def publish(self, positions: List, detected_at: Optional[float] = None) -> TargetEvent:
+        """投递一次目标变化（不等待执行），返回事件；detected_at 为检测到变化时的 perf_counter 时间。"""
+        started = time.perf_counter()
+        with self._cond:
+            seq = self._latest.seq + 1 if self._latest is not None else 1
+            event = TargetEvent(seq, positions, detected_at if detected_at is not None else started)
+            event.published_at = started
+            self._latest = event
+            self._cond.notify_all()
+        self.recorder.record("fanout_publish", time.perf_counter() - started)
+        return event
+
+    def next_event(self, after_seq: int, timeout: Optional[float] = None) -> Optional[TargetEvent]:
+        """等待编号大于 after_seq 的事件；超时或已停止时返回 None。"""
+        with self._cond:
+            ready = self._cond.wait_for(
+                lambda: self.stopped or (self._latest is not None and self._latest.seq > after_seq), timeout)
+            return self._latest if ready and not self.stopped else None
+
+    def wait_all(self, seq: int, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for w in self.workers:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not w.wait_done(seq, remaining):
+                return False
+        return True
+
+    def stats(self) -> List[Dict]:
+        return [{"name": w.config.name, "events": w.events, "coalesced": w.coalesced, "orders": w.orders,
+                 "failures": w.failures} for w in self.workers]
+
+    def run(self, address: str, use_ws: bool = USE_WS_STREAM, poll_interval: float = POLL_INTERVAL_SECONDS):
+        """检测循环：目标持仓（按币种的数量与方向）变化时投递事件。"""
+        stream = None
+        if use_ws:
+            stream = PositionStream(address)
+            stream.start()
+        last_simplified = None
+        # 上一次处理的推送持仓簿版本，分发事件期间到达的推送不会等到超时才被处理
+        version = 0
+        try:
+            while True:
+                try:
+                    if stream is not None and stream.is_live():
+                        version, positions = stream.versioned_snapshot()
+                    else:
+                        positions = fetch_user_positions(address) or []
+                    detected_at = time.perf_counter()
+                    simplified = {p['coin']: (p['size'], p['direction_is_buy']) for p in positions}
+                    if simplified != last_simplified:
+                        event = self.publish(positions, detected_at)
+                        print(f"\n🔔 目标仓位变化（事件 {event.seq}，{len(positions)} 个仓位），"
+                              f"已分发给 {len(self.workers)} 个账户。")
+                        last_simplified = simplified
+                except Exception as e:
+                    print(f"\n💥 检测循环发生错误: {type(e).__name__} - {e}")
+                if stream is not None and stream.is_live():
+                    stream.wait_for_change(timeout=poll_interval, since=version)
+                else:
+                    time.sleep(poll_interval)
+        finally:
+            if stream is not None:
+                stream.stop()
+
+
+if __name__ == "__main__":
+    from instruments import InstrumentRegistry
+
+    accounts = load_accounts(sys.argv[1] if len(sys.argv) > 1 else ACCOUNTS_FILE)
+    registry = InstrumentRegistry(flag=FLAG).load()
+    registry.start_background_refresh()
+    symbols = SymbolIndex(registry).build()
+    fanout = FanOut(AccountWorker(a, registry, symbols=symbols) for a in accounts)
+    fanout.start()
+    print(f"🎉 多账户扇出启动：跟踪 {TARGET_USER_ADDRESS}，分发给 {len(accounts)} 个账户: "
+          f"{', '.join(a.name for a in accounts)}")
+    latency_recorder.start_reporter(300)
+    try:
+        fanout.run(TARGET_USER_ADDRESS)
+    except KeyboardInterrupt:
+        print("\n🛑 程序被手动中断 (Ctrl+C)，正在退出...")
+    finally:
+        fanout.stop()
+        for s in fanout.stats():
+            print(f"  - {s['name']}: 事件 {s['events']}（合并 {s['coalesced']}），订单 {s['orders']}，失败 {s['failures']}")
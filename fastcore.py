@@ -0,0 +1,214 @@
+# fastcore.py
+# 下单数量计算的向量化快速路径：合约参数按合约编号存成 NumPy 数组，一次批量算出全部合约的目标张数、
+# 张数差和取整后的下单张数。结果与 Decimal 版本（decimal_order）完全一致：
+# float64 计算的结果离取整边界或 minSz 边界太近时，这些行改用 Decimal 重新计算。
+
+import weakref
+from decimal import Decimal, ROUND_DOWN
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 每个合约的处理结果
+ORDER = 0       # 需要下单
+SYNCED = 1      # 张数差小于 minSz，视为已同步
+BELOW_MIN = 2   # 按 lotSz 向下取整后小于 minSz
+NO_SPEC = 3     # 没有该合约或参数不完整
+NOT_LIVE = 4    # 合约不是 live 状态
+
+# lotSz / minSz 的定点数精度（OKX 的参数不超过 8 位小数）
+FIXED_POINT_SCALE = 10 ** 8
+_SCALE_DEC = Decimal(FIXED_POINT_SCALE)
+
+# 输入转换为 float64 以及几次运算累积的相对误差不超过约 1e-15，离边界的相对距离小于该值时改用 Decimal，
+# 留出三个数量级的余量
+BOUNDARY_TOLERANCE = 1e-12
+# 步数超过 2^53 时 float64 不能精确表示整数
+MAX_FAST_STEPS = float(2 ** 53)
+# 合约数少于该值时逐个 Decimal 计算更快（数组转换的固定开销约 70us，Decimal 每个合约约 4us，实测交点在 30~40 之间）
+FAST_PATH_MIN_INSTRUMENTS = 32
+
+# InstrumentTable.from_registry 的缓存: 注册表 -> (建表时的参数字典, InstrumentTable)，注册表被回收时自动移除
+_registry_tables: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def format_size(steps: int, lot_sz: Decimal) -> str:
+    """下单张数 = steps × lotSz，输出不带指数的定点表示（避免出现 '1.0E+2' 这类字符串）。"""
+    return f"{Decimal(steps) * lot_sz:f}"
+
+
+def decimal_order(spec, target_coins: Decimal, my_lots: Decimal) -> Tuple[int, int, int]:
+    """
+    参考实现（与原来 sync_positions 中逐个合约的 Decimal 计算相同）。
+    target_coins 为缩放后的带符号目标币数量，my_lots 为我的带符号张数。
+    返回 (状态, 方向 +1/-1/0, 下单张数 = 步数 × lotSz 中的步数)。
+    """
+    if not spec or spec.ct_val <= 0 or spec.lot_sz <= 0:
+        return NO_SPEC, 0, 0
+    if spec.state != "live":
+        return NOT_LIVE, 0, 0
+    target_lots = target_coins.copy_abs() / spec.ct_val
+    if target_coins < 0:
+        target_lots = -target_lots
+    diff = target_lots - my_lots
+    if abs(diff) < spec.min_sz:
+        return SYNCED, 0, 0
+    side = 1 if diff > 0 else -1
+    steps = int((abs(diff) / spec.lot_sz).to_integral_value(rounding=ROUND_DOWN))
+    if Decimal(steps) * spec.lot_sz < spec.min_sz:
+        return BELOW_MIN, side, steps
+    return ORDER, side, steps
+
+
+def _fixed(value: Decimal) -> Optional[int]:
+    scaled = value * _SCALE_DEC
+    return int(scaled) if scaled == scaled.to_integral_value() else None
+
+
+class InstrumentTable:
+    """
+    合约参数的数组视图，行号即合约编号；最后一行是"未知合约"的哨兵（状态 NO_SPEC）。
+    ct_val / lot / min_sz 为 float64；min_steps 为满足 minSz 所需的最少步数（由 ×1e8 的定点数精确算出），
+    取整后的步数与它比较即可精确判断是否小于 minSz。
+    """
+
+    def __init__(self, specs: Dict[str, object]):
+        self.inst_ids: List[str] = list(specs)
+        self.index: Dict[str, int] = {inst_id: i for i, inst_id in enumerate(self.inst_ids)}
+        self.specs = [specs[i] for i in self.inst_ids] + [None]
+        self.unknown = len(self.inst_ids)
+        n = len(self.specs)
+        self.ct_val = np.ones(n)
+        self.lot = np.ones(n)
+        self.min_sz = np.zeros(n)
+        self.min_steps = np.zeros(n, dtype=np.int64)
+        self.status = np.full(n, ORDER, dtype=np.int8)
+        # lotSz / minSz 无法用 8 位小数精确表示的合约总是走 Decimal
+        self.exact = np.ones(n, dtype=bool)
+        for i, spec in enumerate(self.specs):
+            if not spec or spec.ct_val <= 0 or spec.lot_sz <= 0:
+                self.status[i] = NO_SPEC
+                continue
+            if spec.state != "live":
+                self.status[i] = NOT_LIVE
+            self.ct_val[i] = float(spec.ct_val)
+            self.lot[i] = float(spec.lot_sz)
+            self.min_sz[i] = float(spec.min_sz)
+            lot_fp, min_fp = _fixed(spec.lot_sz), _fixed(spec.min_sz)
+            if lot_fp is None or min_fp is None:
+                self.exact[i] = False
+            else:
+                # steps × lotSz < minSz  ⇔  steps < ceil(minSz / lotSz)
+                self.min_steps[i] = -(-min_fp // lot_fp)
+
+    @classmethod
+    def from_registry(cls, registry) -> "InstrumentTable":
+        """按注册表当前的参数字典缓存；注册表刷新（整体替换字典）后自动重建。"""
+        specs = registry.specs()
+        cached = _registry_tables.get(registry)
+        if cached is None or cached[0] is not specs:
+            cached = (specs, cls(specs))
+            _registry_tables[registry] = cached
+        return cached[1]
+
+    def lookup(self, inst_ids: Iterable[str]) -> np.ndarray:
+        """合约 ID → 行号，未知合约指向哨兵行。"""
+        index, unknown = self.index, self.unknown
+        return np.array([index.get(i, unknown) for i in inst_ids], dtype=np.int64)
+
+
+class OrderPlan:
+    """plan_orders 的结果，各数组（逐个 Decimal 计算时为列表）与输入的合约顺序一致。"""
+
+    __slots__ = ("inst_ids", "rows", "status", "side", "steps", "target_lots", "my_lots", "fallbacks", "_table")
+
+    def __init__(self, table: InstrumentTable, inst_ids, rows, status, side, steps, target_lots, my_lots,
+                 fallbacks):
+        self._table = table
+        self.inst_ids = inst_ids
+        self.rows = rows
+        self.status = status
+        self.side = side
+        self.steps = steps
+        self.target_lots = target_lots
+        self.my_lots = my_lots
+        self.fallbacks = fallbacks
+
+    def spec(self, k: int):
+        return self._table.specs[self.rows[k]]
+
+    def size_str(self, k: int) -> str:
+        return format_size(int(self.steps[k]), self.spec(k).lot_sz)
+
+
+def plan_orders(table: InstrumentTable, inst_ids: Sequence[str], target_coins: Sequence[Decimal],
+                my_lots: Sequence[Decimal]) -> OrderPlan:
+    """
+    批量计算下单数量。target_coins 为缩放后的带符号目标币数量，my_lots 为我的带符号张数（Decimal）。
+    合约数少于 FAST_PATH_MIN_INSTRUMENTS 时逐个用 decimal_order 计算，结果格式相同。
+    """
+    n = len(inst_ids)
+    if n < FAST_PATH_MIN_INSTRUMENTS:
+        return _plan_decimal(table, inst_ids, target_coins, my_lots)
+    t_coins = np.fromiter(map(float, target_coins), dtype=np.float64, count=n)
+    mine = np.fromiter(map(float, my_lots), dtype=np.float64, count=n)
+    plan = plan_orders_array(table, table.lookup(inst_ids), t_coins, mine,
+                             lambda k: (Decimal(target_coins[k]), Decimal(my_lots[k])))
+    plan.inst_ids = list(inst_ids)
+    return plan
+
+
+def _plan_decimal(table: InstrumentTable, inst_ids: Sequence[str], target_coins: Sequence[Decimal],
+                  my_lots: Sequence[Decimal]) -> OrderPlan:
+    """逐个合约调用 decimal_order；合约很少时构造数组的开销比计算本身还大，结果各字段直接用列表（数量为 Decimal）。"""
+    index, unknown, specs = table.index, table.unknown, table.specs
+    rows = [index.get(i, unknown) for i in inst_ids]
+    status, side, steps = [], [], []
+    for row, target, mine in zip(rows, target_coins, my_lots):
+        st, sd, sp = decimal_order(specs[row], target, mine)
+        status.append(st)
+        side.append(sd)
+        steps.append(sp)
+    target_lots = [t / specs[row].ct_val if st != NO_SPEC else t for row, t, st in zip(rows, target_coins, status)]
+    return OrderPlan(table, list(inst_ids), rows, status, side, steps, target_lots, list(my_lots), 0)
+
+
+def plan_orders_array(table: InstrumentTable, rows: np.ndarray, t_coins: np.ndarray, mine: np.ndarray,
+                      exact: Callable[[int], Tuple[Decimal, Decimal]]) -> OrderPlan:
+    """
+    数组版本：rows 为合约行号，t_coins / mine 为 float64 数组；exact(k) 返回第 k 行的精确 Decimal 输入，
+    只在该行落在边界附近时才会被调用。持仓簿一直以数组形式维护时可直接使用，省去逐个转换的开销。
+    """
+    status = table.status[rows].copy()
+    active = status == ORDER
+    lot, min_sz = table.lot[rows], table.min_sz[rows]
+
+    target_lots = t_coins / table.ct_val[rows]
+    diff = target_lots - mine
+    mag = np.abs(diff)
+    scale = np.abs(target_lots) + np.abs(mine)
+    q = mag / lot
+    steps_f = np.floor(q)
+    frac = q - steps_f
+    synced = mag < min_sz
+
+    # 离 minSz 比较边界太近，或（需要下单时）离取整边界太近、数值过大的行用 Decimal 重新计算
+    near_min = np.abs(mag - min_sz) <= BOUNDARY_TOLERANCE * (scale + min_sz)
+    tol_q = BOUNDARY_TOLERANCE * (scale / lot + 1)
+    near_step = ~synced & ((frac <= tol_q) | (1 - frac <= tol_q) | (q >= MAX_FAST_STEPS))
+    near = active & (near_min | near_step | ~table.exact[rows])
+
+    steps = np.where(active & ~synced & ~near, steps_f, 0).astype(np.int64)
+    below = steps < table.min_steps[rows]
+    status[active & synced] = SYNCED
+    status[active & ~synced & below] = BELOW_MIN
+    side = np.where(active & ~synced, np.sign(diff), 0).astype(np.int8)
+
+    fallbacks = np.flatnonzero(near)
+    for k in fallbacks:
+        st, sd, sp = decimal_order(table.specs[rows[k]], *exact(k))
+        if sp > np.iinfo(np.int64).max and steps.dtype != object:
+            # 只有极端的数量才会超出 int64，此时退化为 Python 整数数组
+            steps = steps.astype(object)
+        status[k], side[k], steps[k] = st, sd, sp
+    return OrderPlan(table, None, rows, status, side, steps, target_lots, mine, len(fallbacks))
@@ -0,0 +1,160 @@
+# instruments.py
+# OKX 永续合约参数注册表：启动时一次性拉取全部 SWAP 合约，落盘缓存，供 sync_positions O(1) 查询。
+
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Optional
+
+from clients import okx_api
+
+
+class InstrumentSpec:
+    """单个合约的下单参数，数值均为 Decimal。"""
+
+    __slots__ = ("inst_id", "ct_val", "lot_sz", "min_sz", "tick_sz", "state")
+
+    def __init__(self, inst_id: str, ct_val: Decimal, lot_sz: Decimal, min_sz: Decimal,
+                 tick_sz: Decimal, state: str = "live"):
+        self.inst_id = inst_id
+        self.ct_val = ct_val    # 合约面值：1张合约 = 多少币
+        self.lot_sz = lot_sz    # 下单张数的步进值
+        self.min_sz = min_sz    # 最小下单张数
+        self.tick_sz = tick_sz  # 价格精度
+        self.state = state
+
+    @classmethod
+    def from_okx(cls, item: Dict) -> "InstrumentSpec":
+        return cls(
+            inst_id=item["instId"],
+            ct_val=Decimal(item.get("ctVal") or "0"),
+            lot_sz=Decimal(item.get("lotSz") or "0"),
+            min_sz=Decimal(item.get("minSz") or "0"),
+            tick_sz=Decimal(item.get("tickSz") or "0"),
+            state=item.get("state", "live"),
+        )
+
+    def to_dict(self) -> Dict:
+        return {"instId": self.inst_id, "ctVal": str(self.ct_val), "lotSz": str(self.lot_sz),
+                "minSz": str(self.min_sz), "tickSz": str(self.tick_sz), "state": self.state}
+
+    def __repr__(self):
+        return (f"InstrumentSpec({self.inst_id}, ctVal={self.ct_val}, lotSz={self.lot_sz}, "
+                f"minSz={self.min_sz}, tickSz={self.tick_sz}, state={self.state})")
+
+
+class InstrumentRegistry:
+    """
+    全部 SWAP 合约参数的内存索引。
+
+    - load(): 本地缓存未过期时直接读盘，不访问 API；否则批量拉取并写回缓存。
+    - start_background_refresh(): 后台线程定期刷新，新上线的合约无需重启即可交易。
+    刷新时整体替换内部字典，读取方无需加锁。
+    """
+
+    def __init__(self, flag: str = "1", cache_file: Optional[str] = None,
+                 ttl_seconds: float = 6 * 3600, refresh_interval: float = 1800, public_api=None):
+        self.flag = flag
+        # 模拟盘与实盘的合约列表不同，分开缓存
+        self.cache_file = cache_file or f"instruments_cache_{flag}.json"
+        self.ttl_seconds = ttl_seconds
+        self.refresh_interval = refresh_interval
+        self.public_api = public_api
+        self._specs: Dict[str, InstrumentSpec] = {}
+        self._loaded_at = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self, inst_id: str) -> Optional[InstrumentSpec]:
+        return self._specs.get(inst_id)
+
+    def specs(self) -> Dict[str, InstrumentSpec]:
+        """当前的全部合约参数 {instId: InstrumentSpec}，调用方不得修改。刷新时整体替换，可按对象身份判断是否已刷新。"""
+        return self._specs
+
+    def __contains__(self, inst_id: str) -> bool:
+        return inst_id in self._specs
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def load(self) -> "InstrumentRegistry":
+        """优先使用未过期的本地缓存；缓存过期或不存在时访问 API，API 失败时退回旧缓存。"""
+        cached = self._read_cache()
+        if cached is not None and time.time() - cached[0] < self.ttl_seconds:
+            self._specs, self._loaded_at = cached[1], cached[0]
+            print(f"✅ 从本地缓存加载 {len(self._specs)} 个 SWAP 合约参数。")
+            return self
+        try:
+            self.refresh()
+            print(f"✅ 从 OKX 拉取 {len(self._specs)} 个 SWAP 合约参数并写入缓存。")
+        except Exception as e:
+            if cached is None:
+                raise
+            self._specs, self._loaded_at = cached[1], cached[0]
+            print(f"  - ⚠️ 拉取合约参数失败，使用过期的本地缓存 ({len(self._specs)} 个): {e}")
+        return self
+
+    def refresh(self):
+        """一次批量请求拉取全部 SWAP 合约，原子替换内存索引并写回缓存。"""
+        if self.public_api is None:
+            # 缓存未过期时不需要 SDK，用到时才导入
+            import okx.PublicData as PublicData
+
+            self.public_api = okx_api(PublicData.PublicAPI, flag=self.flag)
+        result = self.public_api.get_instruments(instType="SWAP")
+        if result.get('code') != '0' or not result.get('data'):
+            raise RuntimeError(f"获取合约列表失败: {result.get('code')} {result.get('msg')}")
+        specs = {}
+        for item in result['data']:
+            try:
+                spec = InstrumentSpec.from_okx(item)
+            except Exception:
+                continue
+            specs[spec.inst_id] = spec
+        added = set(specs) - set(self._specs)
+        if self._specs and added:
+            print(f"🆕 发现新上线合约: {', '.join(sorted(added))}")
+        self._specs = specs
+        self._loaded_at = time.time()
+        self._write_cache()
+
+    def start_background_refresh(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._refresh_loop, name="instrument-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"  - ⚠️ 后台刷新合约参数失败，继续使用当前数据: {e}")
+
+    def _read_cache(self):
+        if not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            specs = {item["instId"]: InstrumentSpec.from_okx(item) for item in data["instruments"]}
+            return data["saved_at"], specs
+        except Exception as e:
+            print(f"  - ⚠️ 合约参数缓存文件损坏，忽略: {e}")
+            return None
+
+    def _write_cache(self):
+        data = {"saved_at": self._loaded_at, "instruments": [s.to_dict() for s in self._specs.values()]}
+        tmp_file = self.cache_file + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            print(f"  - ⚠️ 写入合约参数缓存失败: {e}")
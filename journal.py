@@ -0,0 +1,231 @@
+# journal.py
+# 订单预写日志（SQLite WAL）：每笔订单在发送前先落盘，收到回执 / 推送后更新状态。
+#
+# - 每次 sync_positions 是一个 tick，记录当时的目标持仓快照；订单的 clOrdId 由 日志纪元 + tick 编号 + instId 确定，
+#   同一 tick 内同一合约的订单 ID 不会变，重启后可以按 clOrdId 向 OKX 查询是否真的下单成功
+# - 重启时 recover() 查询所有尚未确认最终状态的订单（挂单会被撤销），再按真实持仓做一次全量同步，不会重复下单
+# - 快速重启：上一次的目标快照缓存在日志中，不必等待 REST 拉取就能进入主循环
+#
+# 进程崩溃不会丢失已提交的事务（WAL + synchronous=NORMAL 只在断电时可能丢失最后几笔）。
+
+import json
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from monitor import PositionRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ticks (
+    tick_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_ms INTEGER NOT NULL,
+    targets TEXT NOT NULL,
+    committed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS orders (
+    cl_ord_id TEXT PRIMARY KEY,
+    tick_id INTEGER,
+    inst_id TEXT NOT NULL,
+    side TEXT NOT NULL,
+    sz TEXT NOT NULL,
+    ord_type TEXT NOT NULL,
+    px TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL,
+    ord_id TEXT NOT NULL DEFAULT '',
+    acc_fill_sz TEXT NOT NULL DEFAULT '0',
+    code TEXT NOT NULL DEFAULT '',
+    msg TEXT NOT NULL DEFAULT '',
+    created_ms INTEGER NOT NULL,
+    updated_ms INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_state ON orders(state);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# 订单状态: pending 已写日志、尚未收到回执；acked 交易所已接受；其余为最终状态
+OPEN_STATES = ("pending", "acked", "live", "partially_filled")
+# OKX: 订单不存在
+ORDER_NOT_FOUND_CODES = {"51603"}
+
+# 已结束的订单与旧 tick 保留的天数
+RETENTION_DAYS = 7
+# 每记录这么多个 tick 清理一次过期记录（长时间运行的进程不会只在启动时清理）
+PRUNE_EVERY_TICKS = 1000
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class OrderJournal:
+    """
+    订单日志。所有方法线程安全（拆单执行的子订单在后台线程中写入）。
+    """
+
+    def __init__(self, path: str = "journal.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # 日志纪元：日志文件被删除重建后，新的 clOrdId 不会与之前的订单重复
+        self.epoch = self.get("epoch")
+        if self.epoch is None:
+            self.epoch = secrets.token_hex(2)
+            self.set("epoch", self.epoch)
+
+    # ---------- 键值缓存 ----------
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO kv(key, value) VALUES (?, ?)", (key, value))
+
+    # ---------- tick ----------
+    def begin_tick(self, target_positions: Iterable) -> int:
+        """记录本轮的目标持仓快照，返回 tick 编号。"""
+        targets = json.dumps([_position_to_json(p) for p in target_positions], separators=(",", ":"))
+        with self._lock:
+            tick_id = self._db.execute("INSERT INTO ticks(created_ms, targets) VALUES (?, ?)",
+                                       (_now_ms(), targets)).lastrowid
+        if tick_id % PRUNE_EVERY_TICKS == 0:
+            self.prune()
+        return tick_id
+
+    def end_tick(self, tick_id: int):
+        with self._lock:
+            self._db.execute("UPDATE ticks SET committed = 1 WHERE tick_id = ?", (tick_id,))
+
+    def last_targets(self) -> Optional[Tuple[int, float, bool, List[PositionRecord]]]:
+        """最近一个 tick 的 (编号, 时间戳秒, 是否完成, 目标持仓)，没有记录时返回 None。"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tick_id, created_ms, committed, targets FROM ticks ORDER BY tick_id DESC LIMIT 1").fetchone()
+        if row is None:
+            return None
+        tick_id, created_ms, committed, targets = row
+        return tick_id, created_ms / 1000, bool(committed), [_position_from_json(p) for p in json.loads(targets)]
+
+    def cl_ord_id(self, tick_id: int, inst_id: str) -> str:
+        """由 tick 编号与 instId 确定的 clOrdId（OKX 要求 1-32 位字母数字）。"""
+        return f"t{self.epoch}{tick_id}i{re.sub('[^A-Za-z0-9]', '', inst_id)}"[:32]
+
+    # ---------- 订单 ----------
+    def record_pending(self, intents: Iterable, tick_id: Optional[int] = None):
+        """发送前写入（没有 clOrdId 的订单无法事后查询，不记录）。"""
+        now = _now_ms()
+        rows = [(i.cl_ord_id, tick_id, i.inst_id, i.side, i.sz, i.ord_type, i.px, "pending", now, now)
+                for i in intents if i.cl_ord_id]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO orders(cl_ord_id, tick_id, inst_id, side, sz, ord_type, px, state, "
+                "created_ms, updated_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def record_results(self, results: Iterable):
+        """根据下单回执更新：成功为 acked，失败为 rejected。"""
+        now = _now_ms()
+        rows = [("acked" if r.ok else "rejected", r.ord_id, r.code, r.msg, now, r.intent.cl_ord_id)
+                for r in results if r.intent.cl_ord_id]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "UPDATE orders SET state = ?, ord_id = ?, code = ?, msg = ?, updated_ms = ? "
+                "WHERE cl_ord_id = ? AND state IN ('pending', 'acked')", rows)
+
+    def on_order_update(self, order: Dict):
+        """orders 频道推送 / get_order 结果：按 clOrdId 更新状态与累计成交。"""
+        cl_ord_id = order.get("clOrdId")
+        if not cl_ord_id:
+            return
+        with self._lock:
+            self._db.execute(
+                "UPDATE orders SET state = ?, ord_id = ?, acc_fill_sz = ?, updated_ms = ? WHERE cl_ord_id = ?",
+                (order.get("state") or "acked", order.get("ordId") or "", order.get("accFillSz") or "0",
+                 _now_ms(), cl_ord_id))
+
+    def in_flight(self) -> List[Dict]:
+        """尚未确认最终状态的订单。"""
+        with self._lock:
+            cur = self._db.execute(
+                f"SELECT cl_ord_id, inst_id, side, sz, ord_type, state FROM orders "
+                f"WHERE state IN ({','.join('?' * len(OPEN_STATES))})", OPEN_STATES)
+            names = [c[0] for c in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def recover(self, trade_api, max_workers: int = 8) -> List[Dict]:
+        """
+        重启时按 clOrdId 向 OKX 查询所有未结束的订单：
+        已成交 / 已撤销的更新为最终状态；仍在挂单的撤销（原来的执行计划已随进程结束）；
+        交易所查不到的标记为 not_found（请求没有到达交易所）。返回处理过的订单。
+        """
+        pending = self.in_flight()
+        if not pending:
+            return []
+
+        def resolve(row: Dict) -> Dict:
+            try:
+                res = trade_api.get_order(instId=row["inst_id"], clOrdId=row["cl_ord_id"])
+            except Exception as e:
+                row["result"] = f"查询失败: {e}"
+                return row
+            if res.get("code") == "0" and res.get("data"):
+                order = res["data"][0]
+                if order.get("state") in ("live", "partially_filled"):
+                    trade_api.cancel_order(instId=row["inst_id"], clOrdId=row["cl_ord_id"])
+                    order = dict(order, state="canceled")
+                self.on_order_update(dict(order, clOrdId=row["cl_ord_id"]))
+                row["result"] = order.get("state")
+            elif str(res.get("code")) in ORDER_NOT_FOUND_CODES or (
+                    res.get("data") and str(res["data"][0].get("sCode")) in ORDER_NOT_FOUND_CODES):
+                self._set_state(row["cl_ord_id"], "not_found")
+                row["result"] = "not_found"
+            else:
+                row["result"] = f"查询失败: {res.get('code')} {res.get('msg')}"
+            return row
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(resolve, pending))
+
+    def prune(self, retention_days: float = RETENTION_DAYS):
+        """删除过期的已结束订单与旧 tick（保留最近一个 tick 作为快速重启的快照）。"""
+        cutoff = _now_ms() - int(retention_days * 86_400_000)
+        with self._lock:
+            self._db.execute(
+                f"DELETE FROM orders WHERE updated_ms < ? AND state NOT IN ({','.join('?' * len(OPEN_STATES))})",
+                (cutoff, *OPEN_STATES))
+            self._db.execute("DELETE FROM ticks WHERE created_ms < ? AND tick_id < (SELECT MAX(tick_id) FROM ticks)",
+                             (cutoff,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _set_state(self, cl_ord_id: str, state: str):
+        with self._lock:
+            self._db.execute("UPDATE orders SET state = ?, updated_ms = ? WHERE cl_ord_id = ?",
+                             (state, _now_ms(), cl_ord_id))
+
+
+def _position_to_json(p) -> Dict:
+    mid = p.get('mid') or (p['value_usd'] / p['size'] if p['size'] else 0)
+    return {"coin": p['coin'], "buy": p['direction_is_buy'], "lev": str(p.get('leverage') or '0'),
+            "size": str(p['size']), "mid": f"{Decimal(mid):f}"}
+
+
+def _position_from_json(d: Dict) -> PositionRecord:
+    return PositionRecord(d["coin"], d["buy"], Decimal(d["lev"]), Decimal(d["size"]), Decimal(d["mid"]))
@@ -0,0 +1,312 @@
+# latency.py
+# 热路径延迟埋点：分阶段的滚动直方图（HDR 风格的对数分桶）、下单全链路时间线、
+# 定期文本汇总以及本地 Prometheus 文本格式的 /metrics 接口。
+
+import functools
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+# 每个 2 的幂区间内再细分 2^SUB_BUCKET_BITS 个子桶，相对误差约 1/32
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# 全链路时间线的事件顺序：发现目标变化 → 订单已提交 → 交易所已确认 → 成交已确认
+TRACE_EVENTS = ("observed", "submitted", "acked", "filled")
+# 市价单的 filled 推送经常比下单接口的返回更早到达：暂存最近这么多笔尚未登记的成交，登记时再匹配
+EARLY_FILL_BUFFER = 2000
+
+
+def _bucket_index(value_us: int) -> int:
+    if value_us < SUB_BUCKETS:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS - 1
+    return ((shift + 1) << SUB_BUCKET_BITS) + ((value_us >> shift) - SUB_BUCKETS)
+
+
+def _bucket_upper_us(index: int) -> int:
+    """桶的上界（微秒），分位数按上界报告，偏保守。"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    return ((SUB_BUCKETS + (index & (SUB_BUCKETS - 1)) + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """以微秒为单位的对数-线性分桶直方图，记录为 O(1)，内存只与数值范围的位数有关。"""
+
+    __slots__ = ("counts", "count", "total_us", "max_us")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def record(self, seconds: float):
+        value_us = max(0, int(seconds * 1_000_000))
+        idx = _bucket_index(value_us)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.count += 1
+        self.total_us += value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def merge(self, other: "LatencyHistogram"):
+        for idx, n in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + n
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile_ms(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(q / 100 * self.count + 0.5))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return min(_bucket_upper_us(idx), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def mean_ms(self) -> float:
+        return self.total_us / self.count / 1000 if self.count else 0.0
+
+
+class LatencyRecorder:
+    """
+    分阶段延迟记录器。
+
+    每个阶段保存最近 windows 个时间窗口（每个 window_seconds 秒）的直方图，汇总时合并，即滚动统计。
+    记录只做一次字典查找和整数运算，可放在热路径上。
+    """
+
+    def __init__(self, window_seconds: float = 60, windows: int = 5):
+        self.window_seconds = window_seconds
+        self.windows = windows
+        self._lock = threading.Lock()
+        self._stages: Dict[str, List[LatencyHistogram]] = {}
+        self._window_start = time.monotonic()
+        self._trace_ids = itertools.count(1)
+        self._traces: Dict[int, Dict[str, float]] = {}
+        self._pending_fills: Dict[str, int] = {}
+        self._trace_open_orders: Dict[int, set] = {}
+        # ordId -> 收到 filled 推送的时间（登记之前到达的成交）
+        self._early_fills: Dict[str, float] = {}
+        self._gauge_sources: List[Callable[[], Dict[str, float]]] = []
+
+    # ---------- 阶段耗时 ----------
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self._rotate()
+            hists = self._stages.get(stage)
+            if hists is None:
+                hists = self._stages[stage] = [LatencyHistogram()]
+            hists[-1].record(seconds)
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str):
+        """函数装饰器：记录每次调用的耗时（包括抛异常的调用）。"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._window_start < self.window_seconds:
+            return
+        self._window_start = now
+        for hists in self._stages.values():
+            hists.append(LatencyHistogram())
+            del hists[:-self.windows]
+
+    def snapshot(self) -> Dict[str, LatencyHistogram]:
+        """合并每个阶段所有窗口的直方图。"""
+        with self._lock:
+            self._rotate()
+            merged = {}
+            for stage, hists in self._stages.items():
+                h = LatencyHistogram()
+                for part in hists:
+                    h.merge(part)
+                merged[stage] = h
+            return merged
+
+    # ---------- 全链路时间线 ----------
+    def begin_trace(self) -> int:
+        """发现目标变化时调用，返回 trace_id。"""
+        trace_id = next(self._trace_ids)
+        with self._lock:
+            self._traces[trace_id] = {"observed": time.monotonic()}
+            if len(self._traces) > 1000:
+                for old in sorted(self._traces)[:500]:
+                    self._traces.pop(old, None)
+                    self._trace_open_orders.pop(old, None)
+        return trace_id
+
+    def mark(self, trace_id: Optional[int], event: str, at: Optional[float] = None):
+        """
+        记录时间线事件，并把与上一事件、与 observed 之间的间隔计入对应阶段。
+        at 为事件实际发生的时间（monotonic），缺省为现在。
+        """
+        if trace_id is None:
+            return
+        now = time.monotonic() if at is None else at
+        with self._lock:
+            trace = self._traces.get(trace_id)
+        if trace is None or event in trace:
+            return
+        trace[event] = now
+        prev = TRACE_EVENTS[TRACE_EVENTS.index(event) - 1]
+        if prev in trace:
+            self.record(f"{prev}_to_{event}", now - trace[prev])
+        if event != "submitted" and "observed" in trace:
+            self.record(f"observed_to_{event}", now - trace["observed"])
+
+    def expect_fill(self, trace_id: Optional[int], ord_id: str):
+        """登记一笔已确认的订单，全部成交后该 trace 记为 filled。"""
+        self.expect_fills(trace_id, [ord_id])
+
+    def expect_fills(self, trace_id: Optional[int], ord_ids: List[str]):
+        """
+        一次登记同一 trace 的全部已确认订单，全部成交后该 trace 记为 filled。
+        登记之前已经收到 filled 推送的订单直接按推送到达的时间计入。
+        """
+        ord_ids = [o for o in ord_ids if o]
+        if trace_id is None or not ord_ids:
+            return
+        with self._lock:
+            early = {o: self._early_fills.pop(o) for o in ord_ids if o in self._early_fills}
+            open_orders = self._trace_open_orders.setdefault(trace_id, set())
+            for ord_id in ord_ids:
+                if ord_id not in early:
+                    self._pending_fills[ord_id] = trace_id
+                    open_orders.add(ord_id)
+            done = not open_orders
+            if done:
+                self._trace_open_orders.pop(trace_id, None)
+        if done:
+            self.mark(trace_id, "filled", at=max(early.values()))
+
+    def on_order_update(self, order: Dict):
+        """订单推送回调（orders 频道），state 为 filled 时检查所属 trace 是否全部成交。"""
+        if order.get("state") != "filled":
+            return
+        ord_id = order.get("ordId", "")
+        with self._lock:
+            trace_id = self._pending_fills.pop(ord_id, None)
+            if trace_id is None:
+                # 下单接口还没返回（或不是跟单下的订单）：暂存，登记时再匹配
+                self._early_fills[ord_id] = time.monotonic()
+                if len(self._early_fills) > EARLY_FILL_BUFFER:
+                    for old in list(self._early_fills)[:EARLY_FILL_BUFFER // 2]:
+                        del self._early_fills[old]
+                return
+            open_orders = self._trace_open_orders.get(trace_id, set())
+            open_orders.discard(ord_id)
+            done = not open_orders
+            if done:
+                self._trace_open_orders.pop(trace_id, None)
+        if done:
+            self.mark(trace_id, "filled")
+
+    # ---------- 外部指标 ----------
+    def add_gauge_source(self, source: Callable[[], Dict[str, float]]):
+        """注册一个返回 {指标名（可带 {label="..."}）: 数值} 的函数，/metrics 输出时按 gauge 导出。"""
+        self._gauge_sources.append(source)
+
+    # ---------- 输出 ----------
+    def summary(self) -> str:
+        lines = ["{:<28} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+            "阶段", "次数", "p50(ms)", "p90(ms)", "p99(ms)", "max(ms)")]
+        for stage, h in sorted(self.snapshot().items()):
+            lines.append("{:<28} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                stage, h.count, h.percentile_ms(50), h.percentile_ms(90), h.percentile_ms(99), h.max_us / 1000))
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        out = ["# HELP copytrade_latency_seconds Rolling per-stage latency.",
+               "# TYPE copytrade_latency_seconds summary"]
+        for stage, h in sorted(self.snapshot().items()):
+            for q in (0.5, 0.9, 0.99):
+                out.append(f'copytrade_latency_seconds{{stage="{stage}",quantile="{q}"}} '
+                           f'{h.percentile_ms(q * 100) / 1000:.6f}')
+            out.append(f'copytrade_latency_seconds_sum{{stage="{stage}"}} {h.total_us / 1_000_000:.6f}')
+            out.append(f'copytrade_latency_seconds_count{{stage="{stage}"}} {h.count}')
+        declared = set()
+        for source in self._gauge_sources:
+            try:
+                gauges = source()
+            except Exception:
+                continue
+            for name, value in gauges.items():
+                base = name.split("{", 1)[0]
+                if base not in declared:
+                    declared.add(base)
+                    out.append(f"# TYPE {base} gauge")
+                out.append(f"{name} {value:.6g}")
+        return "\n".join(out) + "\n"
+
+    def start_reporter(self, interval: float = 300):
+        def loop():
+            while True:
+                time.sleep(interval)
+                print(f"\n⏱️ 延迟统计（最近 {self.window_seconds * self.windows / 60:g} 分钟）:\n{self.summary()}\n")
+        threading.Thread(target=loop, name="latency-reporter", daemon=True).start()
+
+    def start_http_server(self, port: int = 9108, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = recorder.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+        return httpd
+
+
+class TimedProxy:
+    """包装 OKX 客户端，使指定方法的每次调用都计入同名阶段，其余属性原样透传。"""
+
+    def __init__(self, target, recorder: LatencyRecorder, methods):
+        self._target = target
+        self._wrapped = {name: recorder.timed(name)(getattr(target, name)) for name in methods}
+
+    def __getattr__(self, name):
+        wrapped = self._wrapped.get(name)
+        return wrapped if wrapped is not None else getattr(self._target, name)
+
+
+# 进程内共享的默认记录器
+recorder = LatencyRecorder()
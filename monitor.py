@@ -1,11 +1,91 @@
 # monitor.py (您提供的可用版本)
 
+import json
+import threading
 import time
-from typing import List, Dict, Optional
-from hyperliquid.info import Info
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional, Tuple
+import websocket
 from hyperliquid.utils import constants
+from clients import get_info
 from decimal import Decimal # 引入Decimal以提高精度
 
+if TYPE_CHECKING:
+    # 只用于类型标注；Info 客户端由 clients.get_info() 在第一次请求时创建（届时才导入 hyperliquid SDK）
+    from hyperliquid.info import Info
+
+try:
+    # orjson 的解码速度是标准库 json 的数倍，未安装时退回标准库
+    import orjson
+    _loads, _dumps = orjson.loads, orjson.dumps
+except ImportError:
+    orjson = None
+    _loads, _dumps = json.loads, lambda obj: json.dumps(obj).encode()
+
+# 调试模式下在每条持仓记录中保留原始 position 字典（会让整个 user_state 无法被及时释放）
+KEEP_RAW_POSITION = False
+# 可选的 prices.PriceCache：设置后 fetch_user_positions 从缓存读取中间价（缓存过期时才请求 allMids），
+# PositionStream 收到的 allMids 推送也会写入缓存
+PRICE_CACHE = None
+# 用于去重的已处理成交 (hash, tid) 数量上限，超出时只淘汰最早的
+SEEN_FILLS_LIMIT = 10000
+_ZERO = Decimal('0')
+
+
+class PositionRecord:
+    """
+    单个持仓的紧凑记录（__slots__，不为每条记录分配 __dict__）。
+    兼容原来的字典用法：p['size']、p.get('mid')、'coin' in p、dict(p) 都可以继续使用。
+    """
+
+    __slots__ = ("coin", "direction_is_buy", "leverage", "size", "value_usd", "mid", "raw_position")
+    _KEYS = __slots__
+
+    def __init__(self, coin: str, direction_is_buy: bool, leverage: Decimal, size: Decimal, mid: Decimal,
+                 raw_position: Optional[Dict] = None):
+        self.coin = coin
+        self.direction_is_buy = direction_is_buy
+        self.leverage = leverage
+        self.size = size # size 是 Decimal
+        self.value_usd = size * mid # value_usd 是 Decimal
+        # 以下字段是为了调试和兼容，trade.py中不直接使用
+        self.mid = mid
+        self.raw_position = raw_position
+
+    def __getitem__(self, key: str):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self._KEYS else default
+
+    def __contains__(self, key) -> bool:
+        return key in self._KEYS
+
+    def keys(self):
+        return self._KEYS
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self._KEYS}
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PositionRecord):
+            other = other.to_dict()
+        return isinstance(other, dict) and self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"PositionRecord({self.to_dict()!r})"
+
+
 def get_nonzero_positions(user_state: Dict) -> List[Dict]:
     """从 user_state 返回所有非零仓位（每项是 position 字段）。"""
     results = []
@@ -20,64 +100,318 @@ def get_nonzero_positions(user_state: Dict) -> List[Dict]:
             results.append(pos)
     return results
 
-def fetch_user_positions(address: str, info: Optional[Info] = None) -> List[Dict]:
+def build_positions(user_state: Dict, all_mids: Dict) -> List[PositionRecord]:
+    """
+    将 user_state 与 all_mids 转换为统一的持仓列表。
+    REST 轮询与 WebSocket 推送两条路径共用此函数，保证输出格式一致。
+    只读取 coin / szi / leverage.value 三个字段，价格只转换持仓涉及的币种。
+    """
+    result = []
+    keep_raw = KEEP_RAW_POSITION
+
+    for ap in user_state.get("assetPositions", ()):
+        pos = ap.get("position") or {}
+        szi_str = pos.get("szi") or '0'
+        try:
+            # 使用Decimal进行比较，避免浮点数精度问题
+            szi = Decimal(szi_str)
+        except Exception:
+            continue
+        if szi.is_zero():
+            continue
+        coin = pos.get("coin", "?")
+
+        try:
+            mid = Decimal(all_mids.get(coin) or '0')
+        except Exception:
+            mid = _ZERO
+
+        lev = pos.get("leverage")
+        try:
+            lev_val = lev.get("value") if lev else None
+            leverage = Decimal(lev_val) if lev_val is not None else _ZERO
+        except Exception:
+            leverage = _ZERO
+
+        result.append(PositionRecord(coin, szi > 0, leverage, szi.copy_abs(), mid, pos if keep_raw else None))
+    return result
+
+def post_info_raw(info: "Info", payload: Dict) -> bytes:
+    """
+    直接用 Info 的连接池发送 /info 请求，返回未解码的响应字节。
+    错误处理与 SDK 的 Info.post 相同（4xx 抛 ClientError，5xx 抛 ServerError）。
+    """
+    response = info.session.post(info.base_url + "/info", data=_dumps(payload), timeout=info.timeout)
+    info._handle_exception(response)
+    return response.content
+
+
+def post_info(info: "Info", payload: Dict):
+    return _loads(post_info_raw(info, payload))
+
+
+def fetch_all_mids(info: "Info") -> Dict[str, str]:
+    return post_info(info, {"type": "allMids", "dex": ""}) or {}
+
+
+def fetch_user_state(info: "Info", address: str) -> Dict:
+    return post_info(info, {"type": "clearinghouseState", "user": address, "dex": ""}) or {}
+
+
+def fetch_user_positions(address: str, info: Optional["Info"] = None) -> List[PositionRecord]:
     """
     获取指定地址的持仓列表并返回处理后的信息列表。
     返回的数据已经转换为Decimal以保证精度。
     """
-    created_info = False
     if info is None:
-        # 增加 skip_ws=True 以避免不必要的websocket连接
-        info = Info(base_url=constants.MAINNET_API_URL, skip_ws=True)
-        created_info = True
-
-    try:
-        all_mids = info.all_mids() or {}
-        user_state = info.user_state(address) or {}
-        positions = get_nonzero_positions(user_state)
-        result = []
-
-        for pos in positions:
-            coin = pos.get("coin", "?")
-            
-            # 统一使用Decimal处理所有数值
-            mid = Decimal(all_mids.get(coin, '0'))
-            szi = Decimal(pos.get("szi", '0'))
-            
-            direction_is_buy = szi > 0
-            
+        # 使用进程内共享的 Info 客户端，复用长连接，避免每次调用都重新构造
+        info = get_info()
+
+    user_state = fetch_user_state(info, address)
+    all_mids = None
+    if PRICE_CACHE is not None:
+        all_mids = PRICE_CACHE.hl_mids_for(
+            (ap.get("position") or {}).get("coin", "?") for ap in user_state.get("assetPositions", ()))
+    if all_mids is None:
+        all_mids = fetch_all_mids(info)
+        if PRICE_CACHE is not None:
+            PRICE_CACHE.update_hl_mids(all_mids)
+    return build_positions(user_state, all_mids)
+
+
+class PositionStream:
+    """
+    基于 Hyperliquid WebSocket 的目标持仓推送流。
+
+    订阅 webData2 / userFills / allMids 三个频道，在内存中增量维护目标地址的持仓簿，
+    持仓变化时立即唤醒等待方（以及可选的 on_change 回调）。
+    每次（重）连接成功后都会走一次 REST 全量同步，作为断线期间的兜底。
+    base_url 可指向本地的假 WebSocket 服务器（ws 地址为 base_url 替换协议后加 /ws），便于离线测试。
+    """
+
+    def __init__(self, address: str, base_url: str = constants.MAINNET_API_URL,
+                 on_change: Optional[Callable[[List[Dict]], None]] = None,
+                 info: Optional["Info"] = None, ping_interval: float = 50,
+                 reconnect_delay: float = 1, max_reconnect_delay: float = 30):
+        self.address = address.lower()
+        self.base_url = base_url
+        self.ws_url = "ws" + base_url[len("http"):] + "/ws"
+        self.on_change = on_change
+        self.info = info
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        # 持仓簿: coin -> 原始 position 字典（szi 等字段保持字符串，与 REST 返回一致）
+        self._book: Dict[str, Dict] = {}
+        self._mids: Dict[str, str] = {}
+        # 已处理的成交 (hash, tid)，按到达顺序保存（OrderedDict 用作有界 FIFO 集合）
+        self._seen_fills: "OrderedDict[Tuple, None]" = OrderedDict()
+        # 每个币种最近一次计入的成交 (time, tid)：更早的成交乱序到达时不再覆盖仓位
+        self._last_fill: Dict[str, Tuple[int, int]] = {}
+        self._version = 0
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._connected = False
+        self._synced = False
+        self._ws = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 对外接口 ----------
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="hl-position-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def is_live(self) -> bool:
+        """连接正常且已完成一次全量同步时，推送数据才可信。"""
+        return self._connected and self._synced
+
+    def snapshot(self) -> List[PositionRecord]:
+        """返回与 fetch_user_positions 相同格式的持仓列表。"""
+        return self.versioned_snapshot()[1]
+
+    def versioned_snapshot(self) -> Tuple[int, List[PositionRecord]]:
+        """返回 (持仓簿版本号, 持仓列表)；版本号传给 wait_for_change，处理期间到达的推送不会被错过。"""
+        with self._cond:
+            version = self._version
+            user_state = {"assetPositions": [{"position": dict(p)} for p in self._book.values()]}
+            mids = dict(self._mids)
+        return version, build_positions(user_state, mids)
+
+    def wait_for_change(self, timeout: float, since: Optional[int] = None) -> bool:
+        """
+        阻塞直到持仓簿的版本号不同于 since（调用方上一次处理的版本）或超时，返回是否有变化。
+        since 为空时从调用时的版本开始等待。
+        """
+        with self._cond:
+            start_version = self._version if since is None else since
+            self._cond.wait_for(lambda: self._version != start_version or self._stop_event.is_set(),
+                                timeout=timeout)
+            return self._version != start_version
+
+    # ---------- 内部实现 ----------
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._stop_event.is_set():
+            self._ws = websocket.WebSocketApp(
+                self.ws_url, on_open=self._on_open, on_message=self._on_message,
+                on_error=self._on_error, on_close=self._on_close,
+            )
+            started = time.monotonic()
+            self._ws.run_forever()
+            self._connected = False
+            self._synced = False
+            if self._stop_event.is_set():
+                break
+            # 连接保持过一段时间才重置退避，避免服务端反复断开时打满重连
+            if time.monotonic() - started > self.max_reconnect_delay:
+                delay = self.reconnect_delay
+            print(f"  - ⚠️ Hyperliquid WebSocket 已断开，{delay:g} 秒后重连...")
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _on_open(self, ws):
+        self._connected = True
+        for sub in ({"type": "allMids"},
+                    {"type": "webData2", "user": self.address},
+                    {"type": "userFills", "user": self.address}):
+            ws.send(json.dumps({"method": "subscribe", "subscription": sub}))
+        threading.Thread(target=self._ping_loop, args=(ws,), daemon=True).start()
+        # 订阅之后再做 REST 全量同步，断线期间错过的变化由这里补齐
+        self._resync()
+
+    def _ping_loop(self, ws):
+        while not self._stop_event.wait(self.ping_interval):
+            if not self._connected or ws is not self._ws:
+                break
             try:
-                lev_val = pos.get("leverage", {}).get("value")
-                leverage = Decimal(lev_val) if lev_val is not None else Decimal('0')
+                ws.send(json.dumps({"method": "ping"}))
             except Exception:
-                leverage = Decimal('0')
-
-            size = szi.copy_abs()
-            value_usd = size * mid
-
-            result.append({
-                "coin": coin,
-                "direction_is_buy": direction_is_buy,
-                "leverage": leverage,
-                "size": size, # size 是 Decimal
-                "value_usd": value_usd, # value_usd 是 Decimal
-                # 以下字段是为了调试和兼容，trade.py中不直接使用
-                "mid": mid,
-                "raw_position": pos,
-            })
-        return result
-    finally:
-        # 如果是内部创建的info实例，尝试关闭它
-        if created_info and hasattr(info, 'ws_manager'):
+                break
+
+    def _on_error(self, _ws, error):
+        print(f"  - ❌ Hyperliquid WebSocket 错误: {error}")
+
+    def _on_close(self, _ws, *_args):
+        self._connected = False
+
+    def _resync(self):
+        try:
+            if self.info is None:
+                self.info = get_info(self.base_url)
+            all_mids = fetch_all_mids(self.info)
+            user_state = fetch_user_state(self.info, self.address)
+        except Exception as e:
+            print(f"  - ❌ REST 全量同步失败，继续依赖推送数据: {e}")
+            return
+        with self._cond:
+            self._mids.update(all_mids)
+            self._replace_book(get_nonzero_positions(user_state))
+            self._synced = True
+
+    def _on_message(self, _ws, message):
+        if message == "Websocket connection established.":
+            return
+        try:
+            msg = _loads(message)
+        except ValueError:
+            return
+        channel = msg.get("channel")
+        data = msg.get("data") or {}
+        with self._cond:
+            if channel == "allMids":
+                # 价格变化不触发跟单，仅用于计算名义价值
+                mids = data.get("mids", {})
+                self._mids.update(mids)
+                if PRICE_CACHE is not None:
+                    PRICE_CACHE.update_hl_mids(mids)
+            elif channel == "webData2":
+                state = data.get("clearinghouseState") or {}
+                self._replace_book(get_nonzero_positions(state))
+                self._synced = True
+            elif channel == "userFills":
+                # 快照是历史成交，持仓状态以 webData2 / REST 为准
+                if not data.get("isSnapshot"):
+                    self._apply_fills(data.get("fills", []))
+
+    def _replace_book(self, positions: List[Dict]):
+        """用全量持仓替换持仓簿，仅在数量或方向变化时递增版本号。（调用方需持有锁）"""
+        new_book = {p.get("coin", "?"): p for p in positions}
+        changed = _book_sizes(new_book) != _book_sizes(self._book)
+        self._book = new_book
+        if changed:
+            self._bump()
+
+    def _apply_fills(self, fills: List[Dict]):
+        """根据成交增量更新持仓簿。（调用方需持有锁）"""
+        changed = False
+        for fill in fills:
+            coin = fill.get("coin", "")
+            # 现货成交（@107、PURR/USDC 等）与永续持仓无关
+            if not coin or coin.startswith("@") or "/" in coin:
+                continue
+            key = (fill.get("hash"), fill.get("tid"))
+            if key in self._seen_fills:
+                continue
+            self._seen_fills[key] = None
+            if len(self._seen_fills) > SEEN_FILLS_LIMIT:
+                self._seen_fills.popitem(last=False)
+            order = (fill.get("time") or 0, fill.get("tid") or 0)
+            if order < self._last_fill.get(coin, (0, 0)):
+                continue
             try:
-                info.ws_manager.close()
+                sz = Decimal(fill.get("sz", "0"))
+                # startPosition 是成交前的绝对仓位，据此计算可避免重复或乱序推送导致的累计误差
+                new_szi = Decimal(fill.get("startPosition", "0")) + (sz if fill.get("side") == "B" else -sz)
             except Exception:
-                pass
+                continue
+            self._last_fill[coin] = order
+            pos = dict(self._book.get(coin, {"coin": coin}))
+            pos["szi"] = str(new_szi)
+            if new_szi.is_zero():
+                self._book.pop(coin, None)
+            else:
+                self._book[coin] = pos
+            changed = True
+        if changed:
+            self._bump()
+
+    def _bump(self):
+        self._version += 1
+        self._cond.notify_all()
+        if self.on_change is not None:
+            try:
+                self.on_change(self.snapshot())
+            except Exception as e:
+                print(f"  - ❌ on_change 回调异常: {e}")
+
+
+def _book_sizes(book: Dict[str, Dict]) -> Dict[str, Decimal]:
+    sizes = {}
+    for coin, pos in book.items():
+        try:
+            sizes[coin] = Decimal(pos.get("szi", "0"))
+        except Exception:
+            sizes[coin] = Decimal("0")
+    return sizes
 
 # 主循环部分保持不变，用于独立测试 monitor.py
 if __name__ == "__main__":
     TARGET_USER_ADDRESS = "0xc20ac4dc4188660cbf555448af52694ca62b0734"
-    info = Info(base_url=constants.MAINNET_API_URL, skip_ws=True)
+    info = get_info()
     while True:
         print(f"\n----- {time.strftime('%Y-%m-%d %H:%M:%S')} -----")
         positions = fetch_user_positions(TARGET_USER_ADDRESS, info=info)
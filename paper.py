@@ -0,0 +1,730 @@
+# paper.py
+# 本地模拟盘（影子 / 纸面交易）：PaperExchange 实现 trade.py 用到的 AccountAPI / TradeAPI / MarketAPI / PublicAPI 接口
+# （get_positions、get_account_balance、set_leverage、place_order、place_multiple_orders、get_order、cancel_order、
+# amend_order、get_orderbook、get_instruments 等），返回与 OKX REST 相同结构的字典，订单在本地按盘口撮合。
+#
+# - 盘口由中间价 + 点差 + 若干档深度合成；中间价来自随机游走（SyntheticBook）或回放的历史价格（ReplayBook）
+# - 市价 / ioc / fok 单逐档吃单计算成交均价，按 taker 费率收手续费；限价 / post_only 单挂在本地，价格穿过时按 maker 费率成交
+# - 每次调用先等待 latency 秒模拟网络往返；时钟可以是真实时间（time 模块），也可以是 SimClock 虚拟时钟，
+#   虚拟时钟下等待不占用真实时间，整个跟单循环可以离线以远高于实时的速度运行（见 run_offline）
+#
+# 用法: COPYTRADE_BACKEND=paper python trade.py      目标持仓仍实时跟随 Hyperliquid，下单只在本地撮合（影子模式）
+#       python paper.py [tick 数]                     完全离线：合成目标持仓，压测 sync_positions 的吞吐与延迟
+
+import contextlib
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from decimal import Decimal, ROUND_DOWN
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from instruments import InstrumentSpec
+from monitor import PositionRecord
+
+# OKX 永续合约默认费率
+DEFAULT_TAKER_FEE = 0.0005
+DEFAULT_MAKER_FEE = 0.0002
+
+# 没有本地合约缓存时使用的合约列表（面值 / 步进取 OKX 的常见值）
+DEFAULT_INSTRUMENTS = [
+    {"instId": "BTC-USDT-SWAP", "ctVal": "0.01", "lotSz": "0.01", "minSz": "0.01", "tickSz": "0.1", "state": "live"},
+    {"instId": "ETH-USDT-SWAP", "ctVal": "0.1", "lotSz": "0.01", "minSz": "0.01", "tickSz": "0.01", "state": "live"},
+    {"instId": "SOL-USDT-SWAP", "ctVal": "1", "lotSz": "0.01", "minSz": "0.01", "tickSz": "0.01", "state": "live"},
+    {"instId": "BNB-USDT-SWAP", "ctVal": "0.01", "lotSz": "1", "minSz": "1", "tickSz": "0.01", "state": "live"},
+    {"instId": "DOGE-USDT-SWAP", "ctVal": "1000", "lotSz": "0.01", "minSz": "0.01", "tickSz": "0.00001",
+     "state": "live"},
+    {"instId": "XRP-USDT-SWAP", "ctVal": "100", "lotSz": "0.01", "minSz": "0.01", "tickSz": "0.0001", "state": "live"},
+    {"instId": "AVAX-USDT-SWAP", "ctVal": "1", "lotSz": "1", "minSz": "1", "tickSz": "0.001", "state": "live"},
+    {"instId": "LINK-USDT-SWAP", "ctVal": "1", "lotSz": "1", "minSz": "1", "tickSz": "0.001", "state": "live"},
+    {"instId": "ARB-USDT-SWAP", "ctVal": "10", "lotSz": "1", "minSz": "1", "tickSz": "0.0001", "state": "live"},
+    {"instId": "OP-USDT-SWAP", "ctVal": "1", "lotSz": "1", "minSz": "1", "tickSz": "0.001", "state": "live"},
+]
+# 合成价格的初始中间价
+DEFAULT_MIDS = {"BTC": 60000.0, "ETH": 3000.0, "SOL": 150.0, "BNB": 550.0, "DOGE": 0.12, "XRP": 0.5,
+                "AVAX": 30.0, "LINK": 15.0, "ARB": 0.8, "OP": 1.8}
+
+# 与 OKX 相同的错误码
+CODE_ORDER_NOT_FOUND = "51603"
+CODE_INSTRUMENT_NOT_FOUND = "51001"
+CODE_INVALID_ORDER = "51000"
+
+OPEN_STATES = ("live", "partially_filled")
+
+
+def load_instruments(flag: str = "1") -> List[Dict]:
+    """优先使用本地的 OKX 合约缓存（instruments_cache_{flag}.json），没有时使用 DEFAULT_INSTRUMENTS。"""
+    path = f"instruments_cache_{flag}.json"
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)["instruments"]
+    except (OSError, ValueError, KeyError):
+        return list(DEFAULT_INSTRUMENTS)
+
+
+def _coin(inst_id: str) -> str:
+    return inst_id.split("-")[0]
+
+
+# =======================【时钟】=======================
+class SimClock:
+    """
+    虚拟时钟，接口与 time 模块相同（time / monotonic / sleep）。
+    speed 为 0 时 sleep 只推进虚拟时间、立即返回；speed 为 k 时按 k 倍速真实等待。
+    多个线程同时 sleep 时虚拟时间累加（模拟延迟按串行计入），离线压测时这会高估而不是低估耗时。
+    """
+
+    def __init__(self, start: Optional[float] = None, speed: float = 0.0):
+        self._now = time.time() if start is None else start
+        self.speed = speed
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float):
+        if seconds <= 0:
+            return
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        with self._lock:
+            self._now += seconds
+
+
+# =======================【价格来源】=======================
+class SyntheticBook:
+    """
+    合成中间价：每个合约独立的几何随机游走，按查询时间惰性推进（相同的查询序列结果可复现）。
+    update() 用外部价格覆盖当前中间价（影子模式下为目标持仓中的 Hyperliquid 中间价），vol_bps 为 0 时价格只随 update 变化。
+    """
+
+    def __init__(self, mids: Optional[Dict[str, float]] = None, vol_bps: float = 0.0, seed: int = 0,
+                 default_mid: float = 100.0):
+        self.vol = vol_bps / 1e4
+        self.default_mid = default_mid
+        self._rng = random.Random(seed)
+        self._mids: Dict[str, float] = {c: float(p) for c, p in (mids or {}).items()}
+        self._at: Dict[str, float] = {}
+
+    def update(self, mids: Dict[str, float], t: float):
+        for coin, px in mids.items():
+            if px:
+                self._mids[coin] = float(px)
+                self._at[coin] = t
+
+    def mid(self, inst_id: str, t: float) -> float:
+        coin = _coin(inst_id)
+        px = self._mids.get(coin, self.default_mid)
+        last = self._at.get(coin, t)
+        if self.vol and t > last:
+            # 每秒 vol_bps 基点的波动率
+            px *= math.exp(self.vol * math.sqrt(t - last) * self._rng.gauss(0.0, 1.0))
+        self._mids[coin] = px
+        self._at[coin] = t
+        return px
+
+
+class ReplayBook:
+    """
+    回放历史中间价：prices 为 backtest.wide_prices 格式的宽表（行: 毫秒时间戳, 列: 币种）。
+    查询时间 t 换算为 start_ms + (t - clock_start) 秒后的价格，取该时刻之前最近的一行。
+    """
+
+    def __init__(self, prices, clock_start: float):
+        import numpy as np
+
+        self._ts = prices.index.to_numpy(dtype=np.int64)
+        self._cols = {c: i for i, c in enumerate(prices.columns)}
+        self._px = prices.to_numpy(dtype=float)
+        self._start_ms = int(self._ts[0])
+        self.clock_start = clock_start
+        self.end_ms = int(self._ts[-1])
+
+    @classmethod
+    def from_store(cls, store, clock_start: float, start_ms: Optional[int] = None,
+                   end_ms: Optional[int] = None) -> "ReplayBook":
+        from backtest import wide_prices
+
+        return cls(wide_prices(store.read("prices", start_ms, end_ms)), clock_start)
+
+    def update(self, mids: Dict[str, float], t: float):
+        pass
+
+    def mid(self, inst_id: str, t: float) -> float:
+        import numpy as np
+
+        col = self._cols.get(_coin(inst_id))
+        if col is None:
+            return float("nan")
+        row = int(np.searchsorted(self._ts, self._start_ms + (t - self.clock_start) * 1000, side="right")) - 1
+        return float(self._px[max(row, 0), col])
+
+
+# =======================【撮合】=======================
+class _Position:
+    __slots__ = ("lots", "avg_px", "lever", "realized")
+
+    def __init__(self):
+        self.lots = Decimal('0')
+        self.avg_px = 0.0
+        self.lever = "10"
+        self.realized = 0.0
+
+
+class PaperExchange:
+    """
+    本地撮合的 OKX 账户（全仓、净持仓模式）。所有方法线程安全，返回与 OKX REST 相同结构的字典。
+    盘口: 买一 / 卖一 = 中间价 ∓ spread_bps / 2，之后每档再偏离 level_step_bps，每档名义价值 level_notional_usd；
+    吃完全部档位后剩余数量按最后一档价格成交（市价单总能全部成交）。盘口不记忆被吃掉的深度。
+    """
+
+    def __init__(self, book=None, instruments: Optional[List[Dict]] = None, clock=time, latency: float = 0.0,
+                 taker_fee: float = DEFAULT_TAKER_FEE, maker_fee: float = DEFAULT_MAKER_FEE,
+                 equity: float = 100_000.0, spread_bps: float = 1.0, level_step_bps: float = 1.0,
+                 levels: int = 20, level_notional_usd: float = 50_000.0):
+        self.book = book if book is not None else SyntheticBook(DEFAULT_MIDS)
+        self.instruments = list(instruments if instruments is not None else DEFAULT_INSTRUMENTS)
+        self.specs = {item["instId"]: InstrumentSpec.from_okx(item) for item in self.instruments}
+        self.clock = clock
+        self.latency = latency
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.spread_bps = spread_bps
+        self.level_step_bps = level_step_bps
+        self.levels = levels
+        self.level_notional_usd = level_notional_usd
+        self.pos_mode = "long_short_mode"
+
+        self.cash = equity
+        self.fees = 0.0
+        self.calls = 0
+        self.fills = 0
+        self._lock = threading.RLock()
+        self._positions: Dict[str, _Position] = {}
+        self._orders: Dict[str, Dict] = {}
+        self._by_cl_ord_id: Dict[str, str] = {}
+        self._resting: Dict[str, List[str]] = {}
+        self._seq = itertools.count(1)
+        self._order_listeners: List[Callable[[Dict], None]] = []
+
+    def reset(self, instruments: Optional[List[Dict]] = None, book=None, equity: Optional[float] = None):
+        """清空持仓、订单与统计，可同时更换合约列表与价格来源（压测在同一个模拟盘上切换场景时使用）。"""
+        with self._lock:
+            if instruments is not None:
+                self.instruments = list(instruments)
+                self.specs = {item["instId"]: InstrumentSpec.from_okx(item) for item in self.instruments}
+            if book is not None:
+                self.book = book
+            if equity is not None:
+                self.cash = equity
+            self.fees = 0.0
+            self.calls = 0
+            self.fills = 0
+            self._positions.clear()
+            self._orders.clear()
+            self._by_cl_ord_id.clear()
+            self._resting.clear()
+
+    # ---------- 价格 ----------
+    def observe_mids(self, mids: Dict[str, float]):
+        """
+        外部中间价（合约 ID → 按OKX币数计的价格），影子模式下由 sync_positions 传入目标持仓的 Hyperliquid 中间价
+        （已按币种映射换算，例如 kPEPE 的价格除以 1000 后记在 PEPE-USDT-SWAP 上）。
+        """
+        with self._lock:
+            self.book.update({_coin(inst_id): px for inst_id, px in mids.items()}, self.clock.time())
+            for inst_id in [i for i, ids in self._resting.items() if ids]:
+                self._match_resting(inst_id)
+
+    def _mid(self, inst_id: str) -> float:
+        return self.book.mid(inst_id, self.clock.time())
+
+    def _ladder(self, inst_id: str, side: str) -> List[Tuple[float, float]]:
+        """吃单方向的盘口档位 [(价格, 张数)]：买单吃卖盘，卖单吃买盘。"""
+        spec = self.specs[inst_id]
+        mid = self._mid(inst_id)
+        tick, ct_val = float(spec.tick_sz) or 1e-8, float(spec.ct_val)
+        sign = 1 if side == "buy" else -1
+        out = []
+        for i in range(self.levels):
+            raw = mid * (1 + sign * (self.spread_bps / 2 + i * self.level_step_bps) / 1e4)
+            # 卖盘价格向上、买盘价格向下取到 tickSz
+            px = (math.ceil(raw / tick - 1e-9) if sign > 0 else math.floor(raw / tick + 1e-9)) * tick
+            if px > 0:
+                out.append((px, self.level_notional_usd / (px * ct_val)))
+        return out
+
+    # ---------- 公共接口 ----------
+    def get_instruments(self, instType: str = "SWAP", **_kwargs) -> Dict:
+        self._wait()
+        return {"code": "0", "msg": "", "data": [dict(item) for item in self.instruments]}
+
+    def get_orderbook(self, instId: str, sz: str = "1") -> Dict:
+        self._wait()
+        with self._lock:
+            spec = self.specs.get(instId)
+            if spec is None:
+                return {"code": CODE_INSTRUMENT_NOT_FOUND, "msg": f"Instrument ID {instId} does not exist", "data": []}
+            n = max(1, min(int(sz), self.levels))
+            asks = self._ladder(instId, "buy")[:n]
+            bids = self._ladder(instId, "sell")[:n]
+        ts = str(int(self.clock.time() * 1000))
+        return {"code": "0", "msg": "", "data": [{
+            "asks": [[_fmt_px(px, spec.tick_sz), _fmt_lots(lots), "0", "1"] for px, lots in asks],
+            "bids": [[_fmt_px(px, spec.tick_sz), _fmt_lots(lots), "0", "1"] for px, lots in bids],
+            "ts": ts}]}
+
+    def get_ticker(self, instId: str) -> Dict:
+        self._wait()
+        with self._lock:
+            spec = self.specs.get(instId)
+            if spec is None:
+                return {"code": CODE_INSTRUMENT_NOT_FOUND, "msg": f"Instrument ID {instId} does not exist", "data": []}
+            ask, bid = self._ladder(instId, "buy")[0][0], self._ladder(instId, "sell")[0][0]
+        return {"code": "0", "msg": "", "data": [{"instId": instId, "last": _fmt_px((ask + bid) / 2, spec.tick_sz),
+                                                  "askPx": _fmt_px(ask, spec.tick_sz),
+                                                  "bidPx": _fmt_px(bid, spec.tick_sz),
+                                                  "ts": str(int(self.clock.time() * 1000))}]}
+
+    # ---------- 账户接口 ----------
+    def get_positions(self, instType: str = "", instId: str = "", **_kwargs) -> Dict:
+        self._wait()
+        with self._lock:
+            data = [self._position_dict(i, p) for i, p in self._positions.items()
+                    if p.lots != 0 and (not instId or instId == i)]
+        return {"code": "0", "msg": "", "data": data}
+
+    def get_account_balance(self, ccy: str = "", **_kwargs) -> Dict:
+        self._wait()
+        with self._lock:
+            upl = sum(self._upl(i, p) for i, p in self._positions.items() if p.lots != 0)
+            eq = self.cash + upl
+        return {"code": "0", "msg": "", "data": [{
+            "totalEq": f"{eq:.8f}", "uTime": str(int(self.clock.time() * 1000)),
+            "details": [{"ccy": "USDT", "eq": f"{eq:.8f}", "cashBal": f"{self.cash:.8f}", "upl": f"{upl:.8f}"}]}]}
+
+    def set_leverage(self, instId: str = "", lever: str = "", mgnMode: str = "cross", **_kwargs) -> Dict:
+        self._wait()
+        if instId not in self.specs:
+            return {"code": CODE_INSTRUMENT_NOT_FOUND, "msg": f"Instrument ID {instId} does not exist", "data": []}
+        with self._lock:
+            self._positions.setdefault(instId, _Position()).lever = str(lever)
+        return {"code": "0", "msg": "", "data": [{"instId": instId, "lever": str(lever), "mgnMode": mgnMode}]}
+
+    def get_account_config(self, **_kwargs) -> Dict:
+        self._wait()
+        return {"code": "0", "msg": "", "data": [{"posMode": self.pos_mode, "acctLv": "2"}]}
+
+    def set_position_mode(self, posMode: str) -> Dict:
+        self._wait()
+        self.pos_mode = posMode
+        return {"code": "0", "msg": "", "data": [{"posMode": posMode}]}
+
+    # ---------- 交易接口 ----------
+    def place_order(self, instId: str, tdMode: str, side: str, ordType: str, sz: str, px: str = "",
+                    clOrdId: str = "", posSide: str = "", **_kwargs) -> Dict:
+        self._wait()
+        item = self._place({"instId": instId, "side": side, "ordType": ordType, "sz": sz, "px": px,
+                            "clOrdId": clOrdId})
+        return {"code": "0" if item["sCode"] == "0" else "1", "msg": "", "data": [item]}
+
+    def place_multiple_orders(self, orders_data: List[Dict]) -> Dict:
+        self._wait()
+        data = [self._place(o) for o in orders_data]
+        ok = sum(1 for item in data if item["sCode"] == "0")
+        return {"code": "0" if ok == len(data) else ("2" if ok else "1"), "msg": "", "data": data}
+
+    def get_order(self, instId: str, ordId: str = "", clOrdId: str = "") -> Dict:
+        self._wait()
+        with self._lock:
+            order = self._find(instId, ordId, clOrdId)
+            if order is None:
+                return {"code": CODE_ORDER_NOT_FOUND, "msg": "Order does not exist", "data": []}
+            self._match_resting(instId)
+            return {"code": "0", "msg": "", "data": [dict(order)]}
+
+    def cancel_order(self, instId: str, ordId: str = "", clOrdId: str = "") -> Dict:
+        self._wait()
+        with self._lock:
+            order = self._find(instId, ordId, clOrdId)
+            if order is None:
+                return {"code": "1", "msg": "", "data": [
+                    {"ordId": ordId, "clOrdId": clOrdId, "sCode": CODE_ORDER_NOT_FOUND, "sMsg": "Order does not exist"}]}
+            self._match_resting(instId)
+            if order["state"] in OPEN_STATES:
+                self._close(order, "canceled")
+            return {"code": "0", "msg": "", "data": [
+                {"ordId": order["ordId"], "clOrdId": order["clOrdId"], "sCode": "0", "sMsg": ""}]}
+
+    def amend_order(self, instId: str, ordId: str = "", clOrdId: str = "", newSz: str = "", newPx: str = "",
+                    **_kwargs) -> Dict:
+        self._wait()
+        with self._lock:
+            order = self._find(instId, ordId, clOrdId)
+            if order is None or order["state"] not in OPEN_STATES:
+                return {"code": "1", "msg": "", "data": [
+                    {"ordId": ordId, "clOrdId": clOrdId, "sCode": CODE_ORDER_NOT_FOUND, "sMsg": "Order does not exist"}]}
+            if newSz:
+                order["sz"] = newSz
+            if newPx:
+                order["px"] = newPx
+            order["uTime"] = self._ts()
+            self._emit(order)
+            # 改价后可能立即穿过盘口
+            self._match_resting(instId)
+            return {"code": "0", "msg": "", "data": [
+                {"ordId": order["ordId"], "clOrdId": order["clOrdId"], "sCode": "0", "sMsg": ""}]}
+
+    # ---------- 推送 ----------
+    def add_order_listener(self, callback: Callable[[Dict], None]):
+        """订单状态变化回调，参数与 OKX orders 频道推送的单个订单相同（在调用方线程中同步调用）。"""
+        self._order_listeners.append(callback)
+
+    def order_state(self, ord_id: str) -> Optional[Dict]:
+        """按 ordId 读取订单的最新状态，不计模拟延迟（相当于 orders 频道推送的缓存）。"""
+        with self._lock:
+            order = self._orders.get(ord_id)
+            return dict(order) if order else None
+
+    # ---------- 统计 ----------
+    def summary(self) -> Dict:
+        with self._lock:
+            upl = sum(self._upl(i, p) for i, p in self._positions.items() if p.lots != 0)
+            realized = sum(p.realized for p in self._positions.values())
+            return {"equity": self.cash + upl, "upl": upl, "realized": realized, "fees": self.fees,
+                    "orders": len(self._orders), "fills": self.fills, "calls": self.calls,
+                    "positions": sum(1 for p in self._positions.values() if p.lots != 0)}
+
+    # ---------- 内部实现 ----------
+    def _wait(self):
+        self.calls += 1
+        if self.latency:
+            self.clock.sleep(self.latency)
+
+    def _ts(self) -> str:
+        return str(int(self.clock.time() * 1000))
+
+    def _find(self, inst_id: str, ord_id: str, cl_ord_id: str) -> Optional[Dict]:
+        if not ord_id and cl_ord_id:
+            ord_id = self._by_cl_ord_id.get(cl_ord_id, "")
+        order = self._orders.get(ord_id)
+        return order if order is not None and order["instId"] == inst_id else None
+
+    def _place(self, o: Dict) -> Dict:
+        inst_id, side, ord_type = o.get("instId", ""), o.get("side", ""), o.get("ordType", "market")
+        cl_ord_id = o.get("clOrdId") or ""
+        spec = self.specs.get(inst_id)
+        reject = None
+        try:
+            sz = Decimal(o.get("sz") or "0")
+            px = float(o["px"]) if o.get("px") else 0.0
+        except Exception:
+            sz, px = Decimal('0'), 0.0
+        if spec is None:
+            reject = (CODE_INSTRUMENT_NOT_FOUND, f"Instrument ID {inst_id} does not exist")
+        elif spec.state != "live":
+            reject = (CODE_INVALID_ORDER, f"Instrument {inst_id} is {spec.state}")
+        elif side not in ("buy", "sell") or ord_type not in ("market", "limit", "post_only", "ioc", "fok"):
+            reject = (CODE_INVALID_ORDER, "Parameter error")
+        elif sz < spec.min_sz or sz % spec.lot_sz != 0:
+            reject = (CODE_INVALID_ORDER, f"Order quantity must be a multiple of the lot size {spec.lot_sz}")
+        elif ord_type != "market" and px <= 0:
+            reject = (CODE_INVALID_ORDER, "Order price is required")
+        with self._lock:
+            if reject is None and cl_ord_id and cl_ord_id in self._by_cl_ord_id:
+                reject = (CODE_INVALID_ORDER, "Duplicated clOrdId")
+            if reject is not None:
+                return {"ordId": "", "clOrdId": cl_ord_id, "sCode": reject[0], "sMsg": reject[1]}
+
+            ord_id = str(next(self._seq))
+            now = self._ts()
+            order = {"instId": inst_id, "ordId": ord_id, "clOrdId": cl_ord_id, "side": side, "posSide": "net",
+                     "ordType": ord_type, "sz": str(sz), "px": o.get("px") or "", "state": "live",
+                     "accFillSz": "0", "avgPx": "", "fillPx": "", "fillSz": "0", "fee": "0", "feeCcy": "USDT",
+                     "cTime": now, "uTime": now}
+            self._orders[ord_id] = order
+            if cl_ord_id:
+                self._by_cl_ord_id[cl_ord_id] = ord_id
+
+            limit = None if ord_type == "market" else px
+            ladder = self._ladder(inst_id, side)
+            if not ladder:
+                del self._orders[ord_id]
+                self._by_cl_ord_id.pop(cl_ord_id, None)
+                return {"ordId": "", "clOrdId": cl_ord_id, "sCode": CODE_INVALID_ORDER, "sMsg": "No market price"}
+            crossable = [(p, q) for p, q in ladder if limit is None or (p <= limit if side == "buy" else p >= limit)]
+            if ord_type == "post_only":
+                if crossable:
+                    self._close(order, "canceled")
+                else:
+                    self._rest(order)
+            elif ord_type == "market":
+                self._fill(order, sz, _vwap(ladder, float(sz)), self.taker_fee)
+                self._close(order, "filled")
+            else:
+                available = _floor(Decimal(repr(sum(q for _, q in crossable))), spec.lot_sz)
+                take = min(sz, available)
+                if ord_type == "fok" and take < sz:
+                    take = Decimal('0')
+                if take > 0:
+                    self._fill(order, take, _vwap(crossable, float(take)), self.taker_fee)
+                if take == sz:
+                    self._close(order, "filled")
+                elif ord_type == "limit":
+                    self._rest(order)
+                else:
+                    self._close(order, "canceled")
+            self._emit(order)
+            return {"ordId": ord_id, "clOrdId": cl_ord_id, "sCode": "0", "sMsg": "Order placed"}
+
+    def _rest(self, order: Dict):
+        self._resting.setdefault(order["instId"], []).append(order["ordId"])
+
+    def _match_resting(self, inst_id: str):
+        """挂单价格被当前盘口穿过时按挂单价全部成交（maker）。"""
+        ids = self._resting.get(inst_id)
+        if not ids:
+            return
+        ask, bid = self._ladder(inst_id, "buy")[0][0], self._ladder(inst_id, "sell")[0][0]
+        for ord_id in list(ids):
+            order = self._orders[ord_id]
+            if order["state"] not in OPEN_STATES:
+                ids.remove(ord_id)
+                continue
+            px = float(order["px"])
+            if (order["side"] == "buy" and ask <= px) or (order["side"] == "sell" and bid >= px):
+                self._fill(order, Decimal(order["sz"]) - Decimal(order["accFillSz"]), px, self.maker_fee)
+                self._close(order, "filled")
+                self._emit(order)
+                ids.remove(ord_id)
+
+    def _fill(self, order: Dict, qty: Decimal, px: float, fee_rate: float):
+        inst_id = order["instId"]
+        spec = self.specs[inst_id]
+        ct_val = float(spec.ct_val)
+        pos = self._positions.setdefault(inst_id, _Position())
+        signed = qty if order["side"] == "buy" else -qty
+        # 净持仓：同向加仓更新均价，反向先平掉已有仓位并实现盈亏，超出部分按成交价开新仓
+        if pos.lots == 0 or (pos.lots > 0) == (signed > 0):
+            total = abs(pos.lots) + qty
+            pos.avg_px = (pos.avg_px * float(abs(pos.lots)) + px * float(qty)) / float(total)
+        else:
+            closed = min(abs(pos.lots), qty)
+            direction = 1 if pos.lots > 0 else -1
+            pnl = (px - pos.avg_px) * float(closed) * ct_val * direction
+            pos.realized += pnl
+            self.cash += pnl
+            if qty > abs(pos.lots):
+                pos.avg_px = px
+        pos.lots += signed
+        if pos.lots == 0:
+            pos.avg_px = 0.0
+        fee = px * float(qty) * ct_val * fee_rate
+        self.cash -= fee
+        self.fees += fee
+        self.fills += 1
+
+        prev = Decimal(order["accFillSz"])
+        acc = prev + qty
+        prev_px = float(order["avgPx"]) if order["avgPx"] else 0.0
+        order["avgPx"] = f"{(prev_px * float(prev) + px * float(qty)) / float(acc):.10g}"
+        order["accFillSz"] = str(acc)
+        order["fillSz"] = str(qty)
+        order["fillPx"] = f"{px:.10g}"
+        order["fee"] = f"{float(order['fee']) - fee:.8f}"
+        order["state"] = "partially_filled"
+        order["uTime"] = self._ts()
+
+    def _close(self, order: Dict, state: str):
+        order["state"] = state
+        order["uTime"] = self._ts()
+
+    def _emit(self, order: Dict):
+        snapshot = dict(order)
+        for callback in self._order_listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"  - ❌ 模拟盘订单回调异常: {e}")
+
+    def _upl(self, inst_id: str, pos: _Position) -> float:
+        return (self._mid(inst_id) - pos.avg_px) * float(pos.lots) * float(self.specs[inst_id].ct_val)
+
+    def _position_dict(self, inst_id: str, pos: _Position) -> Dict:
+        mid = self._mid(inst_id)
+        ct_val = float(self.specs[inst_id].ct_val)
+        return {"instId": inst_id, "instType": "SWAP", "mgnMode": "cross", "posSide": "net", "pos": str(pos.lots),
+                "avgPx": f"{pos.avg_px:.10g}", "markPx": f"{mid:.10g}", "lever": pos.lever,
+                "upl": f"{self._upl(inst_id, pos):.8f}", "notionalUsd": f"{abs(float(pos.lots)) * ct_val * mid:.8f}",
+                "realizedPnl": f"{pos.realized:.8f}", "uTime": self._ts()}
+
+
+def _vwap(ladder: List[Tuple[float, float]], qty: float) -> float:
+    """逐档吃单的成交均价；深度不足时剩余数量按最后一档价格成交。"""
+    remaining, cost = qty, 0.0
+    for px, lots in ladder:
+        take = min(remaining, lots)
+        cost += take * px
+        remaining -= take
+        if remaining <= 0:
+            break
+    if remaining > 0:
+        cost += remaining * ladder[-1][0]
+    return cost / qty
+
+
+def _floor(value: Decimal, lot_sz: Decimal) -> Decimal:
+    return (value / lot_sz).to_integral_value(rounding=ROUND_DOWN) * lot_sz
+
+
+def _fmt_px(px: float, tick_sz: Decimal) -> str:
+    return f"{Decimal(repr(px)).quantize(tick_sz) if tick_sz > 0 else px:f}"
+
+
+def _fmt_lots(lots: float) -> str:
+    return f"{lots:.2f}"
+
+
+# =======================【离线运行】=======================
+class SyntheticTarget:
+    """
+    合成的目标钱包：每个 tick 以 change_prob 的概率随机调整一个币种的仓位（加减仓、反手或平仓），
+    价格取自与模拟盘相同的 book，返回与 fetch_user_positions 相同的 PositionRecord 列表。
+    """
+
+    def __init__(self, book, coins: Iterable[str], change_prob: float = 0.01, notional_usd: float = 1_000_000.0,
+                 seed: int = 1):
+        self.book = book
+        self.coins = list(coins)
+        self.change_prob = change_prob
+        self.notional_usd = notional_usd
+        self._rng = random.Random(seed)
+        # 币种 → 带符号的名义价值权重
+        self._weights: Dict[str, float] = {c: self._rng.choice((-1, 1)) * self._rng.uniform(0.2, 1.0)
+                                           for c in self.coins[:max(1, len(self.coins) // 2)]}
+        self._positions: List[PositionRecord] = []
+        self._stale = True
+
+    def positions(self, t: float) -> List[PositionRecord]:
+        rng = self._rng
+        if rng.random() < self.change_prob:
+            coin = rng.choice(self.coins)
+            w = self._weights.get(coin, 0.0)
+            roll = rng.random()
+            if w == 0.0 or roll < 0.5:
+                self._weights[coin] = w + rng.choice((-1, 1)) * rng.uniform(0.05, 0.5)
+            elif roll < 0.8:
+                self._weights[coin] = -w
+            else:
+                self._weights.pop(coin, None)
+            self._stale = True
+        if self._stale:
+            total = sum(abs(w) for w in self._weights.values()) or 1.0
+            records = []
+            for coin, w in self._weights.items():
+                mid = self.book.mid(f"{coin}-USDT-SWAP", t)
+                if w == 0.0 or not mid or math.isnan(mid):
+                    continue
+                size = Decimal(f"{abs(w) / total * self.notional_usd / mid:.6g}")
+                records.append(PositionRecord(coin, w > 0, Decimal('10'), size, Decimal(f"{mid:.10g}")))
+            self._positions = records
+            self._stale = False
+        return self._positions
+
+
+def import_paper_trade(workdir: Optional[str] = None, quiet: bool = True):
+    """
+    以 paper 后端导入 trade.py（日志等文件写在 workdir，默认为新建的临时目录），关闭拆单执行
+    （algos.py 按真实时间等待），并把模拟盘的订单状态接到订单日志。同一进程中多次调用返回同一个模块。
+    """
+    import tempfile
+
+    os.environ["COPYTRADE_BACKEND"] = "paper"
+    # 导入前会切换到 workdir，sys.path 中的 ""（当前目录）随之失效，显式加入本模块所在目录
+    here = os.path.dirname(os.path.abspath(__file__))
+    if here not in sys.path:
+        sys.path.insert(0, here)
+    already = "trade" in sys.modules
+    workdir = workdir or tempfile.mkdtemp(prefix="copytrade_paper_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, "w")) if quiet else contextlib.nullcontext():
+            import trade
+    finally:
+        os.chdir(cwd)
+    if trade.paper_exchange is None:
+        raise RuntimeError("trade.py 已经以 okx 后端导入，无法在同一进程中切换到模拟盘")
+    if not already:
+        trade.PAPER_WORKDIR = workdir
+        trade.scheduler.algo = None
+        trade.paper_exchange.add_order_listener(trade.journal.on_order_update)
+    return trade
+
+
+def run_offline(ticks: int = 100_000, change_prob: float = 0.01, interval: float = 1.0, latency: float = 0.02,
+                vol_bps: float = 5.0, seed: int = 1, workdir: Optional[str] = None, quiet: bool = True) -> Dict:
+    """
+    完全离线地运行跟单循环：以 paper 后端导入 trade.py，用虚拟时钟推进 ticks 轮（每轮 interval 虚拟秒），
+    每轮读取合成的目标持仓，按主循环相同的规则比较并调用 sync_positions。
+    拆单执行依赖真实时间等待，离线运行时关闭（全部使用市价单）。返回吞吐与延迟统计。
+    quiet 为 True 时丢弃 sync_positions 的逐笔输出。
+    """
+    import numpy as np
+
+    from reconcile import Reconciler
+
+    trade = import_paper_trade(workdir, quiet)
+    cwd = os.getcwd()
+    os.chdir(trade.PAPER_WORKDIR)
+    try:
+        clock = SimClock()
+        book = SyntheticBook(DEFAULT_MIDS, vol_bps=vol_bps, seed=seed)
+        exchange = trade.paper_exchange
+        exchange.reset(book=book)
+        exchange.clock, exchange.latency = clock, latency
+        target = SyntheticTarget(book, [_coin(i) for i in exchange.specs], change_prob=change_prob, seed=seed)
+        reconciler = Reconciler(full_resync_interval=trade.FULL_RESYNC_INTERVAL_SECONDS)
+
+        last_known = {}
+        sync_seconds = []
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, "w")) if quiet else contextlib.nullcontext():
+            for _ in range(ticks):
+                clock.sleep(interval)
+                current = target.positions(clock.time())
+                simplified = trade.simplify_positions_for_comparison(current)
+                if simplified != last_known or reconciler.needs_full_resync():
+                    t0 = time.perf_counter()
+                    trade.sync_positions(current, reconciler=reconciler)
+                    sync_seconds.append(time.perf_counter() - t0)
+                    last_known = simplified
+        elapsed = time.perf_counter() - started
+    finally:
+        os.chdir(cwd)
+
+    syncs = np.array(sync_seconds) * 1000 if sync_seconds else np.zeros(1)
+    return dict(exchange.summary(), ticks=ticks, syncs=len(sync_seconds), seconds=elapsed,
+                ticks_per_second=ticks / elapsed, virtual_seconds=ticks * interval,
+                sync_p50_ms=float(np.percentile(syncs, 50)), sync_p99_ms=float(np.percentile(syncs, 99)),
+                workdir=trade.PAPER_WORKDIR)
+
+
+def print_offline_report(stats: Dict):
+    print(f"✅ 离线跟单 {stats['ticks']:,} 轮（虚拟时间 {stats['virtual_seconds'] / 3600:.1f} 小时），"
+          f"用时 {stats['seconds']:.2f}s，{stats['ticks_per_second']:,.0f} tick/s")
+    print(f"  - 同步 {stats['syncs']} 次: p50 {stats['sync_p50_ms']:.2f}ms, p99 {stats['sync_p99_ms']:.2f}ms")
+    print(f"  - 订单 {stats['orders']} 笔，成交 {stats['fills']} 次，模拟接口调用 {stats['calls']} 次")
+    print(f"  - 权益 ${stats['equity']:,.2f}（已实现 ${stats['realized']:,.2f}，未实现 ${stats['upl']:,.2f}，"
+          f"手续费 ${stats['fees']:,.2f}），持仓 {stats['positions']} 个")
+
+
+if __name__ == "__main__":
+    print_offline_report(run_offline(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
@@ -0,0 +1,226 @@
+# pnl_log.py
+# 异步盈亏日志：交易循环只把"记一条快照"的事件放进有界队列，后台线程批量写盘。
+# 账户状态缓存是新鲜的时候在事件发生时读取快照（只读内存），否则由后台线程每批读取一次。
+#
+# 输出两份文件:
+#   pnl_log.csv  与原来格式相同：Timestamp,TotalEquity_USD,UnrealizedPnL_USD,PositionsCount,Note
+#   pnl_log.bin  定长二进制记录（PNL_DTYPE），便于 numpy / pandas 直接读取做分析
+
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+from decimal import Decimal
+from typing import Optional, Tuple
+
+import numpy as np
+
+CSV_HEADER = ["Timestamp", "TotalEquity_USD", "UnrealizedPnL_USD", "PositionsCount", "Note"]
+
+PNL_DTYPE = np.dtype([
+    ("ts_ms", "<i8"),
+    ("equity", "<f8"),
+    ("upl", "<f8"),
+    ("positions", "<u2"),
+])
+
+
+def take_pnl_snapshot(account_api, prices=None) -> Tuple[str, str, int]:
+    """
+    返回 (总权益, 未实现盈亏, 持仓数)。account_api 传入 AccountStateCache 时通常直接命中缓存。
+    传入 prices.PriceCache 时，未实现盈亏按缓存中的最新标记价格重算（持仓推送中的 upl 可能已是几秒前的），
+    总权益按同样的差额调整。
+    """
+    res_balance = account_api.get_account_balance()
+    total_equity = "N/A"
+    if res_balance.get('code') == '0' and res_balance.get('data'):
+        total_equity = res_balance['data'][0].get('totalEq', 'N/A')
+
+    res_positions = account_api.get_positions()
+    total_unrealized_pnl = Decimal('0')
+    upl_adjustment = Decimal('0')
+    positions_count = 0
+    if res_positions.get('code') == '0' and res_positions.get('data'):
+        active_positions = [p for p in res_positions['data'] if p.get('pos') and float(p.get('pos')) != 0]
+        positions_count = len(active_positions)
+        for pos in active_positions:
+            upl = Decimal(pos.get('upl') or '0')
+            repriced = _reprice_upl(pos, prices) if prices is not None else None
+            if repriced is not None:
+                upl_adjustment += repriced - upl
+                upl = repriced
+            total_unrealized_pnl += upl
+    if upl_adjustment and total_equity != "N/A":
+        total_equity = f"{Decimal(total_equity) + upl_adjustment:f}"
+    return total_equity, f"{total_unrealized_pnl:.2f}", positions_count
+
+
+def _reprice_upl(pos, prices) -> Optional[Decimal]:
+    """按缓存的标记价格计算未实现盈亏：币数 = 名义价值 / 推送时的标记价格（带方向）。缺少字段或价格过期时返回 None。"""
+    mark = prices.okx_mark(pos.get('instId', ''))
+    try:
+        avg_px, notional, push_mark = Decimal(pos['avgPx']), Decimal(pos['notionalUsd']), Decimal(pos['markPx'])
+    except (KeyError, ArithmeticError, TypeError, ValueError):
+        return None
+    if mark is None or push_mark.is_zero():
+        return None
+    coins = notional.copy_abs() / push_mark
+    if Decimal(pos['pos']) < 0:
+        coins = -coins
+    return (mark - avg_px) * coins
+
+
+def _truncate_partial_record(path: str):
+    """上次写入中途崩溃时文件末尾可能留下半条记录；追加之前截掉，否则之后的记录全部错位。"""
+    if not os.path.exists(path):
+        return
+    partial = os.path.getsize(path) % PNL_DTYPE.itemsize
+    if partial:
+        print(f"⚠️ {path} 末尾有 {partial} 字节不完整的记录，已截断")
+        os.truncate(path, os.path.getsize(path) - partial)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class PnlLogger:
+    """
+    后台盈亏日志记录器。
+
+    log() 不做任何文件 I/O，队列满时丢弃并计数，绝不阻塞调用方。account_api 为 AccountStateCache 且持仓、余额
+    都是新鲜的推送数据时，log() 当场读取快照，每条记录反映事件发生时的状态；否则只记录时间与备注，
+    后台线程对这一批中没有快照的事件只读取一次账户状态（REST），再把整批行一次性写入 CSV 与二进制文件。
+    close() 会写完队列中剩余的事件；构造时注册到 atexit，正常退出和 Ctrl+C 都不会丢失快照。
+    """
+
+    def __init__(self, account_api, csv_path: str = "pnl_log.csv", bin_path: Optional[str] = None,
+                 max_queue: int = 1000, batch_size: int = 64, recorder=None, prices=None):
+        self.account_api = account_api
+        # 可选的 prices.PriceCache，未实现盈亏按缓存的标记价格重算
+        self.prices = prices
+        self.csv_path = csv_path
+        self.bin_path = bin_path if bin_path is not None else os.path.splitext(csv_path)[0] + ".bin"
+        self.batch_size = batch_size
+        # 可选的 latency.LatencyRecorder，记录后台每次取快照的耗时
+        self.recorder = recorder
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+
+        write_header = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+        self._csv_file = open(csv_path, "a", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._csv_file)
+        if write_header:
+            self._csv.writerow(CSV_HEADER)
+            self._csv_file.flush()
+        _truncate_partial_record(self.bin_path)
+        self._bin_file = open(self.bin_path, "ab")
+
+        self._thread = threading.Thread(target=self._run, name="pnl-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, note: str = ""):
+        ts = time.time()
+        snapshot = None
+        if self._cache_is_fresh():
+            try:
+                snapshot = self._take_snapshot()
+            except Exception:
+                # 留给后台线程重新读取
+                snapshot = None
+        try:
+            self._queue.put_nowait((ts, note, snapshot))
+        except queue.Full:
+            self.dropped += 1
+
+    def _cache_is_fresh(self) -> bool:
+        is_fresh = getattr(self.account_api, "is_fresh", None)
+        return callable(is_fresh) and is_fresh("account") and is_fresh("positions")
+
+    def _take_snapshot(self) -> Tuple[str, str, int]:
+        started = time.perf_counter()
+        try:
+            return take_pnl_snapshot(self.account_api, self.prices)
+        finally:
+            if self.recorder is not None:
+                self.recorder.record("pnl_snapshot", time.perf_counter() - started)
+
+    def close(self, timeout: float = 10):
+        """写完队列中剩余的快照后关闭文件，可重复调用。"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            stop = batch[-1] is None
+            try:
+                self._write_batch([b for b in batch if b is not None])
+            except Exception as e:
+                print(f"❌ 写入盈亏日志失败: {e}")
+            if stop:
+                self._csv_file.close()
+                self._bin_file.close()
+                return
+
+    def _row(self, ts: float, note: str, snapshot):
+        if isinstance(snapshot, Exception):
+            return ["N/A", "N/A", "N/A", f"记录时发生错误: {snapshot}"], None
+        equity, upl, count = snapshot
+        print(f"💰 已记录盈亏快照: 总权益 ${equity}, 未实现盈亏 ${upl}, 持仓数 {count}")
+        return [equity, upl, count, note], (int(ts * 1000), _to_float(equity), _to_float(upl), count)
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        rows, records = [], []
+        fetched = None
+        for ts, note, snapshot in batch:
+            if snapshot is None:
+                # 事件发生时缓存不新鲜：这一批只读取一次
+                if fetched is None:
+                    try:
+                        fetched = self._take_snapshot()
+                    except Exception as e:
+                        print(f"❌ 记录盈亏快照时发生错误: {e}")
+                        fetched = e
+                snapshot = fetched
+            row, record = self._row(ts, note, snapshot)
+            rows.append([time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))] + row)
+            if record is not None:
+                records.append(record)
+        self._csv.writerows(rows)
+        self._csv_file.flush()
+        if records:
+            np.array(records, dtype=PNL_DTYPE).tofile(self._bin_file)
+            self._bin_file.flush()
+
+
+def read_pnl_binary(path: str = "pnl_log.bin"):
+    """读取二进制盈亏记录为 DataFrame（时间为 UTC）。"""
+    import pandas as pd
+
+    # 崩溃时可能留下半条记录（下次启动 PnlLogger 时截掉），这里只读取完整的记录
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = np.frombuffer(raw[:len(raw) - len(raw) % PNL_DTYPE.itemsize], dtype=PNL_DTYPE)
+    df = pd.DataFrame(data)
+    df["ts"] = pd.to_datetime(df.pop("ts_ms"), unit="ms", utc=True)
+    return df
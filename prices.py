@@ -0,0 +1,259 @@
+# prices.py
+# 本地价格缓存：Hyperliquid 中间价（allMids 推送）与 OKX 中间价 / 标记价格（tickers / mark-price 推送），
+# 每个品种记录收到价格的时间，读取时按 max_age 判断是否过期。
+#
+# - Hyperliquid: 已启动 monitor.PositionStream 时由它的 allMids 频道写入（hl_ws=False），否则自己订阅 allMids
+# - OKX: 只订阅 track() 过的合约；启动时 seed_all() 一次取得全部合约的行情，
+#   之后新合约第一次 track 时没有新鲜价格才用 REST 补一次，其余完全依赖推送
+# - 读取只查字典，不访问任何接口；过期或缺失时返回 None，由调用方决定是否继续
+
+import json
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import websocket
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+HL_WS_URL = "wss://api.hyperliquid.xyz/ws"
+OKX_PUBLIC_WS_URL = "wss://ws.okx.com:8443/ws/v5/public"
+OKX_PUBLIC_WS_URL_DEMO = "wss://wspap.okx.com:8443/ws/v5/public"
+# 价格超过该秒数没有更新即视为过期
+MAX_PRICE_AGE_SECONDS = 5
+
+
+class PriceCache:
+    """
+    两个交易所的最新价格。所有 update_* 方法可在任意线程调用（推送线程 / 测试 / 模拟盘）。
+    OKX 价格优先用盘口中间价 (bidPx + askPx) / 2，没有盘口时用标记价格。
+    """
+
+    def __init__(self, flag: str = "1", hl_ws: bool = True, okx_ws: bool = True,
+                 max_age: float = MAX_PRICE_AGE_SECONDS, market_api=None, hl_ws_url: str = HL_WS_URL,
+                 okx_ws_url: Optional[str] = None, ping_interval: float = 20,
+                 reconnect_delay: float = 1, max_reconnect_delay: float = 30):
+        self.hl_ws_url = hl_ws_url if hl_ws else None
+        self.okx_ws_url = (okx_ws_url or (OKX_PUBLIC_WS_URL_DEMO if flag == "1" else OKX_PUBLIC_WS_URL)) \
+            if okx_ws else None
+        self.max_age = max_age
+        self.market_api = market_api
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._lock = threading.Lock()
+        # 品种 -> (价格字符串, 收到时间 monotonic)
+        self._hl: Dict[str, Tuple[str, float]] = {}
+        self._okx_mid: Dict[str, Tuple[str, float]] = {}
+        self._okx_mark: Dict[str, Tuple[str, float]] = {}
+        self._tracked: set = set()
+        self._okx_ws = None
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.rest_seeds = 0
+
+    # ---------- 写入 ----------
+    def update_hl_mids(self, mids: Dict[str, str]):
+        now = time.monotonic()
+        with self._lock:
+            hl = self._hl
+            for coin, px in mids.items():
+                hl[coin] = (px, now)
+
+    def update_okx_tickers(self, rows: Iterable[Dict]):
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                bid, ask = row.get("bidPx"), row.get("askPx")
+                if bid and ask:
+                    mid = (Decimal(bid) + Decimal(ask)) / 2
+                    self._okx_mid[row["instId"]] = (str(mid), now)
+                elif row.get("last"):
+                    self._okx_mid[row["instId"]] = (row["last"], now)
+
+    def update_okx_marks(self, rows: Iterable[Dict]):
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                if row.get("markPx"):
+                    self._okx_mark[row["instId"]] = (row["markPx"], now)
+
+    # ---------- 读取 ----------
+    def hl_mid(self, coin: str, max_age: Optional[float] = None) -> Optional[Decimal]:
+        px = self._fresh(self._hl, coin, max_age)
+        return Decimal(px) if px else None
+
+    def hl_mids_for(self, coins: Iterable[str], max_age: Optional[float] = None) -> Optional[Dict[str, str]]:
+        """这些币种的中间价（字符串，与 allMids 格式相同）；任一币种缺失或过期时返回 None。"""
+        result = {}
+        for coin in coins:
+            px = self._fresh(self._hl, coin, max_age)
+            if px is None:
+                return None
+            result[coin] = px
+        return result
+
+    def okx_price(self, inst_id: str, max_age: Optional[float] = None) -> Optional[Decimal]:
+        """OKX 盘口中间价，没有新鲜的盘口时用标记价格。"""
+        px = self._fresh(self._okx_mid, inst_id, max_age) or self._fresh(self._okx_mark, inst_id, max_age)
+        return Decimal(px) if px else None
+
+    def okx_mark(self, inst_id: str, max_age: Optional[float] = None) -> Optional[Decimal]:
+        px = self._fresh(self._okx_mark, inst_id, max_age) or self._fresh(self._okx_mid, inst_id, max_age)
+        return Decimal(px) if px else None
+
+    def age(self, venue: str, symbol: str) -> Optional[float]:
+        """某个品种的价格距上次更新的秒数（venue 为 "hl" / "okx"），没有价格时返回 None。"""
+        table = self._hl if venue == "hl" else self._okx_mid
+        entry = table.get(symbol) or (self._okx_mark.get(symbol) if venue == "okx" else None)
+        return time.monotonic() - entry[1] if entry else None
+
+    def _fresh(self, table: Dict[str, Tuple[str, float]], key: str, max_age: Optional[float]) -> Optional[str]:
+        entry = table.get(key)
+        if entry is None:
+            return None
+        limit = self.max_age if max_age is None else max_age
+        return entry[0] if time.monotonic() - entry[1] <= limit else None
+
+    # ---------- OKX 订阅 ----------
+    def track(self, inst_ids: Iterable[str]):
+        """开始跟踪这些合约的 OKX 价格（已跟踪的忽略）。没有新鲜价格的新合约用 REST 行情补一次。"""
+        new = [i for i in inst_ids if i not in self._tracked]
+        if not new:
+            return
+        self._tracked.update(new)
+        ws = self._okx_ws
+        if ws is not None:
+            try:
+                ws.send(json.dumps({"op": "subscribe", "args": _okx_args(new)}))
+            except Exception:
+                pass
+        if self.market_api is not None:
+            for inst_id in new:
+                if self.okx_price(inst_id) is not None:
+                    continue
+                try:
+                    res = self.market_api.get_ticker(instId=inst_id)
+                except Exception as e:
+                    print(f"  - ⚠️ 获取 {inst_id} 行情失败: {e}")
+                    continue
+                self.rest_seeds += 1
+                if res.get("code") == "0":
+                    self.update_okx_tickers(res.get("data") or [])
+
+    def seed_all(self, inst_type: str = "SWAP") -> int:
+        """一次 REST 请求取得全部合约的行情（启动时调用），之后 track() 不必逐个补价格。返回取得的合约数。"""
+        if self.market_api is None:
+            return 0
+        res = self.market_api.get_tickers(instType=inst_type)
+        self.rest_seeds += 1
+        if res.get("code") != "0":
+            raise RuntimeError(f"获取行情失败: {res.get('code')} {res.get('msg')}")
+        rows = res.get("data") or []
+        self.update_okx_tickers(rows)
+        return len(rows)
+
+    # ---------- 生命周期 ----------
+    def start(self) -> "PriceCache":
+        self._stop_event.clear()
+        if self.hl_ws_url:
+            self._start_thread("hl-price-ws", self.hl_ws_url, self._hl_open, self._hl_message, self._hl_ping)
+        if self.okx_ws_url:
+            self._start_thread("okx-price-ws", self.okx_ws_url, self._okx_open, self._okx_message, "ping")
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        ws = self._okx_ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        for t in self._threads:
+            t.join(timeout=5)
+
+    def _start_thread(self, name, url, on_open, on_message, ping):
+        t = threading.Thread(target=self._run, args=(url, on_open, on_message, ping), name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def _run(self, url, on_open, on_message, ping):
+        delay = self.reconnect_delay
+        while not self._stop_event.is_set():
+            ws = websocket.WebSocketApp(url, on_open=lambda w: self._opened(w, on_open, ping),
+                                        on_message=lambda _w, m: on_message(m),
+                                        on_error=lambda _w, e: print(f"  - ❌ 行情 WebSocket 错误 ({url}): {e}"))
+            started = time.monotonic()
+            ws.run_forever()
+            if ws is self._okx_ws:
+                self._okx_ws = None
+            if self._stop_event.is_set():
+                break
+            if time.monotonic() - started > self.max_reconnect_delay:
+                delay = self.reconnect_delay
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _opened(self, ws, on_open, ping):
+        on_open(ws)
+
+        def ping_loop():
+            while not self._stop_event.wait(self.ping_interval):
+                try:
+                    ws.send(ping() if callable(ping) else ping)
+                except Exception:
+                    break
+
+        threading.Thread(target=ping_loop, daemon=True).start()
+
+    # Hyperliquid
+    def _hl_open(self, ws):
+        ws.send(json.dumps({"method": "subscribe", "subscription": {"type": "allMids"}}))
+
+    @staticmethod
+    def _hl_ping():
+        return json.dumps({"method": "ping"})
+
+    def _hl_message(self, message):
+        try:
+            msg = _loads(message)
+        except ValueError:
+            return
+        if isinstance(msg, dict) and msg.get("channel") == "allMids":
+            self.update_hl_mids((msg.get("data") or {}).get("mids", {}))
+
+    # OKX
+    def _okx_open(self, ws):
+        self._okx_ws = ws
+        if self._tracked:
+            ws.send(json.dumps({"op": "subscribe", "args": _okx_args(sorted(self._tracked))}))
+
+    def _okx_message(self, message):
+        if message == "pong":
+            return
+        try:
+            msg = _loads(message)
+        except ValueError:
+            return
+        channel = (msg.get("arg") or {}).get("channel")
+        if channel == "tickers":
+            self.update_okx_tickers(msg.get("data") or [])
+        elif channel == "mark-price":
+            self.update_okx_marks(msg.get("data") or [])
+        elif msg.get("event") == "error":
+            print(f"  - ❌ OKX 行情订阅失败: {msg.get('code')} {msg.get('msg')}")
+
+
+def _okx_args(inst_ids: Iterable[str]) -> List[Dict]:
+    args = []
+    for inst_id in inst_ids:
+        args.append({"channel": "tickers", "instId": inst_id})
+        args.append({"channel": "mark-price", "instId": inst_id})
+    return args
@@ -0,0 +1,71 @@
+# ratelimit.py
+# 线程安全的令牌桶限速器，按"权重"计费，可在多个线程 / 多个客户端之间共享。
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    令牌桶：以 rate 个/秒的速度补充令牌，最多积累 capacity 个。
+    acquire(n) 阻塞到拿到 n 个令牌为止；try_acquire(n) 不阻塞。
+    rate 为 0 或 None 时不限速。
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else (rate or 0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    @classmethod
+    def per_minute(cls, weight: float, burst: float = None) -> "TokenBucket":
+        """按"每分钟权重"构造，例如 Hyperliquid 的 1200 weight / 分钟。"""
+        return cls(weight / 60, burst if burst is not None else weight / 10)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        """当前可用的令牌数（透支时为负）。"""
+        if not self.rate:
+            return float("inf")
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1) -> float:
+        """返回等待的秒数。单次请求超过桶容量时允许透支，之后的请求相应地多等。"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # 先扣减再计算等待时间：令牌可以为负，多个线程按到达顺序排队，不会互相抢占
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited_seconds += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def penalize(self, seconds: float):
+        """收到 429 等限流响应时调用：清空令牌并额外暂停 seconds 秒，让所有共享本桶的线程一起退避。"""
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
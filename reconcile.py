@@ -0,0 +1,122 @@
+# reconcile.py
+# 增量对账：只处理目标发生变化的合约，本地维护自己的持仓视图，按计划或发现偏差时才做全量同步。
+
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class Reconciler:
+    """
+    增量对账状态。
+
+    - positions: 本地维护的我的OKX持仓（与 prepare_my_positions 的格式一致），由订单回执增量更新。
+    - 缩放比例带滞回：新比例与当前比例的相对差异小于 scaling_tolerance 时沿用旧值，
+      避免目标某个币种的小幅变化引起整个持仓簿的"噪声订单"。
+    - 全量同步: 首次运行、距上次全量超过 full_resync_interval 秒，或订单失败/发现偏差时触发。
+    - 本轮跳过的合约（例如价格过期）不计入已提交的目标，并记入待重试集合，下一轮只重新计算这些合约。
+    拆单执行的子订单在后台线程中成交，本地视图的读写都持有锁。
+    """
+
+    def __init__(self, full_resync_interval: float = 300, scaling_tolerance: Decimal = Decimal('0.02')):
+        self.full_resync_interval = full_resync_interval
+        self.scaling_tolerance = Decimal(scaling_tolerance)
+        self.scaling_factor: Optional[Decimal] = None
+        self._signed_lots: Dict[str, Decimal] = {}
+        self._lock = threading.RLock()
+        self._last_targets: Dict[str, tuple] = {}
+        self._last_full_sync = 0.0
+        self._dirty = True
+        self._retry: Set[str] = set()
+        self.drift_count = 0
+
+    # ---------- 全量同步 ----------
+    def needs_full_resync(self) -> bool:
+        return self._dirty or time.monotonic() - self._last_full_sync >= self.full_resync_interval
+
+    def has_synced(self) -> bool:
+        """是否已经按OKX真实持仓完成过一次全量同步。"""
+        return self._last_full_sync > 0
+
+    def mark_dirty(self, reason: str = ""):
+        if not self._dirty and reason:
+            print(f"  - ⚠️ 本地持仓视图可能已失真（{reason}），下一轮执行全量同步。")
+        self._dirty = True
+
+    def retry_next(self, inst_ids: Iterable[str]):
+        """记录本轮跳过、下一轮需要重新计算的合约（覆盖上一轮的集合）。"""
+        self._retry = set(inst_ids)
+
+    def pending_retry(self) -> Set[str]:
+        return set(self._retry)
+
+    def reset(self, my_positions: Dict[str, Dict]):
+        """用 REST 拉取到的真实持仓覆盖本地视图，并检查与本地视图之间的偏差。"""
+        fetched = {inst_id: _signed(p) for inst_id, p in my_positions.items()}
+        with self._lock:
+            if not self._dirty:
+                drifted = [i for i in set(fetched) | set(self._signed_lots)
+                           if fetched.get(i, Decimal('0')) != self._signed_lots.get(i, Decimal('0'))]
+                if drifted:
+                    self.drift_count += 1
+                    print(f"  - ⚠️ 检测到本地持仓视图与OKX不一致: {', '.join(sorted(drifted))}，已按OKX校正。")
+            self._signed_lots = fetched
+            self._last_full_sync = time.monotonic()
+            self._dirty = False
+
+    # ---------- 增量部分 ----------
+    @property
+    def positions(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {inst_id: {"size": abs(v), "direction_is_buy": v > 0}
+                    for inst_id, v in self._signed_lots.items() if not v.is_zero()}
+
+    def stable_scaling_factor(self, raw_scaling_factor: Decimal, force: bool = False) -> Decimal:
+        """带滞回的缩放比例。目标清仓（比例为 0）或全量同步时直接采用新值。"""
+        current = self.scaling_factor
+        if (force or current is None or current.is_zero() or raw_scaling_factor.is_zero()
+                or abs(raw_scaling_factor - current) / current > self.scaling_tolerance):
+            self.scaling_factor = raw_scaling_factor
+        return self.scaling_factor
+
+    def changed_inst_ids(self, scaled_targets: Dict[str, Dict]) -> Set[str]:
+        """与上一次已提交的缩放后目标相比，数量、方向或杠杆有变化（含新增与消失）的合约。"""
+        changed = set()
+        for inst_id in set(scaled_targets) | set(self._last_targets):
+            t = scaled_targets.get(inst_id)
+            key = (t['size'], t['direction_is_buy'], t['leverage']) if t else None
+            if key != self._last_targets.get(inst_id):
+                changed.add(inst_id)
+        return changed
+
+    def commit(self, scaled_targets: Dict[str, Dict], results: Iterable):
+        """记录本轮目标，并根据订单回执更新本地持仓视图；有失败订单时标记需要全量同步。"""
+        self._last_targets = {inst_id: (t['size'], t['direction_is_buy'], t['leverage'])
+                              for inst_id, t in scaled_targets.items()}
+        failed: List[str] = []
+        for r in results:
+            if not r.ok:
+                failed.append(r.intent.inst_id)
+                continue
+            if r.code == "algo":
+                # 交给拆单执行的母单，成交由 ExecutionScheduler 的 fill 回调逐笔计入
+                continue
+            self.apply_fill(r.intent.inst_id, r.intent.side, Decimal(r.intent.sz))
+        if failed:
+            self.mark_dirty(f"订单失败: {', '.join(failed)}")
+
+    def apply_fill(self, inst_id: str, side: str, sz: Decimal):
+        """市价单回执成功即视为全部成交，按方向累加到本地视图（拆单执行的子订单按实际成交张数调用）。"""
+        delta = sz if side == "buy" else -sz
+        with self._lock:
+            self._signed_lots[inst_id] = self._signed_lots.get(inst_id, Decimal('0')) + delta
+
+    def set_position(self, inst_id: str, signed_lots: Decimal):
+        """用权威来源（例如私有频道推送）直接覆盖单个合约的持仓。"""
+        with self._lock:
+            self._signed_lots[inst_id] = Decimal(signed_lots)
+
+
+def _signed(p: Dict) -> Decimal:
+    return p['size'] if p['direction_is_buy'] else -p['size']
@@ -0,0 +1,294 @@
+# recorder.py
+# 目标持仓快照记录器：把每个 tick 的 fetch_user_positions 结果追加到按天轮转的紧凑列式存储中。
+#
+# 存储格式（root/YYYY-MM-DD/）:
+#   ts.i8      毫秒时间戳
+#   addr.u4    地址编号（addrs.txt 的行号）
+#   coin.u4    币种编号（coins.txt 的行号）
+#   szi.i8     带符号持仓数量，定点数 ×1e8
+#   px.i8      记录时的 mid 价格，定点数 ×1e8
+#   flags.u1   1 = 关键帧（每天或每次重启后第一次出现某地址时写入的全量持仓），0 = 增量
+# 每列一个只追加的二进制文件，行只在某地址某币种的数量变化时写入（平仓写 szi=0），
+# 即"关键帧 + 增量"编码；每天的文件自成一体，可以单独内存映射读取。
+# 关键帧是该地址当时的全部持仓：读取时该地址更早的行全部作废（当天重启时，停机期间已平仓的币种不会留下 szi=0）。
+
+import datetime as dt
+import os
+import queue
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import numpy as np
+
+FIXED_POINT_SCALE = 10 ** 8
+_SCALE_DEC = Decimal(FIXED_POINT_SCALE)
+
+COLUMNS = {
+    "ts": np.int64,
+    "addr": np.uint32,
+    "coin": np.uint32,
+    "szi": np.int64,
+    "px": np.int64,
+    "flags": np.uint8,
+}
+
+
+def _day_of(ts_ms: int) -> str:
+    return dt.datetime.fromtimestamp(ts_ms / 1000, tz=dt.timezone.utc).strftime("%Y-%m-%d")
+
+
+def _to_fixed(value) -> int:
+    return int((Decimal(value) * _SCALE_DEC).to_integral_value())
+
+
+class _Interner:
+    """字符串 → 从 0 开始的编号，新值追加写入文本文件（一行一个）。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self.ids[line.rstrip("\n")] = len(self.ids)
+        self._f = open(path, "a", encoding="utf-8")
+
+    def get(self, value: str) -> int:
+        idx = self.ids.get(value)
+        if idx is None:
+            idx = self.ids[value] = len(self.ids)
+            self._f.write(value + "\n")
+            self._f.flush()
+        return idx
+
+    def close(self):
+        self._f.close()
+
+
+class _DayWriter:
+    def __init__(self, day_dir: str):
+        os.makedirs(day_dir, exist_ok=True)
+        self.coins = _Interner(os.path.join(day_dir, "coins.txt"))
+        self.addrs = _Interner(os.path.join(day_dir, "addrs.txt"))
+        self.files = {name: open(os.path.join(day_dir, f"{name}.{np.dtype(t).str[1:]}"), "ab")
+                      for name, t in COLUMNS.items()}
+
+    def write(self, cols: Dict[str, list]):
+        # 先写元数据列，最后写 ts；读取时按最短的列截断，崩溃时不会读到半行
+        for name in ("addr", "coin", "szi", "px", "flags", "ts"):
+            np.asarray(cols[name], dtype=COLUMNS[name]).tofile(self.files[name])
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.coins.close()
+        self.addrs.close()
+
+
+class SnapshotRecorder:
+    """
+    后台记录线程。submit() 只把 (时间, 地址, 持仓列表) 放进队列，Decimal → 定点数的转换、
+    与上一 tick 的比较以及写盘都在后台线程完成，不增加同步路径的延迟。
+    队列满时丢弃并计数，绝不阻塞交易循环。
+    """
+
+    def __init__(self, root: str = "snapshots", max_queue: int = 10000, batch_size: int = 512):
+        self.root = root
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._last: Dict[str, Dict[str, int]] = {}
+        self._day: Optional[str] = None
+        self._writer: Optional[_DayWriter] = None
+        self._thread = threading.Thread(target=self._run, name="snapshot-recorder", daemon=True)
+        self._thread.start()
+
+    def submit(self, address: str, positions: List[Dict], ts_ms: Optional[int] = None):
+        try:
+            self._queue.put_nowait((ts_ms or int(time.time() * 1000), address.lower(), positions))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5):
+        """写完队列中剩余的快照后关闭文件。"""
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            stop = batch[-1] is None
+            try:
+                self._write_batch([b for b in batch if b is not None])
+            except Exception as e:
+                print(f"  - ❌ 写入持仓快照失败: {e}")
+            if stop:
+                if self._writer is not None:
+                    self._writer.close()
+                return
+
+    def _write_batch(self, batch):
+        cols = {name: [] for name in COLUMNS}
+        for ts_ms, address, positions in batch:
+            day = _day_of(ts_ms)
+            if day != self._day:
+                if cols["ts"]:
+                    self._writer.write(cols)
+                    cols = {name: [] for name in COLUMNS}
+                self._rotate(day)
+            self._encode(cols, ts_ms, address, positions)
+        if cols["ts"]:
+            self._writer.write(cols)
+
+    def _rotate(self, day: str):
+        if self._writer is not None:
+            self._writer.close()
+        self._day = day
+        self._writer = _DayWriter(os.path.join(self.root, day))
+        # 新的一天从关键帧开始：清空比较基准，每个地址第一次出现时写入全量持仓
+        self._last = {}
+
+    def _encode(self, cols, ts_ms: int, address: str, positions: List[Dict]):
+        w = self._writer
+        keyframe = address not in self._last
+        last = self._last.setdefault(address, {})
+        current = {}
+        mids = {}
+        for p in positions:
+            szi = p['size'] if p['direction_is_buy'] else -p['size']
+            current[p['coin']] = _to_fixed(szi)
+            mids[p['coin']] = p.get('mid', 0)
+        addr_id = w.addrs.get(address)
+        for coin in set(last) | set(current):
+            szi = current.get(coin, 0)
+            if not keyframe and last.get(coin, 0) == szi:
+                continue
+            cols["ts"].append(ts_ms)
+            cols["addr"].append(addr_id)
+            cols["coin"].append(w.coins.get(coin))
+            cols["szi"].append(szi)
+            cols["px"].append(_to_fixed(mids.get(coin, 0)))
+            cols["flags"].append(1 if keyframe else 0)
+        if keyframe and not current:
+            # 空持仓的关键帧也要留下记录，读取时才能区分"无持仓"与"没有数据"
+            cols["ts"].append(ts_ms)
+            cols["addr"].append(addr_id)
+            cols["coin"].append(w.coins.get(""))
+            cols["szi"].append(0)
+            cols["px"].append(0)
+            cols["flags"].append(1)
+        self._last[address] = current
+
+
+class DayReader:
+    """内存映射读取某一天的快照文件，查询时不复制数据。"""
+
+    def __init__(self, root: str, day: str):
+        self.day_dir = os.path.join(root, day)
+        with open(os.path.join(self.day_dir, "coins.txt"), encoding="utf-8") as f:
+            self.coins = [line.rstrip("\n") for line in f]
+        with open(os.path.join(self.day_dir, "addrs.txt"), encoding="utf-8") as f:
+            self.addrs = [line.rstrip("\n") for line in f]
+        arrays = {}
+        for name, t in COLUMNS.items():
+            path = os.path.join(self.day_dir, f"{name}.{np.dtype(t).str[1:]}")
+            arrays[name] = (np.memmap(path, dtype=t, mode="r") if os.path.getsize(path)
+                            else np.zeros(0, dtype=t))
+        n = min(len(a) for a in arrays.values())
+        self.columns = {name: a[:n] for name, a in arrays.items()}
+
+    def __len__(self):
+        return len(self.columns["ts"])
+
+    def keyframe_starts(self, n: Optional[int] = None) -> np.ndarray:
+        """前 n 行中每个关键帧的第一行（同一地址、同一时间戳的连续关键帧行属于同一个关键帧）。"""
+        c = self.columns
+        n = len(self) if n is None else n
+        ts, addr, key = c["ts"][:n], c["addr"][:n], c["flags"][:n] == 1
+        continued = np.zeros(n, dtype=bool)
+        continued[1:] = key[:-1] & (addr[1:] == addr[:-1]) & (ts[1:] == ts[:-1])
+        return np.flatnonzero(key & ~continued)
+
+    def positions_at(self, ts_ms: int, address: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """重建 ts_ms 时刻的持仓 {地址: {币种: 带符号数量}}。"""
+        c = self.columns
+        n = int(np.searchsorted(c["ts"], ts_ms, side="right"))
+        addr, coin, szi = c["addr"][:n], c["coin"][:n], c["szi"][:n]
+        # 每个地址只使用最后一个关键帧及其之后的行
+        keep = np.ones(n, dtype=bool)
+        starts = self.keyframe_starts(n)
+        rows = np.arange(n)
+        for a in np.unique(addr[starts]):
+            keep &= (addr != a) | (rows >= starts[addr[starts] == a][-1])
+        if address is not None:
+            if address.lower() not in self.addrs:
+                return {}
+            keep &= addr == self.addrs.index(address.lower())
+        addr, coin, szi = addr[keep], coin[keep], szi[keep]
+        # 每个 (地址, 币种) 取最后一次出现的值
+        key = addr.astype(np.uint64) << np.uint64(32) | coin.astype(np.uint64)
+        _, last_idx = np.unique(key[::-1], return_index=True)
+        last_idx = len(key) - 1 - last_idx
+        out: Dict[str, Dict[str, float]] = {}
+        for i in last_idx:
+            if szi[i] != 0:
+                out.setdefault(self.addrs[addr[i]], {})[self.coins[coin[i]]] = int(szi[i]) / FIXED_POINT_SCALE
+        return out
+
+    def to_changes_frame(self):
+        """
+        转换为 backtest.py 使用的持仓变化记录（ts, wallet, coin, szi）以及价格记录（ts, coin, mid）。
+        关键帧中不再出现的币种（停机期间已平仓）在关键帧的时间点补一条 szi=0。
+        """
+        import pandas as pd
+
+        c = self.columns
+        coins = np.array(self.coins, dtype=object)
+        addrs = np.array(self.addrs, dtype=object)
+        real = coins[c["coin"]] != ""
+        changes = pd.DataFrame({
+            "ts": np.asarray(c["ts"]),
+            "wallet": pd.Categorical(addrs[c["addr"]]),
+            "coin": pd.Categorical(coins[c["coin"]]),
+            "szi": np.asarray(c["szi"]) / FIXED_POINT_SCALE,
+        })[real]
+        prices = changes[["ts", "coin"]].copy()
+        prices["mid"] = np.asarray(c["px"])[real] / FIXED_POINT_SCALE
+        closed = self._closed_at_keyframes()
+        if closed:
+            filler = pd.DataFrame(closed, columns=["ts", "wallet", "coin", "szi"])
+            changes = pd.concat([changes.astype({"wallet": object, "coin": object}), filler])
+            changes = changes.sort_values("ts", kind="stable").astype({"wallet": "category", "coin": "category"})
+        return changes.reset_index(drop=True), prices[prices["mid"] > 0].reset_index(drop=True)
+
+    def _closed_at_keyframes(self) -> List[tuple]:
+        """(ts, 地址, 币种, 0.0)：关键帧之前仍持有、关键帧中已经没有的币种。"""
+        c = self.columns
+        out = []
+        for s in self.keyframe_starts():
+            addr_id, ts_ms = c["addr"][s], int(c["ts"][s])
+            address = self.addrs[addr_id]
+            before = self.positions_at(ts_ms - 1, address).get(address, {})
+            if not before:
+                continue
+            frame = (c["addr"] == addr_id) & (c["ts"] == ts_ms) & (c["flags"] == 1)
+            in_frame = {self.coins[k] for k in c["coin"][frame]}
+            out.extend((ts_ms, address, coin, 0.0) for coin in before if coin not in in_frame)
+        return out
+
+
+def list_days(root: str) -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
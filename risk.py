@@ -0,0 +1,373 @@
+# risk.py
+# 实时风控：在内存中维护我的持仓敞口、保证金占用与权益回撤，订单意图提交前在微秒级完成检查。
+#
+# - 数据来源: 账户状态缓存的推送（持仓 / 余额）、全量同步时拉取的持仓、订单回执与拆单子订单的成交，
+#   以及目标持仓中的 Hyperliquid 中间价；检查本身不访问任何接口
+# - 敞口与保证金按合约增量维护（只重算变化的那个合约），总量是累加值，检查一笔订单是 O(1)
+# - 减少敞口的订单（平仓、减仓）总是放行；熔断后只允许减仓，目标平仓时仍会跟随平仓；
+#   反手订单（多转空 / 空转多）的开仓部分被拒绝时，只执行平掉现有仓位的部分
+# - 缩放比例突变保护: 目标总名义价值过小，或缩放比例相对上次确认的值突然放大，本轮只允许减仓，
+#   连续几轮保持在同一水平才确认新比例
+
+import copy
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 默认限制（trade.py 按跟单预算覆盖名义价值相关的几项）
+MAX_ORDER_USD = 20000
+MAX_COIN_USD = 12000
+MAX_TOTAL_USD = 15000
+MAX_COIN_LEVERAGE = 20
+# 总名义价值 / 账户权益
+MAX_ACCOUNT_LEVERAGE = 10
+# 保证金占用 / 账户权益：超过时拒绝加仓；超过 KILL_MARGIN_USAGE 时熔断
+MAX_MARGIN_USAGE = 0.8
+KILL_MARGIN_USAGE = 0.95
+# 权益相对峰值的回撤超过该比例时熔断
+KILL_DRAWDOWN = 0.3
+# 缩放比例保护
+MIN_TARGET_TOTAL_USD = 1000
+MAX_SCALING_JUMP = 3
+SCALING_CONFIRM_TICKS = 3
+
+
+class RiskLimits:
+    """风控参数，None 表示不检查该项。"""
+
+    __slots__ = ("max_order_usd", "max_coin_usd", "max_total_usd", "max_coin_leverage", "max_account_leverage",
+                 "max_margin_usage", "kill_margin_usage", "kill_drawdown", "min_target_total_usd",
+                 "max_scaling_jump", "scaling_confirm_ticks")
+
+    def __init__(self, max_order_usd: Optional[float] = MAX_ORDER_USD, max_coin_usd: Optional[float] = MAX_COIN_USD,
+                 max_total_usd: Optional[float] = MAX_TOTAL_USD,
+                 max_coin_leverage: Optional[float] = MAX_COIN_LEVERAGE,
+                 max_account_leverage: Optional[float] = MAX_ACCOUNT_LEVERAGE,
+                 max_margin_usage: Optional[float] = MAX_MARGIN_USAGE,
+                 kill_margin_usage: Optional[float] = KILL_MARGIN_USAGE,
+                 kill_drawdown: Optional[float] = KILL_DRAWDOWN,
+                 min_target_total_usd: Optional[float] = MIN_TARGET_TOTAL_USD,
+                 max_scaling_jump: Optional[float] = MAX_SCALING_JUMP,
+                 scaling_confirm_ticks: int = SCALING_CONFIRM_TICKS):
+        self.max_order_usd = _opt_float(max_order_usd)
+        self.max_coin_usd = _opt_float(max_coin_usd)
+        self.max_total_usd = _opt_float(max_total_usd)
+        self.max_coin_leverage = _opt_float(max_coin_leverage)
+        self.max_account_leverage = _opt_float(max_account_leverage)
+        self.max_margin_usage = _opt_float(max_margin_usage)
+        self.kill_margin_usage = _opt_float(kill_margin_usage)
+        self.kill_drawdown = _opt_float(kill_drawdown)
+        self.min_target_total_usd = _opt_float(min_target_total_usd)
+        self.max_scaling_jump = _opt_float(max_scaling_jump)
+        self.scaling_confirm_ticks = scaling_confirm_ticks
+
+
+class RiskEngine:
+    """
+    风控状态与订单前检查。
+
+    状态更新（推送线程、拆单线程、主循环）与检查都持有同一把锁，检查只做几次浮点运算。
+    - on_positions / on_balance: 账户状态缓存的推送回调（AccountStateCache.add_state_listener），
+      以及全量同步时拉取到的持仓
+    - observe_mids: 目标持仓的中间价（合约 ID → 按OKX币数计的价格）
+    - apply_fill / commit: 与 Reconciler 相同，按订单回执与拆单成交更新持仓
+    - check_scaling / check_intents: sync_positions 中提交订单前调用
+    """
+
+    def __init__(self, limits: Optional[RiskLimits] = None, registry=None):
+        self.limits = limits or RiskLimits()
+        self.registry = registry
+        self._lock = threading.Lock()
+        # 每个合约: 带符号张数、面值、中间价、杠杆，以及由它们算出的名义价值与保证金占用
+        self._lots: Dict[str, float] = {}
+        self._ct_val: Dict[str, float] = {}
+        self._mid: Dict[str, float] = {}
+        self._lever: Dict[str, float] = {}
+        self._notional: Dict[str, float] = {}
+        self._margin: Dict[str, float] = {}
+        self.gross_usd = 0.0
+        self.margin_used = 0.0
+        self.equity: Optional[float] = None
+        self.peak_equity = 0.0
+        # 至少收到过一次完整持仓后才能判断"账户已无持仓"
+        self.positions_known = False
+        self.positions_updated_at = 0.0
+        # 缩放比例保护
+        self.scaling_factor: Optional[float] = None
+        self._pending_scaling: Optional[float] = None
+        self._pending_ticks = 0
+        self.reduce_only_reason: Optional[str] = None
+        # 熔断（锁存，直到 reset_kill_switch）
+        self.kill_reason: Optional[str] = None
+        self.killed_at = 0.0
+        self.checked = 0
+        self.rejected = 0
+
+    # ---------- 状态更新 ----------
+    def on_positions(self, okx_positions: List[Dict]):
+        """用完整的持仓列表（OKX positions 格式）覆盖持仓状态，并重算总量（顺便消除浮点累加误差）。"""
+        with self._lock:
+            self._lots = {}
+            for p in okx_positions:
+                try:
+                    lots = float(p.get('pos') or 0)
+                except ValueError:
+                    continue
+                if lots == 0:
+                    continue
+                inst_id = p['instId']
+                self._lots[inst_id] = lots
+                if p.get('lever'):
+                    self._lever[inst_id] = float(p['lever'])
+                if inst_id not in self._mid and p.get('markPx'):
+                    self._mid[inst_id] = float(p['markPx'])
+            self._notional, self._margin = {}, {}
+            self.gross_usd, self.margin_used = 0.0, 0.0
+            for inst_id in self._lots:
+                self._update(inst_id)
+            self.positions_known = True
+            self.positions_updated_at = time.monotonic()
+            self._check_kill()
+
+    def on_balance(self, balance: Dict):
+        """OKX account 频道 / get_account_balance 的一条余额记录。"""
+        try:
+            equity = float(balance.get('totalEq') or 'nan')
+        except ValueError:
+            return
+        if equity != equity:
+            return
+        with self._lock:
+            self.equity = equity
+            self.peak_equity = max(self.peak_equity, equity)
+            self._check_kill()
+
+    def on_account_update(self, channel: str, data: List[Dict]):
+        """AccountStateCache 的状态回调：positions 为全部持仓，account 为余额记录。"""
+        if channel == "positions":
+            self.on_positions(data)
+        elif channel == "account" and data:
+            self.on_balance(data[0])
+
+    def observe_mids(self, mids: Dict[str, object]):
+        """合约 ID → 中间价（k 前缀币种已换算为OKX一侧单个币的价格）。"""
+        with self._lock:
+            for inst_id, mid in mids.items():
+                if not mid:
+                    continue
+                self._mid[inst_id] = float(mid)
+                if inst_id in self._lots:
+                    self._update(inst_id)
+            self._check_kill()
+
+    def apply_fill(self, inst_id: str, side: str, sz):
+        delta = float(sz) if side == "buy" else -float(sz)
+        with self._lock:
+            # 舍去浮点累加误差，完全平仓后张数恰好为 0
+            self._lots[inst_id] = round(self._lots.get(inst_id, 0.0) + delta, 10)
+            self._update(inst_id)
+            self._check_kill()
+
+    def commit(self, results: Iterable):
+        """成功的市价单按全部成交计入（与 Reconciler.commit 一致），拆单母单由成交回调逐笔计入。"""
+        for r in results:
+            if r.ok and r.code != "algo":
+                self.apply_fill(r.intent.inst_id, r.intent.side, r.intent.sz)
+
+    def is_flat(self) -> bool:
+        """账户已无任何持仓（尚未收到过完整持仓时返回 False）。"""
+        with self._lock:
+            return self.positions_known and not any(self._lots.values())
+
+    # ---------- 熔断 ----------
+    @property
+    def killed(self) -> bool:
+        return self.kill_reason is not None
+
+    def trip(self, reason: str):
+        if self.kill_reason is None:
+            self.kill_reason = reason
+            self.killed_at = time.time()
+            print(f"\n🚨 风控熔断: {reason}。此后只允许减仓。")
+
+    def reset_kill_switch(self):
+        self.kill_reason = None
+        self.peak_equity = self.equity or 0.0
+
+    def drawdown(self) -> float:
+        if not self.equity or self.peak_equity <= 0:
+            return 0.0
+        return max(0.0, 1 - self.equity / self.peak_equity)
+
+    def margin_usage(self) -> Optional[float]:
+        return self.margin_used / self.equity if self.equity else None
+
+    # ---------- 订单前检查 ----------
+    def check_scaling(self, scaling_factor: Decimal, target_total_usd: Decimal) -> Optional[str]:
+        """
+        检查本轮的缩放比例，返回限制原因（本轮只允许减仓）或 None。
+        目标清仓（总名义价值为 0）不受限制：那一轮只会产生平仓单。
+        """
+        limits = self.limits
+        factor, total = float(scaling_factor), float(target_total_usd)
+        reason = None
+        if total <= 0 or factor <= 0:
+            pass
+        elif limits.min_target_total_usd is not None and total < limits.min_target_total_usd:
+            reason = f"目标总名义价值 ${total:,.2f} 低于 ${limits.min_target_total_usd:,.0f}"
+        elif (limits.max_scaling_jump is not None and self.scaling_factor
+              and factor > self.scaling_factor * limits.max_scaling_jump):
+            # 新比例需要连续几轮保持在同一水平（相对差异 2% 以内）才被确认
+            if self._pending_scaling and abs(factor - self._pending_scaling) <= self._pending_scaling * 0.02:
+                self._pending_ticks += 1
+            else:
+                self._pending_scaling, self._pending_ticks = factor, 1
+            if self._pending_ticks < limits.scaling_confirm_ticks:
+                reason = (f"缩放比例从 {self.scaling_factor:.6f} 跳到 {factor:.6f}"
+                          f"（第 {self._pending_ticks}/{limits.scaling_confirm_ticks} 轮）")
+        if reason is None and factor > 0:
+            self.scaling_factor = factor
+            self._pending_scaling, self._pending_ticks = None, 0
+        self.reduce_only_reason = reason
+        return reason
+
+    def check_intents(self, intents: Iterable, mids: Optional[Dict[str, object]] = None,
+                      sliced: Iterable[str] = ()) -> Tuple[List, List[Tuple[object, str]]]:
+        """
+        逐笔检查订单意图，返回 (放行的意图, [(被拒绝的意图, 原因)])。
+        同一批内已放行的订单计入后续订单的总敞口与保证金；杠杆超过上限时直接改为上限。
+        被拒绝的反手订单改为只平掉现有仓位：平仓单出现在放行列表中，原订单仍出现在拒绝列表中。
+        mids 为合约 ID → 价格，缺省时使用已知的中间价。
+        sliced 中的合约将交给拆单执行器：母单不检查单笔名义价值上限（由执行器限制每笔子订单），其余各项照常检查。
+        """
+        accepted, rejected = [], []
+        sliced = set(sliced)
+        with self._lock:
+            gross, margin = self.gross_usd, self.margin_used
+            for intent in intents:
+                reason, d_gross, d_margin = self._check_one(intent, mids, gross, margin,
+                                                            intent.inst_id not in sliced)
+                self.checked += 1
+                if reason is None:
+                    accepted.append(intent)
+                    if intent.leverage:
+                        # 下单前执行器会把杠杆设置为这个值
+                        self._lever[intent.inst_id] = float(intent.leverage)
+                    gross += d_gross
+                    margin += d_margin
+                else:
+                    self.rejected += 1
+                    close = self._closing_part(intent)
+                    if close is not None:
+                        reason = f"{reason}，只平掉现有的 {close.sz} 张"
+                        accepted.append(close)
+                        gross -= self._notional.get(intent.inst_id, 0.0)
+                        margin -= self._margin.get(intent.inst_id, 0.0)
+                    rejected.append((intent, reason))
+        return accepted, rejected
+
+    def _closing_part(self, intent):
+        """反手订单的平仓部分（张数为现有仓位的绝对值，不需要设置杠杆）；其他订单返回 None。"""
+        cur = self._lots.get(intent.inst_id, 0.0)
+        sz = float(intent.sz)
+        new = cur + (sz if intent.side == "buy" else -sz)
+        if new * cur >= 0:
+            return None
+        close = copy.copy(intent)
+        close.sz = format(Decimal(repr(abs(cur))).normalize(), "f")
+        close.leverage = None
+        return close
+
+    def _check_one(self, intent, mids, gross: float, margin: float,
+                   order_cap: bool = True) -> Tuple[Optional[str], float, float]:
+        limits = self.limits
+        inst_id = intent.inst_id
+        sz = float(intent.sz)
+        cur = self._lots.get(inst_id, 0.0)
+        new = cur + (sz if intent.side == "buy" else -sz)
+        if abs(new) <= abs(cur) and new * cur >= 0:
+            # 减仓 / 平仓
+            return None, 0.0, 0.0
+        if self.kill_reason is not None:
+            return f"已熔断（{self.kill_reason}）", 0.0, 0.0
+        if self.reduce_only_reason is not None:
+            return f"本轮只允许减仓（{self.reduce_only_reason}）", 0.0, 0.0
+
+        if intent.leverage and limits.max_coin_leverage is not None \
+                and float(intent.leverage) > limits.max_coin_leverage:
+            intent.leverage = f"{limits.max_coin_leverage:g}"
+        mid = (mids or {}).get(inst_id) or self._mid.get(inst_id)
+        ct_val = self._contract_value(inst_id)
+        if not mid or ct_val is None:
+            # 没有价格就无法估算敞口，宁可拒绝也不放行一笔不知道大小的加仓单
+            return "没有可用的价格或合约面值", 0.0, 0.0
+        mid = float(mid)
+        order_usd = sz * ct_val * mid
+        if order_cap and limits.max_order_usd is not None and order_usd > limits.max_order_usd:
+            return f"单笔名义价值 ${order_usd:,.0f} 超过 ${limits.max_order_usd:,.0f}", 0.0, 0.0
+        coin_usd = abs(new) * ct_val * mid
+        if limits.max_coin_usd is not None and coin_usd > limits.max_coin_usd:
+            return f"{inst_id} 名义价值 ${coin_usd:,.0f} 超过 ${limits.max_coin_usd:,.0f}", 0.0, 0.0
+        d_gross = coin_usd - self._notional.get(inst_id, 0.0)
+        total = gross + d_gross
+        if limits.max_total_usd is not None and total > limits.max_total_usd:
+            return f"总名义价值 ${total:,.0f} 超过 ${limits.max_total_usd:,.0f}", 0.0, 0.0
+        lever = float(intent.leverage or self._lever.get(inst_id) or 1)
+        d_margin = coin_usd / lever - self._margin.get(inst_id, 0.0)
+        equity = self.equity
+        if equity:
+            if limits.max_account_leverage is not None and total / equity > limits.max_account_leverage:
+                return f"账户杠杆 {total / equity:.1f}x 超过 {limits.max_account_leverage:g}x", 0.0, 0.0
+            usage = (margin + d_margin) / equity
+            if limits.max_margin_usage is not None and usage > limits.max_margin_usage:
+                return f"保证金占用 {usage:.0%} 超过 {limits.max_margin_usage:.0%}", 0.0, 0.0
+        return None, d_gross, d_margin
+
+    # ---------- 内部实现 ----------
+    def _contract_value(self, inst_id: str) -> Optional[float]:
+        ct_val = self._ct_val.get(inst_id)
+        if ct_val is None and self.registry is not None:
+            spec = self.registry.get(inst_id)
+            if spec is not None:
+                ct_val = self._ct_val[inst_id] = float(spec.ct_val)
+        return ct_val
+
+    def _update(self, inst_id: str):
+        """重算单个合约的名义价值与保证金占用，并增量更新总量（调用方持有锁）。"""
+        lots = self._lots.get(inst_id, 0.0)
+        mid = self._mid.get(inst_id)
+        ct_val = self._contract_value(inst_id)
+        notional = abs(lots) * ct_val * mid if mid and ct_val is not None else 0.0
+        margin = notional / (self._lever.get(inst_id) or 1)
+        self.gross_usd += notional - self._notional.get(inst_id, 0.0)
+        self.margin_used += margin - self._margin.get(inst_id, 0.0)
+        self._notional[inst_id] = notional
+        self._margin[inst_id] = margin
+        if lots == 0:
+            self._lots.pop(inst_id, None)
+            del self._notional[inst_id]
+            del self._margin[inst_id]
+
+    def _check_kill(self):
+        """熔断条件只依赖内存中的状态（调用方持有锁）。"""
+        if self.kill_reason is not None or not self.equity:
+            return
+        limits = self.limits
+        drawdown = self.drawdown()
+        if limits.kill_drawdown is not None and drawdown >= limits.kill_drawdown:
+            self.trip(f"权益从峰值 ${self.peak_equity:,.2f} 回撤 {drawdown:.1%}")
+            return
+        usage = self.margin_used / self.equity
+        if limits.kill_margin_usage is not None and usage >= limits.kill_margin_usage:
+            self.trip(f"保证金占用 {usage:.0%}")
+
+    def status(self) -> Dict[str, float]:
+        """供 latency_recorder.add_gauge_source 导出的指标。"""
+        return {"risk_gross_usd": self.gross_usd, "risk_margin_used_usd": self.margin_used,
+                "risk_equity_usd": self.equity or 0.0, "risk_drawdown": self.drawdown(),
+                "risk_killed": 1.0 if self.killed else 0.0, "risk_rejected_total": float(self.rejected)}
+
+
+def _opt_float(value) -> Optional[float]:
+    return float(value) if value is not None else None
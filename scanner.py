@@ -0,0 +1,354 @@
+# scanner.py
+# 钱包收益扫描器：批量拉取候选地址的账户状态与成交记录，计算收益指标并排名，帮助挑选跟单对象。
+#
+# 用法: python scanner.py <地址文件（每行一个地址）> [回看天数] [输出CSV]
+#
+# - 有界线程池并发请求 Hyperliquid Info 接口，所有线程共享一个按权重计费的令牌桶
+# - 每个地址的成交按列缓存在 SCAN_CACHE_DIR 中，重复运行时只用 userFillsByTime 拉取游标之后的新成交
+# - base_url 可配置，便于指向本地的模拟 Info 服务器
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from hyperliquid.utils import constants
+from ratelimit import TokenBucket
+
+SCAN_CACHE_DIR = "scan_cache"
+
+# Hyperliquid 每个 IP 每分钟 1200 权重；clearinghouseState 计 2，userFillsByTime 计 20，
+# 且返回结果每 20 条再加 1。单 IP 全量扫描 5000 个地址约需 1.5 小时，提高速度需要更高的配额（多出口 IP）。
+INFO_WEIGHT_PER_MINUTE = 1200
+STATE_WEIGHT = 2
+FILLS_WEIGHT = 20
+FILLS_PAGE_LIMIT = 2000
+
+# 缓存中成交记录的列
+FILL_COLUMNS = ("time", "coin", "px", "sz", "side", "start", "closed_pnl", "fee", "tid")
+
+DAY_MS = 86_400_000
+
+
+class InfoRateLimited(Exception):
+    pass
+
+
+class WalletScanner:
+    """
+    并发扫描一批地址。
+
+    每个地址的缓存文件 <cache_dir>/<地址>.json 保存:
+      since      缓存覆盖的起始时间（毫秒）
+      cursor     已拉取的最新一条成交时间，下次从这里继续（含该毫秒，按 tid 去重）
+      fills      按列存储的成交记录
+      state      最近一次的 clearinghouseState 摘要及拉取时间
+    """
+
+    def __init__(self, base_url: str = constants.MAINNET_API_URL, cache_dir: str = SCAN_CACHE_DIR,
+                 lookback_days: int = 30, max_workers: int = 16,
+                 weight_per_minute: Optional[float] = INFO_WEIGHT_PER_MINUTE,
+                 state_ttl: float = 600, fills_ttl: float = 0, max_retries: int = 5):
+        self.base_url = base_url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.lookback_days = lookback_days
+        self.max_workers = max_workers
+        self.bucket = TokenBucket.per_minute(weight_per_minute) if weight_per_minute else TokenBucket(0)
+        # 缓存的账户状态 / 成交在这么多秒内视为最新，不重新请求
+        self.state_ttl = state_ttl
+        self.fills_ttl = fills_ttl
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.stats = {"requests": 0, "weight": 0, "new_fills": 0, "rate_limited": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # ---------- 请求 ----------
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _post(self, payload: Dict, weight: int):
+        backoff = 1.0
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(weight)
+            self._count("requests")
+            self._count("weight", weight)
+            try:
+                resp = self.session.post(f"{self.base_url}/info", json=payload, timeout=15)
+            except requests.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            if resp.status_code == 429:
+                self._count("rate_limited")
+                # 所有线程一起退避，而不是每个线程各自重试把限额打满
+                self.bucket.penalize(backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            resp.raise_for_status()
+            return resp.json()
+        raise InfoRateLimited(f"{payload.get('type')} 连续 {self.max_retries + 1} 次被限流")
+
+    def fetch_state(self, address: str) -> Dict:
+        state = self._post({"type": "clearinghouseState", "user": address}, STATE_WEIGHT) or {}
+        summary = state.get("marginSummary") or {}
+        positions = {}
+        for p in state.get("assetPositions", []):
+            pos = p.get("position", {})
+            if float(pos.get("szi", 0) or 0) != 0:
+                positions[pos["coin"]] = float(pos["szi"])
+        return {
+            "fetched_at": time.time(),
+            "account_value": float(summary.get("accountValue", 0) or 0),
+            "unrealized_pnl": sum(float(p.get("position", {}).get("unrealizedPnl", 0) or 0)
+                                  for p in state.get("assetPositions", [])),
+            "positions": positions,
+        }
+
+    def fetch_fills_since(self, address: str, start_ms: int) -> List[Dict]:
+        """从 start_ms（含）开始分页拉取成交，每页最多 2000 条，按时间升序。"""
+        out = []
+        while True:
+            page = self._post({"type": "userFillsByTime", "user": address, "startTime": start_ms,
+                               "aggregateByTime": True}, FILLS_WEIGHT) or []
+            extra = len(page) // 20
+            if extra:
+                # 列表类接口按返回条数追加权重，事后扣除
+                self.bucket.acquire(extra)
+                self._count("weight", extra)
+            out.extend(page)
+            if len(page) < FILLS_PAGE_LIMIT:
+                return out
+            last = max(f["time"] for f in page)
+            # 同一毫秒内超过一页时避免死循环
+            start_ms = last if last > start_ms else last + 1
+
+    # ---------- 缓存 ----------
+    def _cache_path(self, address: str) -> str:
+        return os.path.join(self.cache_dir, f"{address}.json")
+
+    def load_cache(self, address: str) -> Optional[Dict]:
+        try:
+            with open(self._cache_path(address), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_cache(self, address: str, entry: Dict):
+        path = self._cache_path(address)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    # ---------- 单个地址 ----------
+    def refresh_wallet(self, address: str, now_ms: Optional[int] = None) -> Dict:
+        """增量更新一个地址的缓存并返回缓存条目。"""
+        now_ms = now_ms or int(time.time() * 1000)
+        since = now_ms - self.lookback_days * DAY_MS
+        entry = self.load_cache(address)
+        if entry is None or entry.get("since", math.inf) > since:
+            # 没有缓存，或缓存覆盖的时间段比本次需要的短：从窗口起点重新拉取
+            entry = {"since": since, "cursor": since, "fills": {c: [] for c in FILL_COLUMNS},
+                     "fills_at": 0, "state": None}
+
+        changed = False
+        state = entry.get("state")
+        if state is None or time.time() - state.get("fetched_at", 0) > self.state_ttl:
+            entry["state"] = self.fetch_state(address)
+            changed = True
+
+        if time.time() - entry.get("fills_at", 0) > self.fills_ttl:
+            fills = entry["fills"]
+            cursor = entry["cursor"]
+            # 游标所在毫秒的成交会被重复返回，按 tid 去重
+            seen = {tid for t, tid in zip(fills["time"], fills["tid"]) if t >= cursor}
+            new = 0
+            for f in self.fetch_fills_since(address, cursor):
+                coin = f.get("coin", "")
+                if f["tid"] in seen or coin.startswith("@") or "/" in coin:
+                    continue
+                seen.add(f["tid"])
+                fills["time"].append(int(f["time"]))
+                fills["coin"].append(coin)
+                fills["px"].append(float(f["px"]))
+                fills["sz"].append(float(f["sz"]))
+                fills["side"].append(1 if f["side"] == "B" else -1)
+                fills["start"].append(float(f.get("startPosition", 0) or 0))
+                fills["closed_pnl"].append(float(f.get("closedPnl", 0) or 0))
+                fills["fee"].append(float(f.get("fee", 0) or 0))
+                fills["tid"].append(f["tid"])
+                new += 1
+            if new:
+                entry["cursor"] = max(fills["time"])
+                self._count("new_fills", new)
+            entry["fills_at"] = time.time()
+            changed = True
+
+        if entry["since"] < since:
+            # 丢弃滑出回看窗口的成交
+            keep = [i for i, t in enumerate(entry["fills"]["time"]) if t >= since]
+            entry["fills"] = {c: [v[i] for i in keep] for c, v in entry["fills"].items()}
+            entry["since"] = since
+            changed = True
+
+        if changed:
+            self.save_cache(address, entry)
+        return entry
+
+    # ---------- 批量扫描 ----------
+    def scan(self, addresses: List[str], progress_every: int = 500) -> pd.DataFrame:
+        addresses = list(dict.fromkeys(a.strip().lower() for a in addresses if a.strip()))
+        now_ms = int(time.time() * 1000)
+        rows = []
+        t0 = time.perf_counter()
+        print(f"🔍 开始扫描 {len(addresses)} 个地址（{self.max_workers} 个并发，回看 {self.lookback_days} 天）...")
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scan") as pool:
+            futures = {pool.submit(self.refresh_wallet, a, now_ms): a for a in addresses}
+            for done, fut in enumerate(as_completed(futures), 1):
+                address = futures[fut]
+                try:
+                    entry = fut.result()
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"  - ⚠️ 扫描 {address} 失败，使用缓存数据: {e}")
+                    entry = self.load_cache(address)
+                if entry is not None:
+                    rows.append(wallet_metrics(address, entry, now_ms, self.lookback_days))
+                if done % progress_every == 0:
+                    elapsed = time.perf_counter() - t0
+                    print(f"  - ⏳ {done}/{len(addresses)} | {done / elapsed:.1f} 个/秒 | "
+                          f"请求 {self.stats['requests']} | 限流等待 {self.bucket.waited_seconds:.0f}s")
+        elapsed = time.perf_counter() - t0
+        print(f"✅ 扫描完成，用时 {elapsed:.1f} 秒 | 请求 {self.stats['requests']} 次 | "
+              f"权重 {self.stats['weight']} | 新成交 {self.stats['new_fills']} 条 | 失败 {self.stats['errors']}")
+        return rank_wallets(pd.DataFrame(rows))
+
+
+def wallet_metrics(address: str, entry: Dict, now_ms: int, lookback_days: int) -> Dict:
+    """
+    基于回看窗口内的成交计算单个钱包的指标:
+      realized_pnl   已实现盈亏（closedPnl 之和减手续费）
+      sharpe         按日已实现盈亏的年化 Sharpe（没有交易的日子计为 0）
+      max_drawdown   已实现盈亏曲线的最大回撤（USD）
+      avg_hold_hours 完整开平仓周期的平均持仓时间
+      daily_turnover 日均成交额 / 账户净值
+    """
+    f = entry["fills"]
+    state = entry.get("state") or {}
+    account_value = state.get("account_value", 0.0)
+    since = now_ms - lookback_days * DAY_MS
+
+    t = np.asarray(f["time"], dtype=np.int64)
+    order = np.argsort(t, kind="stable")
+    t = t[order]
+    px = np.asarray(f["px"], dtype=float)[order]
+    sz = np.asarray(f["sz"], dtype=float)[order]
+    side = np.asarray(f["side"], dtype=float)[order]
+    start = np.asarray(f["start"], dtype=float)[order]
+    closed = np.asarray(f["closed_pnl"], dtype=float)[order]
+    fee = np.asarray(f["fee"], dtype=float)[order]
+
+    net = closed - fee
+    curve = np.cumsum(net)
+    max_dd = float(np.max(np.maximum.accumulate(np.concatenate(([0.0], curve)))[1:] - curve)) if len(curve) else 0.0
+
+    daily = np.bincount(((t - since) // DAY_MS).clip(0, lookback_days - 1), weights=net, minlength=lookback_days)
+    std = daily.std(ddof=1) if lookback_days > 1 else 0.0
+    sharpe = float(daily.mean() / std * math.sqrt(365)) if std > 0 else float("nan")
+
+    notional = float(np.sum(px * sz))
+    closes = closed != 0
+
+    return {
+        "address": address,
+        "account_value": account_value,
+        "realized_pnl": float(net.sum()),
+        "fees": float(fee.sum()),
+        "unrealized_pnl": state.get("unrealized_pnl", 0.0),
+        "roi": float(net.sum() / account_value) if account_value > 0 else float("nan"),
+        "sharpe": sharpe,
+        "max_drawdown": max_dd,
+        "win_rate": float(np.mean(closed[closes] > 0)) if closes.any() else float("nan"),
+        "trades": int(len(t)),
+        "avg_hold_hours": _avg_hold_hours(t, np.asarray(f["coin"], dtype=object)[order], side * sz, start),
+        "daily_turnover": notional / lookback_days / account_value if account_value > 0 else float("nan"),
+        "open_positions": len(state.get("positions") or {}),
+    }
+
+
+def _avg_hold_hours(t: np.ndarray, coins: np.ndarray, signed_sz: np.ndarray, start: np.ndarray) -> float:
+    """
+    从 0 开仓到回到 0（或反手）视为一个持仓周期。
+    每笔成交拆成"平仓"和"开仓"两类事件（反手同时产生两者，平仓在前），按币种、时间排序后，
+    紧跟在开仓事件之后的同币种平仓事件即构成一个完整周期。窗口开始前已持有的仓位不计入。
+    """
+    if len(t) == 0:
+        return float("nan")
+    end = start + signed_sz
+    eps = 1e-12
+    is_open = (np.abs(end) > eps) & ((np.abs(start) <= eps) | (start * end < 0))
+    is_close = (np.abs(start) > eps) & ((np.abs(end) <= eps) | (start * end < 0))
+    _, coin_ids = np.unique(coins.astype(str), return_inverse=True)
+    idx = np.arange(len(t))
+
+    ev_coin = np.concatenate((coin_ids[is_close], coin_ids[is_open]))
+    ev_time = np.concatenate((t[is_close], t[is_open]))
+    ev_seq = np.concatenate((idx[is_close] * 2, idx[is_open] * 2 + 1))
+    ev_kind = np.concatenate((np.zeros(is_close.sum(), dtype=np.int8), np.ones(is_open.sum(), dtype=np.int8)))
+    o = np.lexsort((ev_seq, ev_coin))
+    ev_coin, ev_time, ev_kind = ev_coin[o], ev_time[o], ev_kind[o]
+
+    paired = (ev_kind[1:] == 0) & (ev_kind[:-1] == 1) & (ev_coin[1:] == ev_coin[:-1])
+    if not paired.any():
+        return float("nan")
+    return float(np.mean(ev_time[1:][paired] - ev_time[:-1][paired]) / 3_600_000)
+
+
+def rank_wallets(df: pd.DataFrame, by: str = "sharpe", min_trades: int = 10) -> pd.DataFrame:
+    """按 by 降序排名；成交过少的钱包统计意义不足，排在最后。"""
+    if df.empty:
+        return df
+    df = df.assign(_eligible=df["trades"] >= min_trades)
+    df = df.sort_values(["_eligible", by, "realized_pnl"], ascending=[False, False, False], na_position="last")
+    df = df.drop(columns="_eligible").reset_index(drop=True)
+    df.index += 1
+    return df
+
+
+def load_addresses(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.split(",")[0].strip() for line in f if line.strip().startswith("0x")]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python scanner.py <地址文件> [回看天数] [输出CSV]")
+        sys.exit(1)
+    addresses = load_addresses(sys.argv[1])
+    lookback = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    scanner = WalletScanner(lookback_days=lookback)
+    ranking = scanner.scan(addresses)
+    pd.set_option("display.width", 200)
+    print(ranking.head(50).to_string(float_format=lambda v: f"{v:,.2f}"))
+    if len(sys.argv) > 3:
+        ranking.to_csv(sys.argv[3], index_label="rank")
+        print(f"\n💾 完整排名已写入 {sys.argv[3]}")
@@ -0,0 +1,250 @@
+# scheduler.py
+# 自适应轮询调度：根据目标持仓最近一次变化的时间调整轮询间隔，按接口维护限频预算（令牌桶），
+# 出错时按异常类型分类并做带抖动的指数退避。当前间隔与剩余预算通过 latency 的 /metrics 暴露。
+
+import math
+import random
+import socket
+import ssl
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import httpx
+import requests
+from hyperliquid.utils.error import ClientError, ServerError
+
+from ratelimit import TokenBucket
+
+# 各接口的限频：名称 -> (每秒补充的权重, 桶容量)
+#   Hyperliquid: 每个 IP 每分钟 1200 权重（allMids / clearinghouseState 各计 2）
+#   OKX: 按接口单独限频，例如持仓 / 余额 10 次每 2 秒，下单 60 次每 2 秒，批量下单按订单数 300 个每 2 秒
+ENDPOINT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "hl_info": (1200 / 60, 200),
+    "okx_positions": (10 / 2, 10),
+    "okx_balance": (10 / 2, 10),
+    "okx_set_leverage": (20 / 2, 20),
+    "okx_order": (60 / 2, 60),
+    "okx_batch_orders": (300 / 2, 300),
+    "okx_get_order": (60 / 2, 60),
+    "okx_cancel_order": (60 / 2, 60),
+    "okx_amend_order": (60 / 2, 60),
+    "okx_orderbook": (40 / 2, 40),
+}
+
+# OKX 被限频时返回 HTTP 429 与这些错误码（SDK 不抛异常，直接返回 JSON）
+OKX_RATE_LIMIT_CODES = {"50011", "50061"}
+
+# 错误类型 -> (首次退避秒数, 最大退避秒数)
+BACKOFF_POLICY: Dict[str, Tuple[float, float]] = {
+    "network": (2, 60),
+    "rate_limit": (10, 120),
+    "server": (5, 120),
+    "client": (30, 300),
+    "unknown": (30, 300),
+}
+
+NETWORK_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    httpx.TransportError,
+    ssl.SSLError,
+    socket.timeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class _NotImported(Exception):
+    pass
+
+
+def _okx_exceptions() -> Tuple[type, type]:
+    """(OkxAPIException, OkxRequestException)。OKX SDK 尚未导入时不可能抛出它们，不为了分类错误而导入整个 SDK。"""
+    module = sys.modules.get("okx.exceptions")
+    if module is None:
+        return _NotImported, _NotImported
+    return module.OkxAPIException, module.OkxRequestException
+
+
+def classify_error(exc: BaseException) -> str:
+    """按异常类型（而不是错误信息中的字符串）把错误归为 network / rate_limit / server / client / unknown。"""
+    OkxAPIException, OkxRequestException = _okx_exceptions()
+    status = getattr(exc, "status_code", None)
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    elif isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+    if status == 429 or (isinstance(exc, OkxAPIException) and str(exc.code) in OKX_RATE_LIMIT_CODES):
+        return "rate_limit"
+    if isinstance(exc, NETWORK_ERRORS) or isinstance(exc, OkxRequestException):
+        return "network"
+    if isinstance(exc, ServerError) or (isinstance(status, int) and status >= 500):
+        return "server"
+    if isinstance(exc, (ClientError, OkxAPIException)) or (isinstance(status, int) and 400 <= status < 500):
+        return "client"
+    return "unknown"
+
+
+class RateBudget:
+    """一组按接口命名的令牌桶。spend() 在预算不足时阻塞，remaining() 供调度与监控使用。"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = None):
+        limits = ENDPOINT_LIMITS if limits is None else limits
+        self.buckets = {name: TokenBucket(rate, capacity) for name, (rate, capacity) in limits.items()}
+
+    def spend(self, endpoint: str, weight: float = 1) -> float:
+        bucket = self.buckets.get(endpoint)
+        return bucket.acquire(weight) if bucket is not None else 0.0
+
+    def penalize(self, endpoint: str, seconds: float):
+        bucket = self.buckets.get(endpoint)
+        if bucket is not None:
+            bucket.penalize(seconds)
+
+    def rate(self, endpoint: str) -> float:
+        bucket = self.buckets.get(endpoint)
+        return bucket.rate if bucket is not None else 0.0
+
+    def remaining(self) -> Dict[str, float]:
+        return {name: bucket.available() for name, bucket in self.buckets.items()}
+
+
+class BudgetedProxy:
+    """
+    包装 OKX 客户端：指定方法调用前先从对应接口的预算中扣除权重，返回限频错误码时让该接口整体退避。
+    methods 的值为接口名，或 (接口名, 根据参数计算权重的函数)，例如批量下单按订单数计费。
+    """
+
+    def __init__(self, target, budget: RateBudget,
+                 methods: Dict[str, Union[str, Tuple[str, Callable]]]):
+        self._target = target
+        # 方法在调用时才从 target 上取得，包装尚未创建的客户端（clients.LazyOkxClient）不会提前导入 SDK
+        self._wrapped = {name: self._wrap(target, name, budget, spec) for name, spec in methods.items()}
+
+    @staticmethod
+    def _wrap(target, name: str, budget: RateBudget, spec):
+        endpoint, weight_of = (spec, None) if isinstance(spec, str) else spec
+
+        def wrapper(*args, **kwargs):
+            budget.spend(endpoint, weight_of(*args, **kwargs) if weight_of else 1)
+            result = getattr(target, name)(*args, **kwargs)
+            if isinstance(result, dict) and result.get("code") in OKX_RATE_LIMIT_CODES:
+                budget.penalize(endpoint, 2)
+            return result
+        return wrapper
+
+    def __getattr__(self, name):
+        wrapped = self._wrapped.get(name)
+        return wrapped if wrapped is not None else getattr(self._target, name)
+
+
+class AdaptivePoller:
+    """
+    自适应轮询间隔，按距目标上一次变化的时间计算：
+
+    - 目标刚发生变化时缩短到 min_interval，之后每安静 1 秒间隔增加 backoff 秒；
+      active_window 秒内视为仍在活跃交易，间隔不超过 active_interval（即原来的固定轮询间隔）
+    - 超过 active_window 秒没有变化视为空闲，从 active_interval 继续按同样的速度放宽到 max_interval
+    另外用指数加权的事件率（半衰期 half_life 秒）估计变化频率，只用于监控。
+    每次轮询消耗的预算（poll_cost）不会超过对应接口补充速度的 budget_share。
+    """
+
+    def __init__(self, budget: RateBudget, min_interval: float = 1, max_interval: float = 60,
+                 active_interval: float = 10, active_window: float = 600, backoff: float = 0.1,
+                 half_life: float = 300, poll_cost: Optional[Dict[str, float]] = None, budget_share: float = 0.5):
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.active_interval = active_interval
+        self.active_window = active_window
+        self.backoff = backoff
+        self.tau = half_life / math.log(2)
+        self.poll_cost = poll_cost or {}
+        self.budget_share = budget_share
+
+        self._lock = threading.Lock()
+        self._rate = 0.0
+        self._started = self._last_observed = time.monotonic()
+        # 还没有观察到过变化时按 active_interval 轮询
+        self._last_change: Optional[float] = None
+        self.interval = active_interval
+        self.consecutive_errors = 0
+        self.last_error_kind = ""
+
+    def observe(self, changed: bool, now: Optional[float] = None):
+        """每次检查完目标持仓后调用；changed 表示与上一次相比发生了变化。"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            dt = max(0.0, now - self._last_observed)
+            self._last_observed = now
+            self._rate = self._rate * math.exp(-dt / self.tau) + (1 / self.tau if changed else 0.0)
+            if changed:
+                self._last_change = now
+            self.consecutive_errors = 0
+            self.interval = self._compute_interval(now)
+
+    def quiet_seconds(self, now: Optional[float] = None) -> float:
+        """距目标上一次变化（还没有变化时为启动）的秒数。"""
+        now = time.monotonic() if now is None else now
+        return max(0.0, now - (self._last_change if self._last_change is not None else self._started))
+
+    def _compute_interval(self, now: float) -> float:
+        quiet = self.quiet_seconds(now)
+        if quiet < self.active_window:
+            if self._last_change is None:
+                interval = self.active_interval
+            else:
+                interval = min(self.active_interval, self.min_interval + quiet * self.backoff)
+        else:
+            interval = self.active_interval + (quiet - self.active_window) * self.backoff
+        floor = self.min_interval
+        for endpoint, cost in self.poll_cost.items():
+            rate = self.budget.rate(endpoint)
+            if rate:
+                floor = max(floor, cost / (rate * self.budget_share))
+        return min(self.max_interval, max(floor, interval))
+
+    def next_interval(self, rest_poll: bool = True) -> float:
+        """
+        下一次检查前应等待的秒数。rest_poll 为 True 表示下一次要走 REST，
+        预算不足时额外等待到令牌足够为止（不阻塞，只是延长间隔）。
+        """
+        wait = self.interval
+        if rest_poll:
+            remaining = self.budget.remaining()
+            for endpoint, cost in self.poll_cost.items():
+                rate = self.budget.rate(endpoint)
+                if rate and remaining.get(endpoint, 0) < cost:
+                    wait = max(wait, (cost - remaining[endpoint]) / rate)
+        return wait
+
+    def spend_poll(self):
+        for endpoint, cost in self.poll_cost.items():
+            self.budget.spend(endpoint, cost)
+
+    def on_error(self, exc: BaseException) -> Tuple[str, float]:
+        """记录一次错误，返回 (错误类型, 退避秒数)。退避为带抖动的指数退避：[d/2, d] 内均匀分布。"""
+        kind = classify_error(exc)
+        base, cap = BACKOFF_POLICY[kind]
+        with self._lock:
+            self.consecutive_errors += 1
+            self.last_error_kind = kind
+            delay = min(cap, base * 2 ** (self.consecutive_errors - 1))
+        if kind == "rate_limit":
+            for endpoint in self.poll_cost:
+                self.budget.penalize(endpoint, delay)
+        return kind, random.uniform(delay / 2, delay)
+
+    def metrics(self) -> Dict[str, float]:
+        """Prometheus 风格的指标名 -> 数值，供 LatencyRecorder.add_gauge_source 使用。"""
+        out = {
+            "copytrade_poll_interval_seconds": self.interval,
+            "copytrade_target_change_rate_per_hour": self._rate * 3600,
+            "copytrade_seconds_since_target_change": self.quiet_seconds(),
+            "copytrade_consecutive_errors": self.consecutive_errors,
+        }
+        for endpoint, tokens in self.budget.remaining().items():
+            out[f'copytrade_rate_budget_remaining{{endpoint="{endpoint}"}}'] = tokens
+        return out
@@ -0,0 +1,209 @@
+# shm.py
+# 进程间共享的内存映射数组（/dev/shm 下的文件 + numpy 结构化数组），进程之间不传递 pickle 过的字典：
+# - TargetRing: 目标持仓的单写多读环形缓冲区。检测进程写入，执行进程读取最新一帧
+# - AccountBoard: 每个账户一行的状态表，执行进程写入，记账进程读取
+# - Heartbeats: 每个工作进程一个心跳时间戳，监督进程据此发现卡死的进程
+#
+# 时间戳统一使用 time.perf_counter_ns()（Linux 上是 CLOCK_MONOTONIC，跨进程可比较）。
+# 写入方每次只有一个进程；读取方按帧序号校验，读到正在被覆盖的槽位时重读。
+
+import os
+import tempfile
+import time
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from monitor import PositionRecord
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+MAX_POSITIONS = 256
+COIN_BYTES = 24
+RING_SLOTS = 64
+HEADER_BYTES = 64
+
+POSITION_DTYPE = np.dtype([
+    ("coin", f"S{COIN_BYTES}"),
+    ("buy", "u1"),
+    ("leverage", "<f8"),
+    ("size", "<f8"),
+    ("mid", "<f8"),
+])
+SLOT_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("detected_ns", "<i8"),
+    ("published_ns", "<i8"),
+    ("count", "<u4"),
+    ("positions", POSITION_DTYPE, (MAX_POSITIONS,)),
+])
+RING_HEADER_DTYPE = np.dtype([("seq", "<u8"), ("slots", "<u4")])
+
+ACCOUNT_DTYPE = np.dtype([
+    ("updated_ns", "<i8"),
+    ("equity", "<f8"),
+    ("upl", "<f8"),
+    ("gross_usd", "<f8"),
+    ("positions", "<u4"),
+    ("orders", "<u8"),
+    ("failures", "<u8"),
+    ("last_seq", "<u8"),
+    ("handoff_us", "<f8"),
+])
+
+
+def shm_path(name: str) -> str:
+    return os.path.join(SHM_DIR, f"copytrade-{name}")
+
+
+def _map(path: str, size: int, create: bool) -> np.memmap:
+    if create:
+        with open(path, "wb") as f:
+            f.truncate(size)
+    return np.memmap(path, dtype=np.uint8, mode="r+", shape=(size,))
+
+
+def _to_decimal(x: float) -> Decimal:
+    # repr 是能还原该浮点数的最短十进制串，Hyperliquid 的数量 / 价格字符串（不超过 15 位有效数字）可原样还原
+    s = repr(x)
+    return Decimal(s[:-2] if s.endswith(".0") else s)
+
+
+class TargetRing:
+    """
+    目标持仓环形缓冲区。publish() 写入下一个槽位后再更新头部的帧序号；
+    读取方总是读最新一帧（执行只关心最新目标），槽位序号在复制前后一致才算读到完整的一帧。
+    """
+
+    def __init__(self, path: str, create: bool = False, slots: int = RING_SLOTS):
+        self.path = path
+        if not create:
+            slots = int(np.memmap(path, dtype=RING_HEADER_DTYPE, mode="r", shape=(1,))[0]["slots"])
+        self._raw = _map(path, HEADER_BYTES + slots * SLOT_DTYPE.itemsize, create)
+        self._header = self._raw[:RING_HEADER_DTYPE.itemsize].view(RING_HEADER_DTYPE)
+        self._slots = self._raw[HEADER_BYTES:].view(SLOT_DTYPE)
+        if create:
+            self._header[0]["slots"] = slots
+        self.slots = slots
+
+    @classmethod
+    def create(cls, name: str, slots: int = RING_SLOTS) -> "TargetRing":
+        return cls(shm_path(name), create=True, slots=slots)
+
+    @classmethod
+    def attach(cls, name: str) -> "TargetRing":
+        return cls(shm_path(name))
+
+    def latest_seq(self) -> int:
+        return int(self._header[0]["seq"])
+
+    def publish(self, positions, detected_ns: Optional[int] = None) -> int:
+        """
+        写入一帧目标持仓（PositionRecord 或同结构的字典），返回帧序号。
+        持仓数超过 MAX_POSITIONS 或币种名超过 COIN_BYTES 字节时抛出 ValueError，不写入：
+        截断后的目标会让执行进程把缺少的币种当成已平仓。
+        """
+        n = len(positions)
+        if n > MAX_POSITIONS:
+            raise ValueError(f"目标持仓有 {n} 个，超过共享内存槽位的上限 {MAX_POSITIONS}")
+        rows = [(p['coin'].encode(), p['direction_is_buy'], float(p.get('leverage') or 0), float(p['size']),
+                 float(p.get('mid') or 0)) for p in positions]
+        too_long = [row[0] for row in rows if len(row[0]) > COIN_BYTES]
+        if too_long:
+            raise ValueError(f"币种名超过 {COIN_BYTES} 字节: {', '.join(c.decode() for c in too_long)}")
+        seq = self.latest_seq() + 1
+        slot = self._slots[seq % self.slots]
+        slot["seq"] = 0
+        # 整批赋值，避免逐个字段访问 numpy 标量
+        slot["positions"][:n] = rows
+        slot["count"] = n
+        slot["detected_ns"] = detected_ns if detected_ns is not None else time.perf_counter_ns()
+        slot["published_ns"] = time.perf_counter_ns()
+        slot["seq"] = seq
+        self._header[0]["seq"] = seq
+        return seq
+
+    def read(self, seq: Optional[int] = None) -> Optional[Tuple[int, List[PositionRecord], int, int]]:
+        """读取一帧（默认最新），返回 (帧序号, 持仓列表, detected_ns, published_ns)；还没有数据时返回 None。"""
+        for _ in range(100):
+            seq = self.latest_seq() if seq is None else seq
+            if seq == 0:
+                return None
+            slot = self._slots[seq % self.slots]
+            if int(slot["seq"]) != seq:
+                seq = None
+                continue
+            n = int(slot["count"])
+            rows = slot["positions"][:n].tolist()
+            detected_ns, published_ns = int(slot["detected_ns"]), int(slot["published_ns"])
+            if int(slot["seq"]) != seq:
+                # 复制期间槽位被覆盖（读取方落后了整整一圈），读最新一帧
+                seq = None
+                continue
+            positions = [PositionRecord(coin.decode(), bool(buy), _to_decimal(leverage), _to_decimal(size),
+                                        _to_decimal(mid)) for coin, buy, leverage, size, mid in rows]
+            return seq, positions, detected_ns, published_ns
+        return None
+
+    def close(self):
+        self._raw._mmap.close()
+
+    def unlink(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class AccountBoard:
+    """账户状态表：第 i 行只由负责该账户的执行进程写入。记账只读取，偶尔读到半行更新不影响日志。"""
+
+    def __init__(self, path: str, accounts: int, create: bool = False):
+        self.path = path
+        self._raw = _map(path, accounts * ACCOUNT_DTYPE.itemsize, create)
+        self.rows = self._raw.view(ACCOUNT_DTYPE)
+
+    @classmethod
+    def create(cls, name: str, accounts: int) -> "AccountBoard":
+        return cls(shm_path(name), accounts, create=True)
+
+    @classmethod
+    def attach(cls, name: str, accounts: int) -> "AccountBoard":
+        return cls(shm_path(name), accounts)
+
+    def unlink(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Heartbeats:
+    """每个工作进程一个 int64 心跳（perf_counter_ns），0 表示尚未启动。"""
+
+    def __init__(self, path: str, workers: int, create: bool = False):
+        self.path = path
+        self._raw = _map(path, workers * 8, create)
+        self.values = self._raw.view("<i8")
+
+    @classmethod
+    def create(cls, name: str, workers: int) -> "Heartbeats":
+        return cls(shm_path(name), workers, create=True)
+
+    @classmethod
+    def attach(cls, name: str, workers: int) -> "Heartbeats":
+        return cls(shm_path(name), workers)
+
+    def beat(self, slot: int):
+        self.values[slot] = time.perf_counter_ns()
+
+    def age(self, slot: int) -> Optional[float]:
+        """距上次心跳的秒数，尚未启动时返回 None。"""
+        value = int(self.values[slot])
+        return (time.perf_counter_ns() - value) / 1e9 if value else None
+
+    def unlink(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,423 @@
+# supervisor.py
+# 多进程跟单：检测、执行、记账拆成独立进程，任何一个阶段变慢都不会拖住其他阶段。
+#
+# 用法: python supervisor.py [accounts.json]
+#
+# - 检测进程: 每个目标钱包一个，把目标持仓写入各自的共享内存环形缓冲区（shm.TargetRing），
+#   然后敲一下订阅它的执行进程的门铃（信号量），执行进程无需轮询
+# - 执行进程: EXECUTOR_PROCESSES 个，账户按顺序轮流分配；进程内复用 fanout 的 AccountWorker，
+#   从环形缓冲区读取最新一帧后交给本进程的 FanOut，账户状态写入共享的 shm.AccountBoard
+# - 记账进程: 定期把 AccountBoard 写入 CSV，不访问任何接口
+# - 监督进程（本进程）: 工作进程退出或心跳超时后按退避时间重启；Ctrl+C 时通知全部进程退出
+# 进程之间只传递内存映射数组，不传递 pickle 过的字典；跨进程交接延迟记录在 latency 的 shm_handoff 阶段。
+#
+# 适用范围：执行进程与 fanout.py 一样使用 AccountWorker 的同步逻辑（缩放、取整、杠杆与名义价值上限、
+# 本地持仓视图），不包含 trade.py 中的订单预写日志（journal.py）与重启核对、风控引擎（risk.py）、
+# 价格过期保护（prices.py）和拆单执行（algos.py）。需要这些保护的账户请用 trade.py 单独运行。
+
+import csv
+import multiprocessing as mp
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from shm import AccountBoard, Heartbeats, TargetRing
+
+ACCOUNTS_FILE = "accounts.json"
+# 每个地址一个检测进程；accounts.json 中账户的 target 字段指定跟随哪个地址，缺省为第一个
+TARGET_ADDRESSES = ["0xc20ac4dc4188660cbf555448af52694ca62b0734"]
+FLAG = "1"
+EXECUTOR_PROCESSES = 2
+USE_WS_STREAM = True
+POLL_INTERVAL_SECONDS = 10
+BALANCE_REFRESH_SECONDS = 30
+ACCOUNT_LOG_INTERVAL_SECONDS = 60
+ACCOUNT_LOG_FILE = "pnl_log_accounts.csv"
+HEARTBEAT_INTERVAL_SECONDS = 1
+# 心跳超过该秒数没有更新视为卡死，强制结束后重启
+HANG_TIMEOUT_SECONDS = 60
+RESTART_BACKOFF_SECONDS = 1
+MAX_RESTART_BACKOFF_SECONDS = 30
+# 运行超过该秒数后再退出，退避时间从头计算
+STABLE_SECONDS = 60
+
+
+class StopFlag:
+    """
+    跨进程的退出标志：共享内存中的一个字节，加一个用于唤醒的信号量。不用 multiprocessing.Event：
+    工作进程在 Event.wait() 中被强制结束后，Event.set() 会永远等待它确认唤醒。
+    set() 只释放一次信号量，等待方取得后立即放回，依次唤醒其余等待方；set() 本身从不阻塞。
+    """
+
+    def __init__(self, ctx):
+        self._value = ctx.RawValue('b', 0)
+        self._wake = ctx.Semaphore(0)
+
+    def set(self):
+        if not self._value.value:
+            self._value.value = 1
+            self._wake.release()
+
+    def is_set(self) -> bool:
+        return bool(self._value.value)
+
+    def wait(self, timeout: float) -> bool:
+        if self._value.value:
+            return True
+        if self._wake.acquire(timeout=timeout):
+            self._wake.release()
+        return bool(self._value.value)
+
+
+def _worker_setup(hb_name: str, hb_count: int) -> Heartbeats:
+    # Ctrl+C 会发给整个进程组，由监督进程统一通知退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    return Heartbeats.attach(hb_name, hb_count)
+
+
+# ---------- 检测进程 ----------
+def detector_main(hb_name: str, hb_count: int, slot: int, stop_event, address: str, ring_name: str, doorbells,
+                  use_ws: bool = USE_WS_STREAM, poll_interval: float = POLL_INTERVAL_SECONDS):
+    """跟踪一个地址，目标持仓（按币种的数量与方向）变化时写入环形缓冲区并敲响订阅者的门铃。"""
+    from monitor import PositionStream, fetch_user_positions
+
+    heartbeats = _worker_setup(hb_name, hb_count)
+    ring = TargetRing.attach(ring_name)
+    stream = None
+    if use_ws:
+        stream = PositionStream(address)
+        stream.start()
+    last_simplified = None
+    # 上一次处理的推送持仓簿版本，发布期间到达的推送不会等到超时才被处理
+    version = 0
+    wait = min(poll_interval, HEARTBEAT_INTERVAL_SECONDS)
+    next_poll = 0.0
+    try:
+        while not stop_event.is_set():
+            heartbeats.beat(slot)
+            live = stream is not None and stream.is_live()
+            if live or time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + poll_interval
+                try:
+                    if live:
+                        version, positions = stream.versioned_snapshot()
+                    else:
+                        positions = fetch_user_positions(address) or []
+                    detected_ns = time.perf_counter_ns()
+                    simplified = {p['coin']: (p['size'], p['direction_is_buy']) for p in positions}
+                    if simplified != last_simplified:
+                        seq = ring.publish(positions, detected_ns)
+                        for bell in doorbells:
+                            bell.release()
+                        print(f"🔔 [{address[:10]}] 目标仓位变化（第 {seq} 帧，{len(positions)} 个仓位）。")
+                        last_simplified = simplified
+                except Exception as e:
+                    print(f"💥 [{address[:10]}] 检测循环发生错误: {type(e).__name__} - {e}")
+            if live:
+                stream.wait_for_change(timeout=wait, since=version)
+            else:
+                stop_event.wait(wait)
+    finally:
+        if stream is not None:
+            stream.stop()
+
+
+# ---------- 执行进程 ----------
+def executor_main(hb_name: str, hb_count: int, slot: int, stop_event, index: int, accounts: List[Dict],
+                  rows: List[int], board_name: str, board_size: int, rings: Dict[str, str], doorbell,
+                  flag: str = FLAG, domain: Optional[str] = None, registry_cache: Optional[str] = None,
+                  balance_interval: float = BALANCE_REFRESH_SECONDS):
+    """
+    运行一组账户的 worker。accounts 为 accounts.json 中的条目，rows 为它们在 AccountBoard 中的行号，
+    rings 为 {目标地址: 环形缓冲区名称}。
+    """
+    from fanout import AccountConfig, AccountWorker, FanOut
+    from instruments import InstrumentRegistry
+    from latency import recorder
+    from symbols import SymbolIndex
+
+    heartbeats = _worker_setup(hb_name, hb_count)
+    board = AccountBoard.attach(board_name, board_size)
+    registry = InstrumentRegistry(flag=flag, cache_file=registry_cache).load()
+    # 只由第一个执行进程向 OKX 刷新并写缓存，其余进程定期重新读盘
+    if index == 0:
+        registry.start_background_refresh()
+    symbols = SymbolIndex(registry)
+    configs = [AccountConfig.from_dict(d) for d in accounts]
+    hubs: Dict[str, FanOut] = {}
+    workers = []
+    for config, row in zip(configs, rows):
+        worker = AccountWorker(config, registry, symbols=symbols, domain=domain)
+        worker.board_row = row
+        workers.append(worker)
+        hubs.setdefault(config.target, FanOut([]))
+        hubs[config.target].workers.append(worker)
+    for hub in hubs.values():
+        hub.start()
+    readers = {address: TargetRing.attach(rings[address]) for address in hubs}
+    print(f"🚀 执行进程 {index}: {len(workers)} 个账户（{', '.join(c.name for c in configs)}），"
+          f"跟随 {len(readers)} 个目标。")
+
+    def publish_board():
+        for w in workers:
+            r = board.rows[w.board_row]
+            r["positions"] = len(w.reconciler.positions)
+            r["orders"] = w.orders
+            r["failures"] = w.failures
+            r["last_seq"] = w.done_seq
+            r["updated_ns"] = time.perf_counter_ns()
+
+    def refresh_balances():
+        next_reload = time.monotonic() + registry.refresh_interval
+        while not stop_event.wait(balance_interval):
+            if index != 0 and time.monotonic() >= next_reload:
+                next_reload += registry.refresh_interval
+                registry.load()
+            for w in workers:
+                try:
+                    balance = w.account_api.get_account_balance()
+                    positions = w.account_api.get_positions()
+                except Exception as e:
+                    print(f"  - ⚠️ [{w.config.name}] 获取余额失败: {e}")
+                    continue
+                r = board.rows[w.board_row]
+                if balance.get('code') == '0' and balance.get('data'):
+                    r["equity"] = float(balance['data'][0].get('totalEq') or 0)
+                if positions.get('code') == '0':
+                    data = positions.get('data') or []
+                    r["upl"] = sum(float(p.get('upl') or 0) for p in data)
+                    r["gross_usd"] = sum(abs(float(p.get('notionalUsd') or 0)) for p in data)
+            publish_board()
+
+    threading.Thread(target=refresh_balances, name="balances", daemon=True).start()
+    last_seq = {address: 0 for address in readers}
+    started_ns = time.perf_counter_ns()
+    try:
+        while not stop_event.is_set():
+            heartbeats.beat(slot)
+            for address, ring in readers.items():
+                if ring.latest_seq() <= last_seq[address]:
+                    continue
+                frame = ring.read()
+                if frame is None:
+                    continue
+                received_ns = time.perf_counter_ns()
+                seq, positions, detected_ns, published_ns = frame
+                last_seq[address] = seq
+                hubs[address].publish(positions, detected_ns / 1e9)
+                # 启动（重启）前已写入的帧是补读，不计入交接延迟
+                if published_ns >= started_ns:
+                    handoff = (received_ns - published_ns) / 1e9
+                    recorder.record("shm_handoff", handoff)
+                    for w in hubs[address].workers:
+                        board.rows[w.board_row]["handoff_us"] = handoff * 1e6
+            publish_board()
+            doorbell.acquire(timeout=HEARTBEAT_INTERVAL_SECONDS)
+    finally:
+        for hub in hubs.values():
+            hub.stop()
+        publish_board()
+        registry.stop()
+
+
+# ---------- 记账进程 ----------
+def accountant_main(hb_name: str, hb_count: int, slot: int, stop_event, board_name: str, names: List[str],
+                    log_file: str = ACCOUNT_LOG_FILE, interval: float = ACCOUNT_LOG_INTERVAL_SECONDS):
+    """定期把每个账户的状态追加到 CSV（只读共享内存）。"""
+    heartbeats = _worker_setup(hb_name, hb_count)
+    board = AccountBoard.attach(board_name, len(names))
+    new_file = not os.path.exists(log_file)
+    next_log = time.monotonic() + interval
+    with open(log_file, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["Timestamp", "Account", "Equity", "UPL", "GrossUSD", "Positions", "Orders",
+                             "Failures", "LastSeq", "HandoffUs"])
+        while not stop_event.wait(HEARTBEAT_INTERVAL_SECONDS):
+            heartbeats.beat(slot)
+            if time.monotonic() < next_log:
+                continue
+            next_log += interval
+            rows = board.rows.copy()
+            ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for name, r in zip(names, rows):
+                if not r["updated_ns"]:
+                    continue
+                writer.writerow([ts, name, f"{r['equity']:.2f}", f"{r['upl']:.2f}", f"{r['gross_usd']:.2f}",
+                                 int(r["positions"]), int(r["orders"]), int(r["failures"]), int(r["last_seq"]),
+                                 f"{r['handoff_us']:.1f}"])
+            f.flush()
+
+
+# ---------- 监督 ----------
+class WorkerProcess:
+    """一个受监督的工作进程：入口函数与参数固定，重启时用同样的参数重新创建进程。"""
+
+    def __init__(self, name: str, target, args: tuple, slot: int):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.slot = slot
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.failures = 0
+        self.restart_at: Optional[float] = None
+
+
+class Supervisor:
+    """
+    启动并看护全部工作进程。poll() 检查一次：已退出的进程按退避时间重启，
+    心跳超过 hang_timeout 没有更新（或启动后一直没有心跳）的进程先强制结束。
+    """
+
+    def __init__(self, heartbeats: Heartbeats, hb_name: str, hb_count: int, ctx=None,
+                 hang_timeout: float = HANG_TIMEOUT_SECONDS, backoff: float = RESTART_BACKOFF_SECONDS,
+                 max_backoff: float = MAX_RESTART_BACKOFF_SECONDS):
+        self.heartbeats = heartbeats
+        self.hb_name = hb_name
+        self.hb_count = hb_count
+        self.ctx = ctx or mp.get_context("spawn")
+        self.stop_event = StopFlag(self.ctx)
+        self.hang_timeout = hang_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.workers: List[WorkerProcess] = []
+        # 退出时需要唤醒的信号量（执行进程的门铃）
+        self.doorbells = []
+
+    def add(self, name: str, target, *args) -> WorkerProcess:
+        worker = WorkerProcess(name, target, args, len(self.workers))
+        if worker.slot >= self.hb_count:
+            raise ValueError(f"心跳槽位不足: {self.hb_count}")
+        self.workers.append(worker)
+        return worker
+
+    def start(self):
+        for worker in self.workers:
+            self._spawn(worker)
+
+    def _spawn(self, worker: WorkerProcess):
+        self.heartbeats.values[worker.slot] = 0
+        worker.process = self.ctx.Process(
+            target=worker.target, name=worker.name, daemon=True,
+            args=(self.hb_name, self.hb_count, worker.slot, self.stop_event) + worker.args)
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+
+    def poll(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            process = worker.process
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    worker.restarts += 1
+                    print(f"🔄 重启 {worker.name}（第 {worker.restarts} 次）")
+                    self._spawn(worker)
+                continue
+            if process.is_alive():
+                age = self.heartbeats.age(worker.slot)
+                if age is None:
+                    age = now - worker.started_at
+                if age > self.hang_timeout:
+                    print(f"⏱️ {worker.name} 已 {age:.0f} 秒没有心跳，强制结束。")
+                    process.kill()
+                    process.join(timeout=5)
+                else:
+                    continue
+            if now - worker.started_at > STABLE_SECONDS:
+                worker.failures = 0
+            delay = min(self.backoff * 2 ** worker.failures, self.max_backoff)
+            worker.failures += 1
+            worker.restart_at = now + delay
+            print(f"💥 {worker.name} 已退出（退出码 {process.exitcode}），{delay:.0f} 秒后重启。")
+
+    def run(self, interval: float = HEARTBEAT_INTERVAL_SECONDS):
+        self.start()
+        while not self.stop_event.is_set():
+            time.sleep(interval)
+            self.poll()
+
+    def stop(self, timeout: float = 10):
+        self.stop_event.set()
+        for bell in self.doorbells:
+            bell.release()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout=max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join(timeout=5)
+
+    def stats(self) -> List[Dict]:
+        return [{"name": w.name, "pid": w.process.pid if w.process else None,
+                 "alive": bool(w.process and w.process.is_alive()), "restarts": w.restarts,
+                 "heartbeat_age": self.heartbeats.age(w.slot)} for w in self.workers]
+
+
+def build(accounts: List[Dict], addresses: List[str] = TARGET_ADDRESSES, executors: int = EXECUTOR_PROCESSES,
+          flag: str = FLAG, use_ws: bool = USE_WS_STREAM, domain: Optional[str] = None,
+          registry_cache: Optional[str] = None, log_file: str = ACCOUNT_LOG_FILE,
+          log_interval: float = ACCOUNT_LOG_INTERVAL_SECONDS, name: Optional[str] = None):
+    """创建共享内存并登记全部工作进程，返回 (Supervisor, 需要在退出时删除的共享内存列表)。"""
+    name = name or f"{os.getpid()}"
+    accounts = [dict(a, target=a.get("target") or addresses[0]) for a in accounts]
+    executors = max(1, min(executors, len(accounts)))
+    hb_count = len(addresses) + executors + 1
+    hb_name = f"{name}-heartbeats"
+    heartbeats = Heartbeats.create(hb_name, hb_count)
+    board_name = f"{name}-accounts"
+    board = AccountBoard.create(board_name, len(accounts))
+    rings = {address: f"{name}-targets-{i}" for i, address in enumerate(addresses)}
+    segments = [heartbeats, board] + [TargetRing.create(ring) for ring in rings.values()]
+    sup = Supervisor(heartbeats, hb_name, hb_count)
+
+    # 账户按顺序轮流分配给执行进程
+    groups = [list(range(k, len(accounts), executors)) for k in range(executors)]
+    doorbells = [sup.ctx.Semaphore(0) for _ in groups]
+    sup.doorbells = doorbells
+    subscribers: Dict[str, list] = {address: [] for address in addresses}
+    for k, rows in enumerate(groups):
+        targets = {accounts[i]["target"] for i in rows}
+        for address in targets:
+            if address not in subscribers:
+                raise ValueError(f"账户跟随的地址 {address} 不在 TARGET_ADDRESSES 中")
+            subscribers[address].append(doorbells[k])
+    for i, address in enumerate(addresses):
+        sup.add(f"detector-{i}", detector_main, address, rings[address], subscribers[address], use_ws)
+    for k, rows in enumerate(groups):
+        sup.add(f"executor-{k}", executor_main, k, [accounts[i] for i in rows], rows, board_name, len(accounts),
+                rings, doorbells[k], flag, domain, registry_cache)
+    sup.add("accountant", accountant_main, board_name, [a["name"] for a in accounts], log_file, log_interval)
+    return sup, segments
+
+
+if __name__ == "__main__":
+    import json
+
+    from instruments import InstrumentRegistry
+
+    with open(sys.argv[1] if len(sys.argv) > 1 else ACCOUNTS_FILE, 'r', encoding='utf-8') as f:
+        accounts = [d for d in json.load(f) if d.get("enabled", True)]
+    # 先在监督进程中刷新合约缓存，执行进程启动（及重启）时直接读盘
+    InstrumentRegistry(flag=FLAG).load()
+    supervisor, segments = build(accounts)
+    print(f"🎉 多进程跟单启动：{len(TARGET_ADDRESSES)} 个检测进程，"
+          f"{sum(1 for w in supervisor.workers if w.name.startswith('executor'))} 个执行进程，"
+          f"{len(accounts)} 个账户。")
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        print("\n🛑 程序被手动中断 (Ctrl+C)，正在通知全部进程退出...")
+    finally:
+        supervisor.stop()
+        for s in supervisor.stats():
+            print(f"  - {s['name']}: 重启 {s['restarts']} 次")
+        for segment in segments:
+            segment.unlink()
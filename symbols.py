@@ -0,0 +1,140 @@
+# symbols.py
+# Hyperliquid 币种 ↔ OKX 合约的双向索引。启动时由 Hyperliquid meta 与 OKX 合约列表一次建好，
+# sync_positions 每个仓位只做一次字典查找，同时得到合约 ID 与数量换算倍数。
+#
+# - 名称相同: BTC → BTC-USDT-SWAP，倍数 1
+# - k 前缀: Hyperliquid 以 1000 个为单位交易的低价币，kPEPE → PEPE-USDT-SWAP，1 个 kPEPE = 1000 PEPE
+# - ALIASES: 两边名称不同的币种手动指定
+# - 现货 / 其他 dex 的名称（@107、PURR/USDC、xyz:TSLA）以及OKX没有上线的币种进入不可交易集合
+# OKX 合约列表刷新后（InstrumentRegistry 整体替换字典），下一次查找时只重新匹配受影响的币种。
+
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from clients import get_info
+from monitor import post_info
+
+SETTLE_CCY = "USDT"
+K_PREFIX_MULTIPLIER = Decimal('1000')
+# Hyperliquid 币种 -> (OKX 币种, 1 个 Hyperliquid 单位对应的 OKX 币数)
+ALIASES: Dict[str, Tuple[str, Decimal]] = {}
+
+
+class SymbolMapping:
+    """一个可交易币种的映射。OKX 币数 = Hyperliquid 数量 × multiplier，OKX 单价 = Hyperliquid 价格 ÷ multiplier。"""
+
+    __slots__ = ("coin", "inst_id", "multiplier")
+
+    def __init__(self, coin: str, inst_id: str, multiplier: Decimal = Decimal('1')):
+        self.coin = coin
+        self.inst_id = inst_id
+        self.multiplier = multiplier
+
+    def __repr__(self):
+        mult = f" ×{self.multiplier}" if self.multiplier != 1 else ""
+        return f"SymbolMapping({self.coin} → {self.inst_id}{mult})"
+
+
+class SymbolIndex:
+    """
+    双向币种索引。build() 读取 Hyperliquid meta 预先匹配全部币种；之后 meta 中没有的新币种在第一次查找时匹配并缓存。
+    更新时整体替换内部字典，读取方无需加锁。
+    """
+
+    def __init__(self, registry, aliases: Optional[Dict[str, Tuple[str, Decimal]]] = None,
+                 settle_ccy: str = SETTLE_CCY):
+        self.registry = registry
+        self.aliases = ALIASES if aliases is None else aliases
+        self.settle_ccy = settle_ccy
+        self._by_coin: Dict[str, SymbolMapping] = {}
+        self._by_inst: Dict[str, str] = {}
+        self.not_tradable: Set[str] = set()
+        # 建索引时使用的合约参数字典（按对象身份判断注册表是否已刷新）
+        self._specs = registry.specs()
+
+    # ---------- 查找 ----------
+    def resolve(self, coin: str) -> Optional[SymbolMapping]:
+        """Hyperliquid 币种 → 映射；不可交易时返回 None。"""
+        if self.registry.specs() is not self._specs:
+            self.refresh()
+        mapping = self._by_coin.get(coin)
+        if mapping is not None or coin in self.not_tradable:
+            return mapping
+        return self._add([coin]).get(coin)
+
+    def inst_id(self, coin: str) -> Optional[str]:
+        mapping = self.resolve(coin)
+        return mapping.inst_id if mapping is not None else None
+
+    def coin_for(self, inst_id: str) -> Optional[str]:
+        """OKX 合约 → Hyperliquid 币种（只包含已匹配过的币种）。"""
+        return self._by_inst.get(inst_id)
+
+    def __len__(self) -> int:
+        return len(self._by_coin)
+
+    # ---------- 构建与刷新 ----------
+    def build(self, hl_coins: Optional[Iterable[str]] = None) -> "SymbolIndex":
+        """hl_coins 为空时请求 Hyperliquid meta 取得全部永续币种（已下架的除外）。"""
+        if hl_coins is None:
+            meta = post_info(get_info(), {"type": "meta"}) or {}
+            hl_coins = [a["name"] for a in meta.get("universe", []) if a.get("name") and not a.get("isDelisted")]
+        self._specs = self.registry.specs()
+        self._by_coin, self._by_inst, self.not_tradable = {}, {}, set()
+        self._add(hl_coins)
+        if self._by_coin:
+            scaled = [m.coin for m in self._by_coin.values() if m.multiplier != 1]
+            print(f"✅ 币种索引: {len(self._by_coin)} 个可交易"
+                  + (f"（含换算: {', '.join(sorted(scaled))}）" if scaled else "")
+                  + f"，{len(self.not_tradable)} 个在OKX上不可交易。")
+        return self
+
+    def refresh(self):
+        """OKX 合约列表变化后增量更新：只重新匹配指向已下线合约的币种，以及有新合约上线时的不可交易币种。"""
+        specs = self.registry.specs()
+        old = self._specs
+        self._specs = specs
+        removed = set(old) - set(specs)
+        added = set(specs) - set(old)
+        stale = [c for c, m in self._by_coin.items() if m.inst_id in removed]
+        retry = list(self.not_tradable) if added else []
+        if not stale and not retry:
+            return
+        by_coin = {c: m for c, m in self._by_coin.items() if m.inst_id not in removed}
+        by_inst = {i: c for i, c in self._by_inst.items() if i not in removed}
+        not_tradable = self.not_tradable - set(retry)
+        self._by_coin, self._by_inst, self.not_tradable = by_coin, by_inst, not_tradable
+        newly = self._add(stale + retry)
+        if newly:
+            print(f"🆕 币种索引新增可交易: {', '.join(sorted(newly))}")
+
+    def _add(self, coins: Iterable[str]) -> Dict[str, SymbolMapping]:
+        """匹配一批币种并写入索引（复制后整体替换），返回其中可交易的映射。"""
+        by_coin, by_inst, not_tradable = dict(self._by_coin), dict(self._by_inst), set(self.not_tradable)
+        found = {}
+        for coin in coins:
+            mapping = self._match(coin)
+            if mapping is None:
+                not_tradable.add(coin)
+                continue
+            by_coin[coin] = found[coin] = mapping
+            by_inst[mapping.inst_id] = coin
+        self._by_coin, self._by_inst, self.not_tradable = by_coin, by_inst, not_tradable
+        return found
+
+    def _match(self, coin: str) -> Optional[SymbolMapping]:
+        specs = self._specs
+        if coin in self.aliases:
+            base, multiplier = self.aliases[coin]
+            inst_id = f"{base}-{self.settle_ccy}-SWAP"
+            return SymbolMapping(coin, inst_id, Decimal(multiplier)) if inst_id in specs else None
+        if not coin or coin.startswith("@") or "/" in coin or ":" in coin:
+            return None
+        inst_id = f"{coin}-{self.settle_ccy}-SWAP"
+        if inst_id in specs:
+            return SymbolMapping(coin, inst_id)
+        if len(coin) > 1 and coin[0] == "k" and coin[1].isupper():
+            inst_id = f"{coin[1:]}-{self.settle_ccy}-SWAP"
+            if inst_id in specs:
+                return SymbolMapping(coin, inst_id, K_PREFIX_MULTIPLIER)
+        return None
@@ -0,0 +1,166 @@
+# test_account_state.py
+# AccountStateCache 对本地假 OKX 私有 WebSocket（conftest.FakeServer）的测试：
+# 登录签名与订阅、快照替换 REST 回退期间的持仓、重连时清除新鲜度、数据超过 max_age 时回退 REST。
+
+import base64
+import hashlib
+import hmac
+
+import pytest
+
+from account_state import AccountStateCache
+
+API_KEY, SECRET, PASSPHRASE = "key", "secret", "pass"
+
+
+def pos(inst_id, n):
+    return {"instId": inst_id, "posSide": "net", "pos": n, "lever": "5"}
+
+
+class FakeAccountAPI:
+    """REST 接口：返回值由测试直接修改，记录调用次数。"""
+
+    def __init__(self):
+        self.positions = [pos("BTC-USDT-SWAP", "3")]
+        self.balance = {"totalEq": "1000"}
+        self.calls = []
+
+    def get_positions(self, *args, **kwargs):
+        self.calls.append("get_positions")
+        return {"code": "0", "msg": "", "data": [dict(p) for p in self.positions]}
+
+    def get_account_balance(self, *args, **kwargs):
+        self.calls.append("get_account_balance")
+        return {"code": "0", "msg": "", "data": [dict(self.balance)]}
+
+    def set_leverage(self, **kwargs):
+        return {"code": "0", "data": [kwargs]}
+
+
+class FakeOkx:
+    """校验登录签名，订阅后按 snapshot 推送持仓与余额（snapshot 为 None 时不推送）。"""
+
+    def __init__(self, fake_server):
+        self.snapshot = [pos("ETH-USDT-SWAP", "-2")]
+        self.accept_login = True
+        self.server = fake_server(on_ws=self.on_ws)
+
+    def on_ws(self, conn, msg):
+        if msg == "ping":
+            conn.send("pong")
+        elif msg.get("op") == "login":
+            args = msg["args"][0]
+            mac = hmac.new(SECRET.encode(), f"{args['timestamp']}GET/users/self/verify".encode(), hashlib.sha256)
+            ok = (self.accept_login and args["apiKey"] == API_KEY and args["passphrase"] == PASSPHRASE
+                  and args["sign"] == base64.b64encode(mac.digest()).decode())
+            conn.send({"event": "login", "code": "0" if ok else "60009", "msg": "" if ok else "Login failed"})
+        elif msg.get("op") == "subscribe":
+            for arg in msg["args"]:
+                conn.send({"event": "subscribe", "arg": arg})
+            if self.snapshot is not None:
+                self.push_positions(self.snapshot, "snapshot")
+                self.server.send({"arg": {"channel": "account"}, "data": [{"totalEq": "2000"}]})
+
+    def push_positions(self, data, event_type="event_update"):
+        self.server.send({"arg": {"channel": "positions", "instType": "ANY"}, "data": data, "eventType": event_type})
+
+
+@pytest.fixture
+def okx(fake_server):
+    return FakeOkx(fake_server)
+
+
+@pytest.fixture
+def api():
+    return FakeAccountAPI()
+
+
+@pytest.fixture
+def make_cache(okx, api):
+    caches = []
+
+    def make(**kwargs):
+        cache = AccountStateCache(api, API_KEY, SECRET, PASSPHRASE, ws_url=okx.server.ws_url,
+                                  reconnect_delay=0.05, max_reconnect_delay=0.05, **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.stop()
+
+
+def inst_ids(res):
+    return sorted(p["instId"] for p in res["data"])
+
+
+def test_login_subscribes_and_serves_from_cache(okx, api, make_cache):
+    cache = make_cache()
+    cache.start()
+    assert okx.server.wait_for(lambda: cache.is_fresh("positions") and cache.is_fresh("account"))
+    channels = [a["channel"] for m in okx.server.received if isinstance(m, dict) and m.get("op") == "subscribe"
+                for a in m["args"]]
+    assert channels == ["positions", "account", "orders"]
+    assert inst_ids(cache.get_positions()) == ["ETH-USDT-SWAP"]
+    assert cache.get_account_balance()["data"][0]["totalEq"] == "2000"
+    assert api.calls == [] and cache.rest_fallbacks == 0
+    # 未缓存的接口原样转发
+    assert cache.set_leverage(instId="ETH-USDT-SWAP", lever="3")["code"] == "0"
+
+
+def test_login_failure_falls_back_to_rest(okx, api, make_cache):
+    okx.accept_login = False
+    cache = make_cache()
+    cache.start()
+    assert okx.server.wait_for(lambda: any(isinstance(m, dict) and m.get("op") == "login" for m in okx.server.received))
+    assert not okx.server.wait_for(lambda: cache.is_fresh("positions"), timeout=0.3)
+    assert inst_ids(cache.get_positions()) == ["BTC-USDT-SWAP"]
+    assert api.calls == ["get_positions"]
+
+
+def test_snapshot_replaces_rest_positions(okx, api, make_cache):
+    updates = []
+    cache = make_cache()
+    cache.add_state_listener(lambda channel, data: updates.append((channel, sorted(p["instId"] for p in data))))
+    # 连接之前的 REST 回退写入 BTC，登录后的快照只有 ETH
+    assert inst_ids(cache.get_positions()) == ["BTC-USDT-SWAP"]
+    cache.start()
+    assert okx.server.wait_for(lambda: cache.is_fresh("positions"))
+    assert inst_ids(cache.get_positions()) == ["ETH-USDT-SWAP"]
+
+    # 事件推送只包含变化的持仓：pos 为 0 的移除，其余合并
+    okx.push_positions([pos("ETH-USDT-SWAP", "0"), pos("SOL-USDT-SWAP", "7")])
+    assert okx.server.wait_for(lambda: updates[-1] == ("positions", ["SOL-USDT-SWAP"]))
+    assert inst_ids(cache.get_positions()) == ["SOL-USDT-SWAP"]
+    assert updates[0] == ("positions", ["BTC-USDT-SWAP"])
+
+
+def test_reconnect_clears_freshness_until_new_push(okx, api, make_cache):
+    cache = make_cache()
+    cache.start()
+    assert okx.server.wait_for(lambda: cache.is_fresh("positions"))
+
+    # 新连接登录后不推送快照：在第一条推送到达之前一律回退 REST，不能沿用断线前的更新时间
+    okx.snapshot = None
+    okx.server.drop()
+    assert okx.server.wait_for(lambda: okx.server.connections == 2 and cache._logged_in)
+    assert not cache.is_fresh("positions") and not cache.is_fresh("account")
+    api.positions = [pos("BTC-USDT-SWAP", "4")]
+    assert inst_ids(cache.get_positions()) == ["BTC-USDT-SWAP"]
+    assert api.calls == ["get_positions"]
+
+    okx.push_positions([pos("DOGE-USDT-SWAP", "10")])
+    assert okx.server.wait_for(lambda: cache.is_fresh("positions"))
+    # 新连接的第一条推送视为快照，替换 REST 回退期间写入的持仓
+    assert inst_ids(cache.get_positions()) == ["DOGE-USDT-SWAP"]
+    assert api.calls == ["get_positions"]
+
+
+def test_stale_data_falls_back_to_rest(okx, api, make_cache):
+    cache = make_cache(max_age=0.2)
+    cache.start()
+    assert okx.server.wait_for(lambda: cache.is_fresh("positions"))
+    assert okx.server.wait_for(lambda: not cache.is_fresh("positions"), timeout=1)
+    assert inst_ids(cache.get_positions()) == ["BTC-USDT-SWAP"]
+    assert cache.get_account_balance()["data"][0]["totalEq"] == "1000"
+    assert api.calls == ["get_positions", "get_account_balance"] and cache.rest_fallbacks == 2
@@ -0,0 +1,92 @@
+# test_fastcore.py
+# fastcore.plan_orders 与参考实现 decimal_order 的随机对拍。运行: python -m pytest -q
+# 约一半的样本刻意落在边界上（张数差恰好是 lotSz 的整数倍、恰好等于 minSz、差值为 0、极大 / 极小的数量），
+# 合约数分别低于和高于 FAST_PATH_MIN_INSTRUMENTS，两条路径都要逐行一致。
+
+import random
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from fastcore import (BELOW_MIN, FAST_PATH_MIN_INSTRUMENTS, ORDER, InstrumentTable, decimal_order, format_size,
+                      plan_orders, plan_orders_array)
+from instruments import InstrumentSpec
+
+CT_VALS = ["0.0001", "0.001", "0.01", "0.1", "1", "10", "100", "1000"]
+LOTS = ["0.0001", "0.001", "0.01", "0.1", "1", "5", "10"]
+
+
+def make_specs(rng: random.Random):
+    specs = []
+    for i in range(64):
+        lot = Decimal(rng.choice(LOTS))
+        min_sz = lot * rng.choice([1, 1, 2, 10]) if rng.random() < 0.9 else Decimal(rng.choice(LOTS))
+        state = "live" if rng.random() < 0.95 else "suspend"
+        specs.append(InstrumentSpec(f"C{i}-USDT-SWAP", Decimal(rng.choice(CT_VALS)), lot, min_sz, Decimal("0.1"), state))
+    specs.append(InstrumentSpec("BAD-USDT-SWAP", Decimal("0"), Decimal("1"), Decimal("1"), Decimal("0.1")))
+    return specs
+
+
+def make_cases(rng: random.Random, specs, n: int):
+    """(合约 ID, 带符号目标币数量, 带符号当前张数)。"""
+    def rand_dec(max_exp):
+        digits = rng.randint(1, 12)
+        return Decimal(rng.randint(0, 10 ** digits)).scaleb(rng.randint(-10, max_exp))
+
+    cases = []
+    for _ in range(n):
+        if rng.random() < 0.02:
+            cases.append(("MISSING-USDT-SWAP", rand_dec(4), Decimal("0")))
+            continue
+        spec = rng.choice(specs)
+        my_lots = rand_dec(4) * rng.choice([1, -1]) if rng.random() < 0.8 else Decimal("0")
+        kind = rng.random()
+        if kind < 0.5 or spec.ct_val <= 0:
+            target = rand_dec(4) * rng.choice([1, -1])
+        else:
+            step = spec.min_sz if kind < 0.6 else (Decimal(0) if kind < 0.7 else spec.lot_sz * rng.randint(0, 10 ** rng.randint(0, 9)))
+            target = (my_lots + step * rng.choice([1, -1])) * spec.ct_val
+        cases.append((spec.inst_id, target, my_lots))
+    return cases
+
+
+def assert_same(table, plan, cases):
+    for k, (inst_id, target, mine) in enumerate(cases):
+        spec = table.specs[table.index.get(inst_id, table.unknown)]
+        expected = decimal_order(spec, target, mine)
+        got = (int(plan.status[k]), int(plan.side[k]), int(plan.steps[k]))
+        assert got == expected, f"{inst_id} target={target} mine={mine}"
+        if expected[0] in (ORDER, BELOW_MIN):
+            assert plan.size_str(k) == format_size(expected[2], spec.lot_sz)
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("n", [1, FAST_PATH_MIN_INSTRUMENTS - 1, FAST_PATH_MIN_INSTRUMENTS, 5000])
+def test_plan_orders_matches_decimal(seed, n):
+    rng = random.Random(seed)
+    specs = make_specs(rng)
+    table = InstrumentTable({s.inst_id: s for s in specs})
+    cases = make_cases(rng, specs, n)
+    plan = plan_orders(table, [c[0] for c in cases], [c[1] for c in cases], [c[2] for c in cases])
+    assert_same(table, plan, cases)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_plan_orders_array_matches_decimal(seed):
+    # 数组版本不经过合约数的分流，少量合约时也走向量化计算
+    rng = random.Random(seed)
+    specs = make_specs(rng)
+    table = InstrumentTable({s.inst_id: s for s in specs})
+    cases = make_cases(rng, specs, 8)
+    rows = table.lookup([c[0] for c in cases])
+    t_coins = np.array([float(c[1]) for c in cases])
+    mine = np.array([float(c[2]) for c in cases])
+    plan = plan_orders_array(table, rows, t_coins, mine, lambda k: (cases[k][1], cases[k][2]))
+    assert_same(table, plan, cases)
+
+
+def test_plan_orders_empty():
+    table = InstrumentTable({})
+    plan = plan_orders(table, [], [], [])
+    assert list(plan.status) == [] and list(plan.steps) == []
@@ -0,0 +1,142 @@
+# test_monitor.py
+# PositionStream 对本地假 Hyperliquid 服务器（conftest.FakeServer）的端到端测试：
+# webData2 快照、userFills 增量（重复与乱序推送、有界去重）、断线后的 REST 全量同步、is_live 与 wait_for_change(since=...)。
+
+import pytest
+
+import monitor
+from monitor import PositionStream
+
+ADDRESS = "0x00000000000000000000000000000000000000aa"
+
+
+def position(coin, szi, lev=5):
+    return {"position": {"coin": coin, "szi": szi, "leverage": {"type": "cross", "value": lev}}}
+
+
+class FakeHyperliquid:
+    """REST /info 返回的状态由测试直接修改。"""
+
+    def __init__(self, fake_server):
+        self.mids = {"BTC": "60000", "ETH": "3000"}
+        self.positions = [position("BTC", "1.5")]
+        self.server = fake_server(on_post=self.on_post)
+
+    def on_post(self, path, payload):
+        if payload["type"] == "allMids":
+            return 200, self.mids
+        if payload["type"] == "clearinghouseState":
+            return 200, {"assetPositions": self.positions}
+        return 400, None
+
+    def fills(self, *fills, snapshot=False):
+        self.server.send({"channel": "userFills",
+                          "data": {"user": ADDRESS, "isSnapshot": snapshot, "fills": list(fills)}})
+
+
+def fill(coin, side, sz, start, tid, t):
+    return {"coin": coin, "side": side, "sz": sz, "startPosition": start, "tid": tid, "time": t, "hash": f"0x{tid}"}
+
+
+@pytest.fixture
+def hl(fake_server):
+    return FakeHyperliquid(fake_server)
+
+
+@pytest.fixture
+def stream(hl):
+    stream = PositionStream(ADDRESS, base_url=hl.server.url, reconnect_delay=0.05, max_reconnect_delay=0.05)
+    stream.start()
+    assert hl.server.wait_for(stream.is_live)
+    yield stream
+    stream.stop()
+
+
+def sizes(stream):
+    return {p["coin"]: str(p["size"] if p["direction_is_buy"] else -p["size"]) for p in stream.snapshot()}
+
+
+def test_connect_subscribes_and_resyncs(hl, stream):
+    subs = [m["subscription"]["type"] for m in hl.server.received if m.get("method") == "subscribe"]
+    assert sorted(subs) == ["allMids", "userFills", "webData2"]
+    assert sizes(stream) == {"BTC": "1.5"}
+    assert stream.snapshot()[0]["mid"] == 60000
+
+
+def test_webdata2_snapshot_replaces_book(hl, stream):
+    version, _ = stream.versioned_snapshot()
+    hl.server.send({"channel": "webData2", "data": {"clearinghouseState": {
+        "assetPositions": [position("ETH", "-2"), position("SOL", "0")]}}})
+    assert stream.wait_for_change(5, since=version)
+    assert sizes(stream) == {"ETH": "-2"}
+
+    # 数量不变的快照不递增版本号
+    version, _ = stream.versioned_snapshot()
+    hl.server.send({"channel": "webData2", "data": {"clearinghouseState": {"assetPositions": [position("ETH", "-2")]}}})
+    assert not stream.wait_for_change(0.3, since=version)
+
+
+def test_user_fills_duplicate_and_out_of_order(hl, stream):
+    version, _ = stream.versioned_snapshot()
+    first = fill("BTC", "B", "0.5", "1.5", tid=1, t=1000)
+    second = fill("BTC", "A", "1", "2", tid=2, t=2000)
+    # 后一笔先到
+    hl.fills(second)
+    assert stream.wait_for_change(5, since=version)
+    assert sizes(stream) == {"BTC": "1"}
+
+    version, _ = stream.versioned_snapshot()
+    hl.fills(first, second)
+    # 历史快照不计入
+    hl.fills(fill("BTC", "A", "1", "1", tid=3, t=3000), snapshot=True)
+    assert not stream.wait_for_change(0.3, since=version)
+    assert sizes(stream) == {"BTC": "1"}
+
+    hl.fills(fill("BTC", "A", "1", "1", tid=4, t=4000), fill("ETH", "A", "3", "0", tid=5, t=4000),
+             fill("@107", "B", "10", "0", tid=6, t=4000))
+    assert stream.wait_for_change(5, since=version)
+    assert hl.server.wait_for(lambda: sizes(stream) == {"ETH": "-3"})
+
+
+def test_disconnect_resyncs_from_rest(hl, stream):
+    hl.positions = [position("BTC", "2"), position("ETH", "1")]
+    version, _ = stream.versioned_snapshot()
+    hl.server.drop()
+    assert hl.server.wait_for(lambda: hl.server.connections == 2)
+    assert stream.wait_for_change(5, since=version)
+    assert hl.server.wait_for(stream.is_live)
+    assert sizes(stream) == {"BTC": "2", "ETH": "1"}
+
+
+def test_not_live_while_disconnected(hl, fake_server):
+    hl.server.close()
+    stream = PositionStream(ADDRESS, base_url=hl.server.url, reconnect_delay=0.05, max_reconnect_delay=0.05)
+    stream.start()
+    try:
+        assert not hl.server.wait_for(stream.is_live, timeout=0.3)
+    finally:
+        stream.stop()
+
+
+def test_wait_for_change_since(hl, stream):
+    version, _ = stream.versioned_snapshot()
+    # 调用 wait_for_change 之前到达的推送也不会被错过
+    hl.fills(fill("BTC", "B", "1", "1.5", tid=7, t=5000))
+    assert hl.server.wait_for(lambda: stream.versioned_snapshot()[0] != version)
+    assert stream.wait_for_change(0, since=version)
+    assert not stream.wait_for_change(0.1)
+
+
+def test_seen_fills_evicts_oldest_only(hl, stream, monkeypatch):
+    monkeypatch.setattr(monitor, "SEEN_FILLS_LIMIT", 2)
+    version, _ = stream.versioned_snapshot()
+    hl.fills(fill("ETH", "B", "1", "0", tid=11, t=6000), fill("SOL", "B", "2", "0", tid=12, t=6000),
+             fill("DOGE", "B", "3", "0", tid=13, t=6000))
+    assert stream.wait_for_change(5, since=version)
+    assert hl.server.wait_for(lambda: sizes(stream) == {"BTC": "1.5", "ETH": "1", "SOL": "2", "DOGE": "3"})
+    assert list(stream._seen_fills) == [("0x12", 12), ("0x13", 13)]
+
+    # 最近处理过的成交在超出上限后仍然去重，不会被重复计入
+    version, _ = stream.versioned_snapshot()
+    hl.fills(fill("DOGE", "B", "3", "0", tid=13, t=6000))
+    assert not stream.wait_for_change(0.3, since=version)
@@ -0,0 +1,41 @@
+# test_pnl_log.py
+# PnlLogger 的二进制记录：上次写入中途崩溃留下的半条记录在追加之前被截掉，之后的记录不错位。
+
+import numpy as np
+import pytest
+
+from pnl_log import PNL_DTYPE, PnlLogger, read_pnl_binary
+
+
+class FakeAccountAPI:
+    def __init__(self, equity):
+        self.equity = equity
+
+    def get_account_balance(self):
+        return {"code": "0", "data": [{"totalEq": self.equity}]}
+
+    def get_positions(self):
+        return {"code": "0", "data": [{"instId": "BTC-USDT-SWAP", "pos": "1", "upl": "5"}]}
+
+
+def test_partial_record_truncated_before_append(tmp_path):
+    csv_path = tmp_path / "pnl_log.csv"
+    bin_path = tmp_path / "pnl_log.bin"
+    first = PnlLogger(FakeAccountAPI("1000"), csv_path=str(csv_path))
+    first.log("启动")
+    first.close()
+    assert bin_path.stat().st_size == PNL_DTYPE.itemsize
+
+    # 模拟写入中途崩溃：末尾只写了下一条记录的前几个字节
+    with open(bin_path, "ab") as f:
+        f.write(np.array([(1, 2.0, 3.0, 4)], dtype=PNL_DTYPE).tobytes()[:11])
+    df = read_pnl_binary(str(bin_path))
+    assert len(df) == 1
+
+    second = PnlLogger(FakeAccountAPI("1100"), csv_path=str(csv_path))
+    second.log("重启")
+    second.close()
+    assert bin_path.stat().st_size == 2 * PNL_DTYPE.itemsize
+    df = read_pnl_binary(str(bin_path))
+    assert list(df["equity"]) == pytest.approx([1000, 1100])
+    assert list(df["upl"]) == pytest.approx([5, 5]) and list(df["positions"]) == [1, 1]
@@ -0,0 +1,132 @@
+# test_risk.py
+# 大额调仓同时经过风控与拆单：母单只受单币种 / 总敞口上限限制，单笔上限作用在每笔子订单上；拆单判断优先使用缓存价格。运行: python -m pytest -q
+# 限额按 trade.py 的默认配置（跟单预算 10000 USD）换算。
+
+from decimal import Decimal
+
+import pytest
+
+from algos import ExecutionScheduler
+from execution import OrderIntent, OrderResult
+from instruments import InstrumentSpec
+from risk import RiskEngine, RiskLimits
+
+BUDGET = Decimal('10000')
+MAX_ORDER_USD = BUDGET * 2
+MAX_COIN_USD = BUDGET * Decimal('1.2')
+ALGO_MIN_NOTIONAL_USD = BUDGET * Decimal('0.3')
+INST = "ETH-USDT-SWAP"
+MID = Decimal('100')
+
+
+class FakeRegistry:
+    def __init__(self):
+        self.spec = InstrumentSpec(INST, Decimal('1'), Decimal('1'), Decimal('1'), Decimal('0.01'))
+
+    def get(self, inst_id):
+        return self.spec if inst_id == INST else None
+
+
+class FakeExecutor:
+    """子订单立即全部按中间价成交。"""
+
+    def __init__(self):
+        self.orders = {}
+
+    def execute(self, intents, tick_id=None):
+        results = []
+        for intent in intents:
+            ord_id = f"o{len(self.orders) + 1}"
+            self.orders[ord_id] = {"state": "filled", "accFillSz": intent.sz, "avgPx": str(MID), "sz": intent.sz}
+            results.append(OrderResult(intent, True, ord_id=ord_id))
+        return results
+
+
+class FakeMarket:
+    def get_orderbook(self, instId, sz):
+        return {"code": "0", "data": [{"bids": [[str(MID - 1), "1000"]], "asks": [[str(MID + 1), "1000"]]}]}
+
+
+@pytest.fixture
+def engine():
+    registry = FakeRegistry()
+    engine = RiskEngine(RiskLimits(max_order_usd=MAX_ORDER_USD, max_coin_usd=MAX_COIN_USD,
+                                   max_total_usd=BUDGET * Decimal('1.5')), registry)
+    # 多头 100 张 ≈ 10000 USD
+    engine.on_positions([{"instId": INST, "pos": "100", "lever": "3"}])
+    engine.observe_mids({INST: MID})
+    return engine
+
+
+def make_scheduler(executor, max_child_usd, slices=10):
+    return ExecutionScheduler(executor, None, FakeMarket(), FakeRegistry(), order_source=executor.orders.get,
+                              algo="twap", min_notional_usd=ALGO_MIN_NOTIONAL_USD,
+                              params={"twap": {"slices": slices, "duration": 0}}, log_path=None,
+                              max_child_usd=max_child_usd)
+
+
+def test_default_limits_leave_room_for_slicing():
+    assert ALGO_MIN_NOTIONAL_USD < MAX_COIN_USD
+
+
+def test_large_rebalance_passes_risk_and_children_respect_order_cap(engine):
+    # 多 10000 USD 反手到空 11000 USD：母单 21000 USD 超过单笔上限，但单币种敞口在上限以内
+    intent = OrderIntent(INST, "sell", "210", leverage="3")
+    executor = FakeExecutor()
+    scheduler = make_scheduler(executor, MAX_ORDER_USD)
+    assert scheduler.should_slice(intent, MID)
+
+    accepted, rejected = engine.check_intents([intent])
+    assert [i.sz for i in accepted] == ["100"] and rejected
+
+    accepted, rejected = engine.check_intents([intent], sliced={INST})
+    assert accepted == [intent] and rejected == []
+
+    parent = scheduler.submit(intent)
+    assert parent._done.wait(10)
+    assert parent.state == "done" and parent.filled == Decimal('210')
+    sizes = [Decimal(o["sz"]) for o in executor.orders.values()]
+    assert sum(sizes) == Decimal('210')
+    assert all(sz * MID <= MAX_ORDER_USD for sz in sizes)
+    scheduler.close()
+
+
+def test_market_child_split_by_order_cap():
+    # 分 2 片的 TWAP，每片 60 张（6000 USD），子订单上限 2500 USD：每片拆成 25 + 25 + 10
+    executor = FakeExecutor()
+    scheduler = make_scheduler(executor, Decimal('2500'), slices=2)
+    parent = scheduler.submit(OrderIntent(INST, "buy", "120"))
+    assert parent._done.wait(10)
+    sizes = [o["sz"] for o in executor.orders.values()]
+    assert sizes == ["25", "25", "10", "25", "25", "10"]
+    assert parent.filled == Decimal('120') and parent.state == "done"
+    scheduler.close()
+
+
+class FakePrices:
+    def __init__(self, prices):
+        self.prices = prices
+
+    def okx_price(self, inst_id, max_age=None):
+        return self.prices.get(inst_id)
+
+
+class CountingMarket(FakeMarket):
+    def __init__(self):
+        self.calls = 0
+
+    def get_orderbook(self, instId, sz):
+        self.calls += 1
+        return super().get_orderbook(instId, sz)
+
+
+def test_should_slice_prefers_cached_price():
+    # 纯平仓没有 mid_hint：缓存中有价格时不读取盘口，没有时才回退 REST 盘口
+    market, prices = CountingMarket(), FakePrices({INST: MID})
+    scheduler = ExecutionScheduler(FakeExecutor(), None, market, FakeRegistry(), algo="twap",
+                                   min_notional_usd=ALGO_MIN_NOTIONAL_USD, log_path=None, prices=prices)
+    assert scheduler.should_slice(OrderIntent(INST, "sell", "30")) and market.calls == 0
+    assert not scheduler.should_slice(OrderIntent(INST, "sell", "29")) and market.calls == 0
+    prices.prices.clear()
+    assert scheduler.should_slice(OrderIntent(INST, "sell", "30")) and market.calls == 1
+    scheduler.close()
@@ -0,0 +1,132 @@
+# test_scanner.py
+# WalletScanner 对本地假 /info 接口（conftest.FakeServer）的测试：限流（令牌桶与 429 退避）、增量拉取与分页、排名输出。
+
+import time
+
+import pytest
+
+import scanner
+from scanner import DAY_MS, WalletScanner
+
+NOW_MS = int(time.time() * 1000)
+
+
+def fill(t, tid, closed_pnl, coin="BTC", side="A", start="1", sz="1", px="100"):
+    return {"time": t, "tid": tid, "coin": coin, "side": side, "startPosition": start, "sz": sz, "px": px,
+            "closedPnl": str(closed_pnl), "fee": "0"}
+
+
+class FakeInfo:
+    """每个地址的成交与账户净值由测试直接修改；rate_limit 为接下来要返回 429 的请求数。"""
+
+    def __init__(self, fake_server):
+        self.fills = {}
+        self.account_value = {}
+        self.rate_limit = 0
+        self.server = fake_server(on_post=self.on_post)
+
+    def on_post(self, path, payload):
+        assert path == "/info"
+        if self.rate_limit:
+            self.rate_limit -= 1
+            return 429, None
+        user = payload["user"]
+        if payload["type"] == "clearinghouseState":
+            return 200, {"marginSummary": {"accountValue": str(self.account_value.get(user, 1000))},
+                         "assetPositions": [{"position": {"coin": "BTC", "szi": "0.5", "unrealizedPnl": "3"}}]}
+        if payload["type"] == "userFillsByTime":
+            page = sorted((f for f in self.fills.get(user, []) if f["time"] >= payload["startTime"]),
+                          key=lambda f: f["time"])
+            return 200, page[:scanner.FILLS_PAGE_LIMIT]
+        return 400, None
+
+    def requests(self, kind):
+        return [p for _, p in self.server.posts if p["type"] == kind]
+
+
+@pytest.fixture
+def info(fake_server):
+    return FakeInfo(fake_server)
+
+
+def make_scanner(info, cache_dir, **kwargs):
+    kwargs.setdefault("weight_per_minute", None)
+    return WalletScanner(base_url=info.server.url, cache_dir=str(cache_dir), lookback_days=10, max_workers=4,
+                         **kwargs)
+
+
+def daily_fills(pnls, tid0=0):
+    """每天一笔平仓成交，pnls 为每天的已实现盈亏（第一笔在回看窗口起点之后一小时）。"""
+    start = NOW_MS - len(pnls) * DAY_MS + 3_600_000
+    return [fill(start + k * DAY_MS, tid0 + k, pnl) for k, pnl in enumerate(pnls)]
+
+
+def test_ranking(info, tmp_path):
+    steady, noisy, loser, sparse = ("0x" + c * 40 for c in "abcd")
+    info.fills = {steady: daily_fills([10, 12, 9, 11, 10, 12, 9, 11, 10, 12]),
+                  noisy: daily_fills([60, -40, 50, -30, 40, -20, 30, -10, 20, 0]),
+                  loser: daily_fills([-5, -8, 1, -6, -7, 2, -9, -4, -3, -5]),
+                  sparse: daily_fills([100, 100, 100])}
+    ranking = make_scanner(info, tmp_path).scan([sparse.upper(), loser, noisy, steady, steady])
+    # 成交不足 min_trades 的钱包排在最后，其余按 Sharpe 降序
+    assert list(ranking["address"]) == [steady, noisy, loser, sparse]
+    assert list(ranking.index) == [1, 2, 3, 4]
+    top = ranking.loc[1]
+    assert top["realized_pnl"] == pytest.approx(106) and top["roi"] == pytest.approx(0.106)
+    assert top["max_drawdown"] == 0 and top["win_rate"] == 1 and top["open_positions"] == 1
+    assert ranking.loc[2]["max_drawdown"] == pytest.approx(40)
+
+
+def test_incremental_fetch_and_pagination(info, tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, "FILLS_PAGE_LIMIT", 5)
+    address = "0x" + "e" * 40
+    info.fills[address] = daily_fills([1] * 9)
+    first = make_scanner(info, tmp_path, state_ttl=3600)
+    first.scan([address])
+    # 每页 5 条：下一页从上一页最后一笔的毫秒开始（含），9 条成交分 3 页拉取；状态只请求一次
+    times = [f["time"] for f in info.fills[address]]
+    assert [p["startTime"] for p in info.requests("userFillsByTime")][1:] == [times[4], times[8]]
+    assert len(info.requests("clearinghouseState")) == 1
+    assert first.stats["new_fills"] == 9
+    cursor = first.load_cache(address)["cursor"]
+    assert cursor == max(f["time"] for f in info.fills[address])
+
+    # 游标所在毫秒新增一笔成交，之后再新增两笔：只拉取游标之后的一页，重复返回的成交按 tid 去重
+    info.fills[address] += [fill(cursor, 100, 5), fill(cursor + 1, 101, 5), fill(cursor + 2, 102, 5)]
+    info.server.posts.clear()
+    second = make_scanner(info, tmp_path, state_ttl=3600)
+    ranking = second.scan([address])
+    fetches = info.requests("userFillsByTime")
+    assert [p["startTime"] for p in fetches] == [cursor]
+    assert info.requests("clearinghouseState") == []
+    assert second.stats["new_fills"] == 3
+    entry = second.load_cache(address)
+    assert sorted(entry["fills"]["tid"]) == list(range(9)) + [100, 101, 102]
+    assert ranking.loc[1]["trades"] == 12 and ranking.loc[1]["realized_pnl"] == pytest.approx(24)
+
+
+def scan_three(info, tmp_path, weight_per_minute):
+    addresses = [f"0x{i:040x}" for i in range(1, 4)]
+    for k, address in enumerate(addresses):
+        info.fills[address] = daily_fills([1, 2], tid0=10 * k)
+    s = make_scanner(info, tmp_path, weight_per_minute=weight_per_minute)
+    t0 = time.monotonic()
+    ranking = s.scan(addresses)
+    assert len(ranking) == 3 and s.stats["errors"] == 0
+    return s, time.monotonic() - t0
+
+
+def test_token_bucket_throttles(info, tmp_path):
+    # 每分钟 600 权重：桶容量 60、每秒补充 10，3 个地址共 66 权重，超出的 6 个约需等待 0.6 秒
+    s, elapsed = scan_three(info, tmp_path, 600)
+    assert s.stats["weight"] == 3 * (scanner.STATE_WEIGHT + scanner.FILLS_WEIGHT)
+    assert s.bucket.waited_seconds == pytest.approx(0.6, abs=0.2) and elapsed >= 0.4
+
+
+def test_rate_limited_response_backs_off_all_threads(info, tmp_path):
+    # 桶容量足够，只有 429 会触发等待：重试一次并按实际请求计费，清空令牌让其余线程一起退避
+    info.rate_limit = 1
+    s, elapsed = scan_three(info, tmp_path, 6000)
+    assert s.stats["rate_limited"] == 1
+    assert s.stats["requests"] == 7 and s.stats["weight"] == 3 * (scanner.STATE_WEIGHT + scanner.FILLS_WEIGHT) + 2
+    assert s.bucket.waited_seconds > 0 and elapsed >= 1
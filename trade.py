@@ -1,80 +1,201 @@
 import json
 import os
 import time
-from decimal import Decimal, ROUND_DOWN
-import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 import traceback
 
-# 引入OKX SDK和我们最终确认可用的 monitor.py
-import okx.Account as Account
-import okx.Trade as Trade
-from monitor import fetch_user_positions # 直接使用，无需再传入info客户端
+# 启动计时起点（启动用时报告中的"导入与模块初始化"从这里开始计算）
+startup_started = time.perf_counter()
+
+# OKX SDK 不在这里导入：clients.lazy_okx_api 在第一次调用时才导入，启动时与其他初始化步骤并行完成
+import monitor
+from monitor import fetch_user_positions, PositionStream # 直接使用，无需再传入info客户端
+from instruments import InstrumentRegistry
+from execution import BatchExecutor, OrderIntent, OrderResult
+from algos import ExecutionScheduler
+from journal import OrderJournal
+from paper import PaperExchange, SyntheticBook, DEFAULT_MIDS, load_instruments
+from reconcile import Reconciler
+from risk import RiskEngine, RiskLimits
+from symbols import SymbolIndex
+from account_state import AccountStateCache
+from latency import TimedProxy, recorder as latency_recorder
+from recorder import SnapshotRecorder
+from pnl_log import PnlLogger
+from prices import PriceCache
+from fastcore import InstrumentTable, plan_orders, NO_SPEC, NOT_LIVE, SYNCED, BELOW_MIN
+from clients import lazy_okx_api, warm_up, start_keepalive
+from scheduler import AdaptivePoller, BudgetedProxy, RateBudget
+
+# 目标持仓拉取计入延迟统计
+fetch_user_positions = latency_recorder.timed("fetch_user_positions")(fetch_user_positions)
 
 # =======================【1. 核心配置】=======================
 MY_TOTAL_COPY_USD = Decimal('10000.0')
 TARGET_USER_ADDRESS = "0xc20ac4dc4188660cbf555448af52694ca62b0734"
 CONFIG_FILE = 'config.json'
 FLAG = "1"
-
-# 目标地址币种数量的精度，保持不变。
-CONTRACT_PRECISION = {
-    "BTC-USDT-SWAP": Decimal('0.0001'),
-    "ETH-USDT-SWAP": Decimal('0.001'),
-    "SOL-USDT-SWAP": Decimal('0.01'),
-    "BNB-USDT-SWAP": Decimal('0.01'),
-    "DOGE-USDT-SWAP": Decimal('10'),
-    "XRP-USDT-SWAP": Decimal('1'),
-}
-
-# 🚀 【已存在配置】OKX 合约面值 (1张合约 = 多少币)
-CONTRACT_FACE_VALUE = {
-    "BTC-USDT-SWAP": Decimal('0.01'), 
-    "ETH-USDT-SWAP": Decimal('0.1'),
-    "SOL-USDT-SWAP": Decimal('1'), 
-    "BNB-USDT-SWAP": Decimal('0.01'),
-    "DOGE-USDT-SWAP": Decimal('1000'),
-    "XRP-USDT-SWAP": Decimal('100'),
-    # 🚨 重要：请务必根据 OKX 合约信息核实
-}
-
-# 🚀 【新增配置】OKX 合约的最小下单张数单位 (szInc)
-# 这是下单时 sz 参数的最小变动增量（Lot Size）。
-# 经查，BTC/ETH等主流币最小为0.01张，DOGE/XRP等小币种常为1张。
-CONTRACT_LOT_PRECISION = {
-    "BTC-USDT-SWAP": Decimal('0.01'),  
-    "ETH-USDT-SWAP": Decimal('0.01'),  
-    "SOL-USDT-SWAP": Decimal('0.01'),     
-    "BNB-USDT-SWAP": Decimal('1'),  
-    "DOGE-USDT-SWAP": Decimal('0.01'),    
-    "XRP-USDT-SWAP": Decimal('0.01'),     
-}
+# 交易后端: "okx" 真实下单；"paper" 使用 paper.py 的本地模拟盘（影子模式：目标持仓仍实时跟随 Hyperliquid，
+# 订单只在本地按盘口撮合，不需要 config.json）。可用环境变量 COPYTRADE_BACKEND 覆盖
+BACKEND = os.environ.get("COPYTRADE_BACKEND", "okx")
+PAPER_LATENCY_SECONDS = 0.02
+PAPER_EQUITY_USD = 100000
+PAPER_JOURNAL_FILE = "journal_paper.db"
+# 使用 WebSocket 推送获取目标持仓；推送断开时自动回退到 REST 轮询
+USE_WS_STREAM = True
+# 轮询间隔随目标的交易活跃程度自适应：目标刚有变化时缩短到最小值，之后逐渐放宽，
+# 最近 POLL_ACTIVE_WINDOW_SECONDS 秒内有过变化时不超过 POLL_INTERVAL_SECONDS，长时间无变化时放宽到最大值
+POLL_INTERVAL_SECONDS = 10
+POLL_ACTIVE_WINDOW_SECONDS = 600
+POLL_MIN_INTERVAL_SECONDS = 1
+POLL_MAX_INTERVAL_SECONDS = 60
+# 每次 REST 轮询目标消耗的 Hyperliquid 权重（allMids 2 + clearinghouseState 2）
+HL_POLL_WEIGHT = 4
+# 延迟统计：定期打印汇总，并在本地端口提供 Prometheus 文本格式的 /metrics
+LATENCY_REPORT_SECONDS = 300
+METRICS_PORT = 9108
+# 每个 tick 的目标持仓写入 snapshots/ 目录（后台线程写盘，供回测与分析使用）；设为 None 关闭
+SNAPSHOT_DIR = "snapshots"
+# 大额调仓拆单执行：名义价值不低于 ALGO_MIN_NOTIONAL_USD 的订单交给 algos.py 在后台拆成子订单执行，
+# 可选 "twap" / "pov" / "chase"（参数见 algos.DEFAULT_PARAMS）；设为 None 时全部使用单笔市价单。
+# 门槛按跟单预算换算，须低于下面的单币种上限 RISK_MAX_COIN_USD，否则没有订单能进入拆单
+EXECUTION_ALGO = "twap"
+ALGO_MIN_NOTIONAL_USD = MY_TOTAL_COPY_USD * Decimal('0.3')
+# 实时风控（risk.py）：加仓订单在提交前按以下名义价值上限检查，减仓订单总是放行；
+# RISK_MAX_ORDER_USD 限制单笔市价单与拆单的每笔子订单，拆单的母单只检查单币种、总敞口与保证金。
+# 杠杆、保证金占用、回撤熔断与缩放比例保护的阈值见 risk.py 顶部
+RISK_MAX_ORDER_USD = MY_TOTAL_COPY_USD * 2
+RISK_MAX_COIN_USD = MY_TOTAL_COPY_USD * Decimal('1.2')
+RISK_MAX_TOTAL_USD = MY_TOTAL_COPY_USD * Decimal('1.5')
+# 本地价格缓存（prices.py）：WebSocket 推送维护 Hyperliquid 与 OKX 的价格，目标持仓按名义价值换算成OKX张数；
+# 任一价格超过 MAX_PRICE_AGE_SECONDS 秒未更新时，该合约本轮不调整仓位（平仓不受影响）
+USE_PRICE_CACHE = True
+MAX_PRICE_AGE_SECONDS = 5
+# 订单预写日志（SQLite）：发送前记录每笔订单，重启时按 clOrdId 核对未确认的订单；
+# FAST_RESTART 为 True 时，重启不等待获取目标持仓与首次同步：用日志中上一次的目标快照作为比较基准直接进入主循环，
+# 首轮循环再拉取最新目标并做全量同步
+JOURNAL_FILE = "journal.db"
+FAST_RESTART = True
+# 调试用：在目标持仓记录中保留 Hyperliquid 返回的原始 position 字典（会增加内存占用）
+DEBUG_KEEP_RAW_POSITION = False
+# 增量同步模式下，每隔多久重新拉取OKX持仓做一次全量校正
+FULL_RESYNC_INTERVAL_SECONDS = 300
+
+# 合约面值 / 下单步进 / 最小张数不再手工维护，统一由 instruments.py 从 OKX 拉取并缓存
+INSTRUMENT_CACHE_TTL_SECONDS = 6 * 3600
+INSTRUMENT_REFRESH_SECONDS = 1800
+
+# HTTP 连接池：Hyperliquid 与 OKX 客户端全局共享、长连接复用，后台定期发送轻量请求保持连接常热
+HTTP_POOL_SIZE = 16
+HTTP_KEEPALIVE_SECONDS = 25
 # ==========================================================
 
 # =======================【2. 初始化与设置】=======================
+monitor.KEEP_RAW_POSITION = DEBUG_KEEP_RAW_POSITION
+
 # --- 读取OKX API配置 ---
 api_key, secret_key, passphrase = "", "", ""
-if not os.path.exists(CONFIG_FILE):
-    print(f"❌ 错误：找不到配置文件 {CONFIG_FILE}。")
-    exit()
-try:
-    with open(CONFIG_FILE, 'r') as f:
-        config_data = json.load(f)
-    api_key = config_data.get("api_key")
-    secret_key = config_data.get("secret_key")
-    passphrase = config_data.get("passphrase")
-    print("✅ 成功读取OKX配置信息。")
-except Exception as e:
-    print(f"❌ 读取配置文件时发生错误: {e}")
-    exit()
+paper_exchange = None
+if BACKEND == "paper":
+    paper_exchange = PaperExchange(SyntheticBook(DEFAULT_MIDS), load_instruments(FLAG),
+                                   latency=PAPER_LATENCY_SECONDS, equity=PAPER_EQUITY_USD)
+    print("✅ 使用本地模拟盘 (paper)，订单只在本地撮合，不会发送到OKX。")
+else:
+    if not os.path.exists(CONFIG_FILE):
+        print(f"❌ 错误：找不到配置文件 {CONFIG_FILE}。")
+        exit()
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            config_data = json.load(f)
+        api_key = config_data.get("api_key")
+        secret_key = config_data.get("secret_key")
+        passphrase = config_data.get("passphrase")
+        print("✅ 成功读取OKX配置信息。")
+    except Exception as e:
+        print(f"❌ 读取配置文件时发生错误: {e}")
+        exit()
 
 # --- 初始化OKX API客户端 ---
-try:
-    accountAPI = Account.AccountAPI(api_key, secret_key, passphrase, False, FLAG)
-    tradeAPI = Trade.TradeAPI(api_key, secret_key, passphrase, False, FLAG)
-    print("✅ OKX API 客户端初始化成功。")
-except Exception as e:
-    print(f"❌ 初始化OKX API客户端失败: {e}")
-    exit()
+rate_budget = RateBudget()
+# 尚未创建的 SDK 客户端（启动时由 prepare_okx_clients 在后台导入 SDK 并创建）
+okx_clients = []
+if paper_exchange is not None:
+    # 模拟盘同时充当账户 / 交易 / 行情接口，不受交易所限频约束
+    accountAPI = tradeAPI = marketAPI = paper_exchange
+else:
+    try:
+        # 按接口限频预算包装：预算不足时等待，而不是等交易所返回限频错误
+        okx_clients = [
+            lazy_okx_api("okx.Account", "AccountAPI", api_key, secret_key, passphrase, FLAG, pool_size=HTTP_POOL_SIZE),
+            lazy_okx_api("okx.Trade", "TradeAPI", api_key, secret_key, passphrase, FLAG, pool_size=HTTP_POOL_SIZE),
+            lazy_okx_api("okx.MarketData", "MarketAPI", flag=FLAG, pool_size=HTTP_POOL_SIZE),
+        ]
+        accountAPI = BudgetedProxy(
+            okx_clients[0], rate_budget,
+            {"get_positions": "okx_positions", "get_account_balance": "okx_balance", "set_leverage": "okx_set_leverage"})
+        tradeAPI = BudgetedProxy(
+            okx_clients[1], rate_budget,
+            {"place_order": "okx_order", "place_multiple_orders": ("okx_batch_orders", lambda orders: len(orders)),
+             "cancel_order": "okx_cancel_order", "amend_order": "okx_amend_order", "get_order": "okx_get_order"})
+        marketAPI = BudgetedProxy(okx_clients[2], rate_budget, {"get_orderbook": "okx_orderbook"})
+    except Exception as e:
+        print(f"❌ 初始化OKX API客户端失败: {e}")
+        exit()
+
+# 账户状态缓存：私有 WebSocket 推送持仓/余额/订单，过期时回退 REST；其余接口透传给 accountAPI
+account_state = AccountStateCache(accountAPI, api_key, secret_key, passphrase, flag=FLAG)
+
+# 订单日志：所有经过批量执行器的订单（包括拆单的子订单）在发送前写入
+journal = OrderJournal(JOURNAL_FILE if paper_exchange is None else PAPER_JOURNAL_FILE)
+
+# 批量执行器：并发设置杠杆 + batch-orders 下单，共用上面的客户端
+executor = BatchExecutor(TimedProxy(accountAPI, latency_recorder, ["set_leverage"]),
+                         TimedProxy(tradeAPI, latency_recorder, ["place_order", "place_multiple_orders"]),
+                         journal=journal)
+
+# --- OKX合约参数（缓存未过期时不访问API）与币种索引 ---
+# 模拟盘的合约列表由 PaperExchange 提供，单独缓存
+instrument_registry = InstrumentRegistry(
+    flag=FLAG if paper_exchange is None else "paper", ttl_seconds=INSTRUMENT_CACHE_TTL_SECONDS,
+    refresh_interval=INSTRUMENT_REFRESH_SECONDS, public_api=paper_exchange
+)
+# Hyperliquid 币种 → OKX 合约索引（含 k 前缀币种的 1000 倍换算）；模拟盘不访问网络，币种在第一次出现时匹配
+symbol_index = SymbolIndex(instrument_registry)
+
+
+def load_instrument_metadata():
+    """加载合约参数并建立币种索引。实盘在启动时与其他初始化步骤并行执行，模拟盘在导入时执行。"""
+    instrument_registry.load()
+    try:
+        symbol_index.build(None if paper_exchange is None else ())
+    except Exception as e:
+        print(f"  - ⚠️ 获取 Hyperliquid 币种列表失败，币种将在第一次出现时匹配: {e}")
+
+
+if paper_exchange is not None:
+    try:
+        load_instrument_metadata()
+    except Exception as e:
+        print(f"❌ 加载OKX合约参数失败: {e}")
+        exit()
+
+# 价格缓存：模拟盘的成交价就是目标的 Hyperliquid 中间价，不需要；推送模式下 Hyperliquid 价格由 PositionStream 写入
+price_cache = None
+if USE_PRICE_CACHE and paper_exchange is None:
+    price_cache = PriceCache(FLAG, hl_ws=not USE_WS_STREAM, max_age=MAX_PRICE_AGE_SECONDS, market_api=marketAPI)
+    monitor.PRICE_CACHE = price_cache
+
+# 实时风控：持仓 / 余额随账户推送（以及 REST 回退的结果）增量更新，检查订单时不访问接口
+risk_engine = RiskEngine(RiskLimits(max_order_usd=RISK_MAX_ORDER_USD, max_coin_usd=RISK_MAX_COIN_USD,
+                                    max_total_usd=RISK_MAX_TOTAL_USD), instrument_registry)
+account_state.add_state_listener(risk_engine.on_account_update)
+
+# 拆单执行器：母单在后台线程中执行，子订单复用上面的批量执行器（杠杆缓存）与账户推送的订单状态
+scheduler = ExecutionScheduler(executor, tradeAPI, marketAPI, instrument_registry,
+                               order_source=paper_exchange.order_state if paper_exchange else account_state.get_order,
+                               algo=EXECUTION_ALGO, min_notional_usd=ALGO_MIN_NOTIONAL_USD,
+                               max_child_usd=RISK_MAX_ORDER_USD, prices=price_cache)
 
 # 【重要改动】我们不再在这里初始化 Hyperliquid 的 Info 客户端
 # 因为新版的 monitor.py 会在内部自行处理
@@ -95,143 +216,232 @@ def prepare_my_positions(okx_positions_data):
     return my_positions
 
 
-def sync_positions(target_positions_raw):
-    print("\n🚀 开始执行持仓同步...")
-    try:
-        # 获取我的OKX持仓，注意：OKX返回的持仓 pos 是【张数】
-        my_positions_raw = accountAPI.get_positions()
-        my_positions = prepare_my_positions(my_positions_raw)
-        print(f"  - 成功获取我的OKX持仓，共 {len(my_positions)} 个。")
-    except Exception as e:
-        print(f"  - ❌ 获取我的OKX持仓失败: {e}")
-        return
+@latency_recorder.timed("sync_positions")
+def sync_positions(target_positions_raw, scaling_factor=None, reconciler=None, trace_id=None):
+    """
+    将我的OKX持仓同步到目标持仓。
+    scaling_factor 为空时按 MY_TOTAL_COPY_USD / 目标总名义价值 计算；
+    多钱包引擎传入的是已按各自预算缩放好的净持仓簿，此时传 Decimal('1')。
+    传入 reconciler 时走增量模式：使用本地持仓视图，只处理目标有变化的合约，
+    到期或发现偏差时才重新拉取OKX持仓做全量同步。
+    trace_id 由 latency_recorder.begin_trace() 生成，用于记录 提交 → 确认 → 成交 的时间线。
+    返回本轮每笔订单的 OrderResult 列表。
+    """
+    full_sync = reconciler is None or reconciler.needs_full_resync()
+    print("\n🚀 开始执行持仓同步..." if full_sync else "\n🚀 开始执行增量同步...")
+    wait_startup_prerequisites()
+    # 本轮的目标快照写入订单日志，订单的 clOrdId 由 tick 编号与 instId 确定
+    tick_id = journal.begin_tick(target_positions_raw)
+    # 由成交推送新建的仓位可能没有中间价，用名义价值 / 数量代替
+    target_mids = {p['coin']: p.get('mid') or (p['value_usd'] / p['size'] if p['size'] else None)
+                   for p in target_positions_raw}
+    # 每个币种一次字典查找得到OKX合约与数量倍数；OKX上不可交易的币种直接跳过
+    mappings = {}
+    for p in target_positions_raw:
+        mapping = symbol_index.resolve(p['coin'])
+        if mapping is not None:
+            mappings[p['coin']] = mapping
+    untradable = [p['coin'] for p in target_positions_raw if p['coin'] not in mappings]
+    if untradable:
+        print(f"  - ⚠️ OKX 上没有对应合约，跳过: {', '.join(untradable)}")
+    # 合约 ID → 按OKX币数计的价格（kPEPE 这类币种的 Hyperliquid 价格是 1000 个币的价格）
+    inst_mids = {m.inst_id: target_mids[c] / m.multiplier for c, m in mappings.items() if target_mids[c]}
+    risk_engine.observe_mids(inst_mids)
+    if paper_exchange is not None:
+        # 影子模式：模拟盘按目标持仓中的 Hyperliquid 中间价撮合
+        paper_exchange.observe_mids(inst_mids)
+    if full_sync:
+        # 全量同步按OKX的真实持仓重新计算所有张数差，先停掉仍在执行的母单（已成交部分会反映在持仓中）
+        for parent in scheduler.cancel():
+            print(f"  - ⏹️ 已撤销执行中的母单 {parent.parent_id} ({parent.inst_id})，将按最新持仓重新规划。")
+        try:
+            # 获取我的OKX持仓，注意：OKX返回的持仓 pos 是【张数】
+            my_positions_raw = account_state.get_positions()
+            my_positions = prepare_my_positions(my_positions_raw)
+            print(f"  - 成功获取我的OKX持仓，共 {len(my_positions)} 个。")
+        except Exception as e:
+            print(f"  - ❌ 获取我的OKX持仓失败: {e}")
+            return []
+        executor.seed_leverage(my_positions_raw)
+        if reconciler is not None:
+            reconciler.reset(my_positions)
+    else:
+        my_positions = reconciler.positions
+
+    if price_cache is not None:
+        price_cache.track(m.inst_id for m in mappings.values())
 
     target_total_value_usd = sum(p['value_usd'] for p in target_positions_raw) # 返回值已经是Decimal
-    scaling_factor = (MY_TOTAL_COPY_USD / target_total_value_usd) if target_total_value_usd > 0 else Decimal('0')
+    if scaling_factor is None:
+        scaling_factor = (MY_TOTAL_COPY_USD / target_total_value_usd) if target_total_value_usd > 0 else Decimal('0')
+        if reconciler is not None:
+            # 比例变化很小时沿用旧值，避免整个持仓簿的噪声订单；全量同步时直接采用新比例
+            scaling_factor = reconciler.stable_scaling_factor(scaling_factor, force=full_sync)
     
+    risk_reason = risk_engine.check_scaling(scaling_factor, target_total_value_usd)
+    if risk_reason:
+        print(f"  - 🛡️ 缩放比例保护: {risk_reason}，本轮只执行减仓订单。")
+
     if target_total_value_usd > 0:
         print(f"  - 目标总名义价值: ${target_total_value_usd:,.2f}")
-        print(f"  - 我的跟单总名义价值: ${MY_TOTAL_COPY_USD:,.2f}")
+        print(f"  - 我的跟单总名义价值: ${target_total_value_usd * scaling_factor:,.2f}")
         print(f"  - 计算出的缩放比例: {scaling_factor:.6f}")
     else:
         print("  - 目标当前无持仓，将清空所有相关仓位。")
 
     scaled_target_positions = {}
+    stale_inst_ids = set()
     for p in target_positions_raw:
-        instId = f"{p['coin']}-USDT-SWAP"
-        scaled_size = p['size'] * scaling_factor # scaled_size 仍是币的数量（例如 BTC 数量）
+        mapping = mappings.get(p['coin'])
+        if mapping is None:
+            continue
+        instId, multiplier = mapping.inst_id, mapping.multiplier
+        # scaled_size 是OKX一侧币的数量（例如 BTC 数量；kPEPE 换算为 PEPE 数量）
+        scaled_size = p['size'] * multiplier * scaling_factor
+        if price_cache is not None and not scaled_size.is_zero():
+            hl_mid, okx_px = price_cache.hl_mid(p['coin']), price_cache.okx_price(instId)
+            if hl_mid is None or okx_px is None:
+                stale_inst_ids.add(instId)
+            else:
+                # 按名义价值换算：目标名义价值 × 缩放比例 ÷ OKX 价格，两边价格有价差时仍跟随相同的美元敞口
+                scaled_size = scaled_size * (hl_mid / multiplier) / okx_px
+        mid = p.get('mid')
         scaled_target_positions[instId] = {
             "size": scaled_size,
             "direction_is_buy": p['direction_is_buy'],
-            "leverage": str(p.get('leverage', '10'))
+            "leverage": str(p.get('leverage') or '10'), # 由成交推送新建的仓位暂时没有杠杆信息
+            "mid": mid / multiplier if mid else mid,
         }
 
-    all_instIds = set(scaled_target_positions.keys()) | set(my_positions.keys())
-    for instId in all_instIds:
-        print(f"\n  --- 正在处理: {instId} ---")
-        
+    if full_sync:
+        all_instIds = set(scaled_target_positions.keys()) | set(my_positions.keys())
+    else:
+        all_instIds = reconciler.changed_inst_ids(scaled_target_positions)
+        print(f"  - 本轮有变化的合约: {', '.join(sorted(all_instIds)) if all_instIds else '无'}")
+        # 目标再次变化：先撤销这些合约上仍在执行的母单，再按撤销后的持仓重新计算张数差
+        cancelled = scheduler.cancel(all_instIds)
+        for parent in cancelled:
+            print(f"  - ⏹️ 已撤销执行中的母单 {parent.parent_id} ({parent.inst_id})，已成交 {parent.filled} 张。")
+        if cancelled:
+            my_positions = reconciler.positions
+    if stale_inst_ids:
+        # 价格过期时不做仓位决策：这些合约本轮保持不动，不计入本轮已提交的目标，下一轮重新计算
+        print(f"  - ⚠️ 价格过期或缺失，本轮跳过: {', '.join(sorted(stale_inst_ids))}")
+        all_instIds = all_instIds - stale_inst_ids
+    # 一次批量算出所有合约的目标张数与取整后的下单张数（与逐个 Decimal 计算的结果完全一致）
+    inst_ids = list(all_instIds)
+    target_coins, my_lots = [], []
+    for instId in inst_ids:
         target = scaled_target_positions.get(instId)
         mine = my_positions.get(instId)
-        precision = CONTRACT_PRECISION.get(instId)
-        face_value = CONTRACT_FACE_VALUE.get(instId) # 🚨 获取合约面值
-        # 🚨 【修改点 1】获取最小张数精度
-        lot_precision = CONTRACT_LOT_PRECISION.get(instId) 
-
-        if not precision:
-            print(f"  - ⚠️ 警告: 未在 `CONTRACT_PRECISION` 中找到 {instId} 的下单精度，跳过此币种。")
+        target_coins.append((target['size'] if target['direction_is_buy'] else -target['size']) if target else Decimal('0'))
+        my_lots.append((mine['size'] if mine['direction_is_buy'] else -mine['size']) if mine else Decimal('0'))
+    plan = plan_orders(InstrumentTable.from_registry(instrument_registry), inst_ids, target_coins, my_lots)
+
+    intents = []
+    for k, instId in enumerate(inst_ids):
+        print(f"\n  --- 正在处理: {instId} ---")
+        status = plan.status[k]
+        spec = plan.spec(k)
+
+        if status == NO_SPEC:
+            print(f"  - ⚠️ 警告: OKX 上没有 {instId} 合约（或参数不完整），跳过此币种。")
+            continue
+        if status == NOT_LIVE:
+            print(f"  - ⚠️ 警告: {instId} 当前状态为 {spec.state}，暂不可交易，跳过此币种。")
             continue
-        if not face_value:
-             print(f"  - ⚠️ 警告: 未在 `CONTRACT_FACE_VALUE` 中找到 {instId} 的合约面值，跳过此币种。")
-             continue
-        if not lot_precision:
-             print(f"  - ⚠️ 警告: 未在 `CONTRACT_LOT_PRECISION` 中找到 {instId} 的最小张数精度，跳过此币种。")
-             continue
-
-
-        # 1. 将目标数量（币本位）转换为合约张数
-        target_face_value = target['size'] / face_value if target and face_value > 0 else Decimal('0')
-        
-        # 2. 获取我的当前张数
-        my_current_size = mine['size'] if mine else Decimal('0')
-
-        # 3. 计算目标张数和我的张数之间的差值（张数差）
-        target_signed_size = target_face_value if target and target['direction_is_buy'] else -target_face_value if target else Decimal('0')
-        my_signed_size = my_current_size if mine and mine['direction_is_buy'] else -my_current_size if mine else Decimal('0')
-        
-        trade_amount_lots = target_signed_size - my_signed_size 
-        
-        # 将 BTC 数量差值精度转换为张数差值精度进行比较，以保持原有逻辑
-        precision_lots = precision / face_value
 
+        target_signed_size = plan.target_lots[k]
+        my_signed_size = plan.my_lots[k]
         print(f"  - 缩放后目标: {'多' if target_signed_size > 0 else '空' if target_signed_size < 0 else '无'} {abs(target_signed_size):.8f} 张")
         print(f"  - 我的当前:   {'多' if my_signed_size > 0 else '空' if my_signed_size < 0 else '无'} {abs(my_signed_size):.8f} 张")
 
-        # 使用张数差值和张数精度进行比较
-        if abs(trade_amount_lots) < precision_lots:
-            print(f"  - ✅ 仓位已同步或差异过小（小于 {precision_lots:.8f} 张），无需操作。")
+        # 差异小于最小下单张数时视为已同步
+        if status == SYNCED:
+            print(f"  - ✅ 仓位已同步或差异过小（小于 {spec.min_sz:.8f} 张），无需操作。")
             continue
 
-        trade_side = "buy" if trade_amount_lots > 0 else "sell"
-        
-        # 4. 🚨 【修改点 2】对需要交易的张数向下取整到最近的 lot_precision 张
-        trade_size_decimal = abs(trade_amount_lots).quantize(lot_precision, rounding=ROUND_DOWN)
-        trade_size_str = str(trade_size_decimal)
+        trade_side = "buy" if plan.side[k] > 0 else "sell"
+        # 张数差按 lotSz 的整数倍向下取整（lotSz 不一定是 10 的幂，如 10、5）
+        trade_size_str = plan.size_str(k)
 
-        # 最小订单量检查 (最小订单量就是最小增量 lot_precision 张)
-        MIN_ORDER_SIZE_LOTS = lot_precision
-        if trade_size_decimal < MIN_ORDER_SIZE_LOTS:
-            print(f"  - ✅ 调整量 {trade_size_decimal} 张小于最小订单量 {MIN_ORDER_SIZE_LOTS} 张，忽略。")
+        # 最小订单量检查 (OKX 的 minSz 张)
+        if status == BELOW_MIN:
+            print(f"  - ✅ 调整量 {trade_size_str} 张小于最小订单量 {spec.min_sz} 张，忽略。")
             continue
-            
+
         print(f"  - ➡️ 准备执行操作: {trade_side.upper()} {trade_size_str} {instId} (张数)")
 
-        if target:
-            res_lev = accountAPI.set_leverage(instId=instId, lever=target['leverage'], mgnMode="cross")
-            if res_lev['code'] != '0':
-                print(f"  - ❌ 设置杠杆失败: {res_lev.get('data', [{}])[0].get('sMsg')}，跳过此订单。")
+        # 先收集订单意图，所有币种处理完后统一批量提交；平仓单不需要设置杠杆
+        target = scaled_target_positions.get(instId)
+        intents.append(OrderIntent(instId, trade_side, trade_size_str, leverage=target['leverage'] if target else None,
+                                   cl_ord_id=journal.cl_ord_id(tick_id, instId)))
+
+    # 名义价值较大的订单交给拆单执行器在后台执行，不阻塞主循环；其余仍通过 batch-orders 一次性提交。
+    # 先决定哪些订单拆单：母单的单笔上限由执行器按子订单检查，风控只对母单检查单币种、总敞口与保证金
+    sliced = set()
+    for intent in intents:
+        target = scaled_target_positions.get(intent.inst_id)
+        try:
+            if scheduler.should_slice(intent, target['mid'] if target else None):
+                sliced.add(intent.inst_id)
+        except Exception as e:
+            print(f"  - ⚠️ {intent.inst_id} 无法拆单执行（{e}），改用市价单。")
+
+    # 提交前的风控检查（只读内存状态，微秒级）；被拒绝的订单不计入本地持仓视图的失败，避免每轮触发全量同步
+    risk_started = time.perf_counter()
+    intents, risk_rejected = risk_engine.check_intents(intents, sliced=sliced)
+    latency_recorder.record("risk_check", time.perf_counter() - risk_started)
+    for intent, reason in risk_rejected:
+        print(f"  - 🛡️ 风控拒绝 {intent.side.upper()} {intent.sz} {intent.inst_id}: {reason}")
+
+    algo_results, market_intents = [], []
+    for intent in intents:
+        if intent.inst_id in sliced:
+            try:
+                parent = scheduler.submit(intent)
+                algo_results.append(OrderResult(intent, True, ord_id=parent.parent_id, code="algo", msg=parent.algo))
                 continue
-
-        # 5. 使用转换后的张数进行下单
-        result = tradeAPI.place_order(
-            instId=instId, tdMode="cross", side=trade_side,
-            posSide="net", ordType="market", sz=trade_size_str # 传入张数
-        )
-
-        if result.get("code") == "0":
-            print(f"  - ✅ 订单请求成功, 订单ID: {result.get('data', [{}])[0].get('ordId')}")
+            except Exception as e:
+                # 母单没有经过单笔上限检查，不能直接改用市价单；本轮跳过，下一轮重新计算
+                print(f"  - ⚠️ {intent.inst_id} 无法拆单执行（{e}），本轮跳过。")
+                risk_rejected.append((intent, f"拆单失败: {e}"))
+                continue
+        market_intents.append(intent)
+
+    # 并发设置杠杆（仅杠杆有变化的合约）并通过 batch-orders 批量下单
+    if market_intents:
+        print(f"\n  - 🚀 批量提交 {len(market_intents)} 笔订单...")
+        latency_recorder.mark(trace_id, "submitted")
+    results = executor.execute(market_intents, tick_id)
+    acked = [r.ord_id for r in results if r.ok]
+    if acked:
+        # 全部失败时不算"已确认"；成交推送可能早于这里到达，由 expect_fills 匹配
+        latency_recorder.mark(trace_id, "acked")
+        latency_recorder.expect_fills(trace_id, acked)
+    results = algo_results + results
+    for r in results:
+        if r.code == "algo":
+            print(f"  - 🧩 {r.intent.inst_id} 已交给 {r.msg} 拆单执行, 母单ID: {r.ord_id}")
+        elif r.ok:
+            print(f"  - ✅ {r.intent.inst_id} 订单请求成功, 订单ID: {r.ord_id}")
+        elif r.code == "lever":
+            print(f"  - ❌ {r.intent.inst_id} 设置杠杆失败: {r.msg}，跳过此订单。")
         else:
-            data = result.get('data', [{}])[0]
-            print(f"  - ❌ 订单请求失败, Code: {data.get('sCode')}, Msg: {data.get('sMsg')}")
-            
+            print(f"  - ❌ {r.intent.inst_id} 订单请求失败, Code: {r.code}, Msg: {r.msg}")
+
+    if reconciler is not None:
+        # 价格过期或被风控拒绝的合约不计入已提交的目标：下一轮增量同步仍视为有变化，重新计算
+        skipped = stale_inst_ids | {intent.inst_id for intent, _ in risk_rejected}
+        reconciler.commit({i: t for i, t in scaled_target_positions.items() if i not in skipped}, results)
+        # 价格过期的合约下一轮重试（只重新计算这几个合约，不触发全量同步）
+        reconciler.retry_next(stale_inst_ids)
+    # 账户推送会用真实持仓覆盖这里的估计
+    risk_engine.commit(results)
+
+    journal.end_tick(tick_id)
     print("\n✅ 本轮同步操作完成！")
-
-
-# (log_pnl_snapshot, simplify_positions_for_comparison, check_self_positions_for_stop 等函数保持不变)
-
-def log_pnl_snapshot(account_api, pnl_logger, note=""):
-    try:
-        res_balance = account_api.get_account_balance()
-        total_equity = "N/A"
-        if res_balance.get('code') == '0' and res_balance.get('data'):
-            total_equity = res_balance['data'][0].get('totalEq', 'N/A')
-
-        res_positions = account_api.get_positions()
-        total_unrealized_pnl = Decimal('0')
-        positions_count = 0
-        if res_positions.get('code') == '0' and res_positions.get('data'):
-            active_positions = [p for p in res_positions['data'] if p.get('pos') and float(p.get('pos')) != 0]
-            positions_count = len(active_positions)
-            for pos in active_positions:
-                total_unrealized_pnl += Decimal(pos.get('upl', '0'))
-        
-        total_unrealized_pnl = f"{total_unrealized_pnl:.2f}"
-        log_message = f"{total_equity},{total_unrealized_pnl},{positions_count},{note}"
-        pnl_logger.info(log_message)
-        print(f"💰 已记录盈亏快照: 总权益 ${total_equity}, 未实现盈亏 ${total_unrealized_pnl}, 持仓数 {positions_count}")
-
-    except Exception as e:
-        print(f"❌ 记录盈亏快照时发生错误: {e}")
-        pnl_logger.error(f"N/A,N/A,N/A,记录时发生错误: {e}")
+    return results + [OrderResult(intent, False, code="risk", msg=reason) for intent, reason in risk_rejected]
 
 
 def simplify_positions_for_comparison(positions_raw):
@@ -244,117 +454,308 @@ def simplify_positions_for_comparison(positions_raw):
     return simplified
 
 
-def check_self_positions_for_stop(account_api):
+# --- 启动步骤：互不依赖，由 run_startup_steps 并行执行 ---
+def prepare_okx_clients():
+    """导入 OKX SDK 并创建客户端，然后预先建立到 Hyperliquid / OKX 的连接。"""
+    for client in okx_clients:
+        client.prepare()
+    warm_up()
+
+
+def ensure_position_mode():
+    """
+    账户设置为净持仓模式。每次启动都用 get_account_config 核对，已是 net_mode 时不再设置
+    （网页端改过设置或更换了 API Key 后不会沿用旧的结论）。
+    """
     try:
-        my_positions_raw = account_api.get_positions()
-        if my_positions_raw.get('code') == '0':
-            for pos in my_positions_raw.get('data', []):
-                if pos.get('pos') and float(pos.get('pos')) != 0:
-                    return False
-            return True
-        else:
-            print(f"  - ⚠️ 警告: 检查自身仓位时API调用失败，无法判断是否停止。Code: {my_positions_raw.get('code')}")
-            return False
+        res_config = accountAPI.get_account_config()
+        pos_mode = res_config['data'][0].get('posMode') if res_config.get('code') == '0' and res_config.get('data') else None
     except Exception as e:
-        print(f"  - ❌ 检查自身仓位时发生异常: {e}")
-        return False
+        print(f"  - ⚠️ 查询账户配置失败，直接设置持仓模式: {e}")
+        pos_mode = None
+    if pos_mode == "net_mode":
+        print("✅ 账户持仓模式为 净持仓模式 (net_mode)。")
+        return
+    print(f"🚦 账户持仓模式为 {pos_mode or '未知'}，正在设置为净持仓模式 (net_mode)...")
+    res_mode = accountAPI.set_position_mode(posMode="net_mode")
+    if res_mode.get('code') != '0':
+        raise RuntimeError(f"设置净持仓模式失败: {res_mode.get('msg', '无详细错误信息')}")
+    print("✅ 账户持仓模式确认为 净持仓模式 (net_mode)。")
+
+
+def recover_orders():
+    """核对上次退出时订单日志中尚未确认的订单，并清理过期记录。"""
+    recovered = journal.recover(tradeAPI)
+    if recovered:
+        print(f"\n📒 订单日志中有 {len(recovered)} 笔上次未确认的订单，已按 clOrdId 向OKX核对:")
+        for row in recovered:
+            print(f"  - {row['cl_ord_id']} {row['side'].upper()} {row['sz']} {row['inst_id']}: {row['result']}")
+    journal.prune()
+
+
+def start_startup_steps(steps):
+    """在后台线程中并行执行 {名称: 函数}，不等待，返回 {名称: Future}（由 collect_startup_steps 取得结果）。"""
+    def timed(func):
+        started = time.perf_counter()
+        try:
+            return func(), None, (time.perf_counter() - started) * 1000
+        except Exception as e:
+            return None, e, (time.perf_counter() - started) * 1000
+
+    pool = ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="startup")
+    futures = {name: pool.submit(timed, func) for name, func in steps.items()}
+    pool.shutdown(wait=False)
+    return futures
+
+
+def collect_startup_steps(futures):
+    """等待步骤完成，返回 ({名称: 结果}, {名称: 异常}, {名称: 耗时ms})。"""
+    results, errors, timings = {}, {}, {}
+    for name, future in futures.items():
+        results[name], error, timings[name] = future.result()
+        if error is not None:
+            errors[name] = error
+    return results, errors, timings
+
+
+def run_startup_steps(steps):
+    """并行执行 {名称: 函数} 并等待全部完成，返回值同 collect_startup_steps。"""
+    return collect_startup_steps(start_startup_steps(steps))
+
+
+# 不在启动关键路径上、但同步之前必须完成的后台步骤 {名称: Future}（持仓模式、OKX行情），由主程序入口填入
+startup_prerequisites = {}
+
+
+def wait_startup_prerequisites():
+    """sync_positions 开始时调用：等待上述后台步骤完成；持仓模式未能确认时抛出异常，本轮不下单。"""
+    for name in list(startup_prerequisites):
+        _, error, _ = startup_prerequisites[name].result()
+        if error is not None and name == "持仓模式":
+            raise RuntimeError(f"持仓模式未确认，不能下单: {error}")
+        del startup_prerequisites[name]
 
 
 # =======================【4. 主程序入口】=======================
 if __name__ == "__main__":
     
-    # 日志和账户模式设置... (无变化)
-    log_file = 'pnl_log.csv'
-    write_header = not os.path.exists(log_file)
-    pnl_logger = logging.getLogger('pnl_logger')
-    pnl_logger.setLevel(logging.INFO)
-    handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
-    formatter = logging.Formatter('%(asctime)s,%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-    handler.setFormatter(formatter)
-    if not pnl_logger.handlers:
-        pnl_logger.addHandler(handler)
-    if write_header:
-        pnl_logger.info("Timestamp,TotalEquity_USD,UnrealizedPnL_USD,PositionsCount,Note")
-    print(f"✅ 盈亏日志将记录在: {log_file}")
-
-    print("\n🚦 正在设置账户为净持仓模式 (net_mode)...")
-    try:
-        res_mode = accountAPI.set_position_mode(posMode="net_mode")
-        if res_mode.get('code') == '0':
-            print("✅ 账户持仓模式确认为 净持仓模式 (net_mode)。")
-        else:
-            print(f"❌ 设置净持仓模式失败: {res_mode.get('msg', '无详细错误信息')}")
-            exit()
-    except Exception as e:
-        print(f"❌ 调用 set_position_mode 时发生异常: {e}，程序退出。")
-        exit()
+    log_file = 'pnl_log.csv' if paper_exchange is None else 'pnl_log_paper.csv'
+    # 盈亏快照在后台线程中读取账户状态并批量写盘，交易循环只负责投递事件
+    pnl_logger = PnlLogger(account_state, log_file, recorder=latency_recorder, prices=price_cache)
+    print(f"✅ 盈亏日志将记录在: {log_file}（二进制副本: {pnl_logger.bin_path}）")
+    # 推送连接（账户 / 价格 / 目标持仓）都在后台线程中建立，先启动，与下面的初始化步骤并行
+    if paper_exchange is None:
+        account_state.start()
+    if price_cache is not None:
+        price_cache.start()
+    stream = None
+    if USE_WS_STREAM:
+        stream = PositionStream(TARGET_USER_ADDRESS)
+        stream.start()
+        print("✅ 已启动 Hyperliquid WebSocket 推送流 (webData2 / userFills / allMids)。")
+    # orders 频道推送 filled 时，结束对应的全链路时间线；首次同步之前注册，首批订单的成交也能记录
+    # 模拟盘的订单状态由 PaperExchange 直接回调，不经过私有 WebSocket
+    order_feed = account_state if paper_exchange is None else paper_exchange
+    order_feed.add_order_listener(latency_recorder.on_order_update)
+    order_feed.add_order_listener(journal.on_order_update)
 
-    # --- 启动前：获取并记录初始状态 ---
-    print("\n🔍 正在获取目标初始仓位状态...")
     last_known_simplified_positions = {}
-    try:
-        # 【重要改动】直接调用，不再传入infoAPI
-        initial_target_positions = fetch_user_positions(TARGET_USER_ADDRESS) or []
-        
-        # 确认获取到的仓位数量
+    reconciler = Reconciler(full_resync_interval=FULL_RESYNC_INTERVAL_SECONDS)
+    # 拆单执行的子订单按实际成交张数更新本地持仓视图；母单未能完成时下一轮做全量同步
+    scheduler.add_fill_listener(reconciler.apply_fill)
+    scheduler.add_fill_listener(risk_engine.apply_fill)
+    scheduler.add_done_listener(
+        lambda p: reconciler.mark_dirty(f"母单 {p.parent_id} {p.state}") if p.state in ("incomplete", "failed") else None)
+
+    # 快速重启：订单日志中有上一次的目标快照时，启动阶段不拉取目标，也不做首次同步
+    # 模拟盘的持仓不会跨进程保留，每次都按最新目标重新建仓
+    last_tick = journal.last_targets() if FAST_RESTART and paper_exchange is None else None
+
+    # --- 并行初始化：互不依赖的步骤同时进行（OKX SDK 导入是 CPU 密集的，其余步骤主要在等网络）---
+    # 关键路径上只有首次同步之前必须就绪的步骤：目标持仓、合约参数，以及订单核对（上次未确认的订单先核对，避免重复下单）。
+    # 需要 OKX SDK 的步骤在后台继续执行，不阻塞进入首次同步（快速重启时不阻塞进入主循环）：
+    # 持仓模式与 OKX 行情由 sync_positions 在开始时等待，SDK 导入与连接预热、账户余额不等待
+    print("\n🔍 正在并行初始化（OKX SDK / 持仓模式 / 订单核对 / 账户余额 / 目标持仓 / 合约参数 / 行情）...")
+    steps_started = time.perf_counter()
+    background = {
+        "OKX SDK与连接": prepare_okx_clients,
+        "持仓模式": ensure_position_mode,
+        # 风控的初始权益（之后由 account 频道推送更新；模拟盘由盈亏快照读取余额时顺带更新）
+        "账户余额": account_state.get_account_balance,
+    }
+    if price_cache is not None:
+        # 一次请求取得全部合约的行情，首次同步不必逐个合约补价格
+        background["OKX行情"] = price_cache.seed_all
+    background_steps = start_startup_steps(background)
+    startup_prerequisites.update({name: background_steps[name] for name in ("持仓模式", "OKX行情")
+                                  if name in background_steps})
+    steps = {"订单核对": recover_orders}
+    if last_tick is None:
+        steps["目标持仓"] = lambda: fetch_user_positions(TARGET_USER_ADDRESS) or []
+    if paper_exchange is None:
+        steps["合约参数"] = load_instrument_metadata
+    results, errors, step_ms = run_startup_steps(steps)
+    steps_finished = time.perf_counter()
+    if "合约参数" in errors:
+        print(f"❌ 启动失败（合约参数）: {errors['合约参数']}，程序退出。")
+        exit()
+    if "订单核对" in errors:
+        print(f"  - ⚠️ 启动步骤「订单核对」失败，继续运行: {errors['订单核对']}")
+
+    # --- 首次同步 ---
+    first_sync_ms = 0.0
+    if last_tick is not None:
+        # 快速重启：以日志中的目标快照作为比较基准直接进入主循环；
+        # 本地持仓视图初始为"需要全量同步"，首轮循环拉取最新目标并与OKX真实持仓完成同步
+        tick_id, tick_ts, committed, initial_target_positions = last_tick
+        print(f"\n⚡ 快速重启：使用订单日志中 {time.time() - tick_ts:.0f} 秒前的目标快照（tick {tick_id}，"
+              f"{'已完成' if committed else '上次未完成'}，{len(initial_target_positions)} 个仓位）进入主循环，"
+              f"首轮循环获取最新目标并全量同步。")
+        last_known_simplified_positions = simplify_positions_for_comparison(initial_target_positions)
+        pnl_logger.log(note="机器人快速重启")
+    elif "目标持仓" in errors:
+        print(f"❌ 在启动阶段获取初始仓位失败，程序退出: {errors['目标持仓']}")
+        exit()
+    else:
+        initial_target_positions = results["目标持仓"]
         print(f"  - 成功获取初始状态，目标当前有 {len(initial_target_positions)} 个仓位。")
         if not initial_target_positions:
             print("  - 警告：获取到的目标仓位为空，请确认目标地址是否确实无持仓。")
-
         last_known_simplified_positions = simplify_positions_for_comparison(initial_target_positions)
-        
-        # 仅当目标真的有仓位时，才进行初次同步
-        if initial_target_positions:
-            sync_positions(initial_target_positions)
-        
-        log_pnl_snapshot(accountAPI, pnl_logger, note="机器人启动初始状态")
-        
-    except Exception as e:
-        print(f"❌ 在启动阶段获取初始仓位失败，程序退出: {e}")
-        traceback.print_exc()
-        exit()
+        try:
+            # 仅当目标真的有仓位时，才进行初次同步
+            if initial_target_positions:
+                sync_started = time.perf_counter()
+                sync_positions(initial_target_positions, reconciler=reconciler)
+                first_sync_ms = (time.perf_counter() - sync_started) * 1000
+        except Exception as e:
+            print(f"❌ 首次同步失败，程序退出: {e}")
+            traceback.print_exc()
+            exit()
+        pnl_logger.log(note="机器人启动初始状态")
+
+    # --- 启动用时 ---
+    total_ms = (time.perf_counter() - startup_started) * 1000
+    print(f"\n⏱️ 启动用时 {total_ms:.0f}ms（{'到进入主循环' if last_tick is not None else '到首次同步完成'}）:")
+    print(f"  - 导入与模块初始化: {(steps_started - startup_started) * 1000:.0f}ms")
+    print(f"  - 并行初始化: {(steps_finished - steps_started) * 1000:.0f}ms（"
+          + "，".join(f"{name} {ms:.0f}ms" for name, ms in sorted(step_ms.items(), key=lambda kv: -kv[1]))
+          + "；" + "、".join(background_steps) + " 在后台执行）")
+    print(f"  - 首次同步: {first_sync_ms:.0f}ms" if last_tick is None else "  - 首次同步: 在主循环第一轮进行")
+
+    # --- 首次同步之后再启动的后台任务 ---
+    instrument_registry.start_background_refresh()
+    latency_recorder.add_gauge_source(risk_engine.status)
+    start_keepalive(HTTP_KEEPALIVE_SECONDS)
+    latency_recorder.start_reporter(LATENCY_REPORT_SECONDS)
+    try:
+        latency_recorder.start_http_server(METRICS_PORT)
+        print(f"✅ 延迟指标: http://127.0.0.1:{METRICS_PORT}/metrics")
+    except OSError as e:
+        print(f"⚠️ 无法启动延迟指标接口 (端口 {METRICS_PORT}): {e}")
+
+    snapshot_recorder = SnapshotRecorder(SNAPSHOT_DIR) if SNAPSHOT_DIR else None
 
     # --- 启动主循环 ---
     print("\n🎉 跟单机器人启动成功！进入高频监控模式...")
     print("   每秒检查一次，检测到目标交易或自身仓位清空时会采取行动。")
     print("   提示: 在OKX手动清空所有仓位可自动停止本程序。")
     
+    kill_logged = False
+    # 主循环上一次处理的推送持仓簿版本：处理期间（例如同步下单时）到达的推送在下一次等待时立即唤醒
+    stream_version = 0
+    poller = AdaptivePoller(rate_budget, min_interval=POLL_MIN_INTERVAL_SECONDS,
+                            max_interval=POLL_MAX_INTERVAL_SECONDS, active_interval=POLL_INTERVAL_SECONDS,
+                            active_window=POLL_ACTIVE_WINDOW_SECONDS,
+                            poll_cost={"hl_info": HL_POLL_WEIGHT})
+    latency_recorder.add_gauge_source(poller.metrics)
+
     while True:
         try:
-            if check_self_positions_for_stop(accountAPI):
+            if background_steps is not None and all(f.done() for f in background_steps.values()):
+                _, background_errors, background_ms = collect_startup_steps(background_steps)
+                background_steps = None
+                print(f"\n⏱️ 后台初始化完成（" + "，".join(
+                    f"{name} {ms:.0f}ms" for name, ms in sorted(background_ms.items(), key=lambda kv: -kv[1])) + "）")
+                if "持仓模式" in background_errors:
+                    print(f"❌ 启动失败（持仓模式）: {background_errors['持仓模式']}，程序退出。")
+                    pnl_logger.log(note="持仓模式设置失败，机器人退出")
+                    break
+                for name, error in background_errors.items():
+                    print(f"  - ⚠️ 启动步骤「{name}」失败，继续运行: {error}")
+            # 拆单执行中（例如首次建仓）持仓可能暂时为空，不能据此判断停止；
+            # 持仓状态由账户推送维护（无推送时在全量同步时更新），这里不再每轮调用 REST。
+            # 首次全量同步完成之前也不判断：快速重启时（例如上次在首次同步中途崩溃、订单被核对为 not_found）
+            # 账户可能还是空的，要先按目标重新建仓
+            if reconciler.has_synced() and not scheduler.active_inst_ids() and risk_engine.is_flat():
                 print("\n\n🛑 停止信号：检测到您的OKX账户已无任何持仓。")
-                print("   机器人将自动停止运行...")
-                log_pnl_snapshot(accountAPI, pnl_logger, note="检测到仓位清空，机器人自动停止")
+                print("   机器人将自动停止运行...")
+                pnl_logger.log(note="检测到仓位清空，机器人自动停止")
                 break 
+            if risk_engine.killed and not kill_logged:
+                pnl_logger.log(note=f"风控熔断: {risk_engine.kill_reason}")
+                kill_logged = True
 
-            # 【重要改动】直接调用，不再传入infoAPI
-            current_target_positions = fetch_user_positions(TARGET_USER_ADDRESS) or []
+            if stream is not None and stream.is_live():
+                stream_version, current_target_positions = stream.versioned_snapshot()
+            else:
+                # 推送流未就绪或断线时，回退到 REST 轮询
+                poller.spend_poll()
+                current_target_positions = fetch_user_positions(TARGET_USER_ADDRESS) or []
+            if snapshot_recorder is not None:
+                snapshot_recorder.submit(TARGET_USER_ADDRESS, current_target_positions)
             current_simplified_positions = simplify_positions_for_comparison(current_target_positions)
+            target_changed = current_simplified_positions != last_known_simplified_positions
+            poller.observe(target_changed)
 
-            if current_simplified_positions != last_known_simplified_positions:
+            if target_changed:
+                trace_id = latency_recorder.begin_trace()
                 print("\n🔔 检测到目标仓位变化！正在执行跟单操作...")
-                sync_positions(current_target_positions)
+                sync_positions(current_target_positions, reconciler=reconciler, trace_id=trace_id)
                 print("\n🔍 正在记录跟单后的盈亏快照...")
-                log_pnl_snapshot(accountAPI, pnl_logger, note="检测到目标交易后同步")
+                pnl_logger.log(note="检测到目标交易后同步")
                 last_known_simplified_positions = current_simplified_positions
-                print("\n...返回高频监控模式...")
+                print(f"\n...返回高频监控模式（当前轮询间隔 {poller.interval:.1f} 秒）...")
+            elif reconciler.needs_full_resync():
+                # 目标无变化，但到了定期全量同步的时间（或上轮有订单失败），校正本地持仓视图
+                sync_positions(current_target_positions, reconciler=reconciler)
+            elif reconciler.pending_retry():
+                # 上一轮因价格过期跳过的合约，价格恢复后补上
+                sync_positions(current_target_positions, reconciler=reconciler)
+            elif risk_engine.reduce_only_reason:
+                # 缩放比例保护期间每轮都重新检查：新比例连续几轮保持不变即被确认，被拒绝的加仓随之补上
+                sync_positions(current_target_positions, reconciler=reconciler)
             else:
                 # 仓位无变化，静默等待
                 pass
 
-            time.sleep(10)
+            if stream is not None and stream.is_live():
+                # 推送模式下一有变化立即被唤醒，超时则做一次常规检查
+                stream.wait_for_change(timeout=poller.next_interval(rest_poll=False), since=stream_version)
+            else:
+                time.sleep(poller.next_interval())
 
         except KeyboardInterrupt:
             print("\n🛑 程序被手动中断 (Ctrl+C)，正在退出...")
-            log_pnl_snapshot(accountAPI, pnl_logger, note="机器人手动中断")
+            pnl_logger.log(note="机器人手动中断")
             break
         except Exception as e:
-            print(f"\n💥 主循环发生未知错误: {type(e).__name__} - {e}")
-            log_pnl_snapshot(accountAPI, pnl_logger, note=f"主循环发生错误: {e}")
-            if 'SSL' in str(e) or 'Connection' in str(e) or 'Max retries' in str(e):
-                print("   检测到网络/SSL错误，可能是临时问题。将等待较长时间后重试...")
-                time.sleep(60)
-            else:
+            kind, delay = poller.on_error(e)
+            print(f"\n💥 主循环发生错误 [{kind}]: {type(e).__name__} - {e}")
+            pnl_logger.log(note=f"主循环发生错误: {e}")
+            if kind == "unknown":
                 traceback.print_exc()
-                print("   发生未知类型错误，等待 30 秒后重试...")
-                time.sleep(30)
\ No newline at end of file
+            print(f"   连续第 {poller.consecutive_errors} 次出错，{delay:.1f} 秒后重试...")
+            time.sleep(delay)
+
+    # 写完队列中剩余的盈亏快照（自动停止与 Ctrl+C 两条退出路径都会走到这里），
+    # 在停止账户推送之前写完，最后几条快照仍能使用缓存
+    scheduler.close()
+    pnl_logger.close()
+    if stream is not None:
+        stream.stop()
+    account_state.stop()
+    if price_cache is not None:
+        price_cache.stop()
+    if snapshot_recorder is not None:
+        snapshot_recorder.close()
@@ -4,6 +4,7 @@ import json
 import os
 import okx.Account as Account
 import okx.MarketData as MarketData
+from clients import okx_api
 def display_positions_summary(api_response):
     """
     解析 accountAPI.get_positions() 的返回结果，并打印清晰的持仓总结。
@@ -66,7 +67,8 @@ def query_and_print_assets(api_key, secret_key, passphrase, flag, min_equity_thr
     """
     查询账户资产并打印非零项。返回原始 JSON 响应以便外部使用（赋值给 result）。
     """
-    accountAPI = Account.AccountAPI(api_key, secret_key, passphrase, False, flag)
+    # 复用共享的客户端和连接，而不是每次调用都新建 AccountAPI
+    accountAPI = okx_api(Account.AccountAPI, api_key, secret_key, passphrase, flag)
     json_response = accountAPI.get_account_balance()
 
     try: